@@ -18,8 +18,21 @@ class UserLogIn(BaseModel):
     username: str 
     password: str
 
+class RefreshTokenRequest(BaseModel):
+    refresh_token: str = Field(..., max_length=100)
+
 class UserDeleteAccount(BaseModel):
     password: str
 
+class UserSummary(BaseModel):
+    id: int
+    username: str
+
+class UserPage(BaseModel):
+    users: list[UserSummary]
+    next_cursor: int | None = Field(
+        None, description="Pass it as `cursor` to get the next page. Null on the last page."
+    )
+
 class HTTPError(BaseModel):   # Used by documentation
     detail: str
\ No newline at end of file
@@ -1,47 +1,173 @@
-from os import getenv
-from fastapi import FastAPI, Depends, status, Header, HTTPException
-from fastapi.responses import JSONResponse
-from api_models import UserSignUp, UserLogIn, UserDeleteAccount
-from dependencies import get_auth_manager, get_jwt_util, get_public_key
-from auth_manager import AuthManager
-from jwt_utils import JWTUtil
-from grpc_client import create_user, delete_user
-from docs_config import SIGNUP_DOC, LOGIN_DOC, DELETE_ACCOUNT_DOC, JWT_AUTH_HEADER
+import asyncio
+import importlib
+import json
+from math import ceil
+from os import getenv, getpid
+from pathlib import Path
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Depends, Request, Query, status, Header, HTTPException
+from fastapi.responses import JSONResponse, Response
+from prometheus_client import generate_latest, CONTENT_TYPE_LATEST
+from api_models import UserSignUp, UserLogIn, UserDeleteAccount, UserPage, UserSummary, RefreshTokenRequest
+from dependencies import get_auth_manager, get_jwt_util, get_public_key, get_user_repository, startup, shutdown
+from dependencies import get_hashing_executor, get_token_cache, key_store, verify_admin_token
+from dependencies import get_rate_limiter, get_client_ip, get_refresh_token_manager
+from hashing_executor import PasswordHashingExecutor, HashingQueueFullError
+from repository import UserRepository, RepositoryUnavailableError
+from auth_manager import AuthManager, DeletionResult
+from jwt_utils import JWTUtil, VerifiedTokenCache
+from rate_limiter import RateLimiter, RateLimitExceededError
+from refresh_tokens import RefreshTokenManager
+from metrics import InstrumentedRoute, MetricsMiddleware, registry as metrics_registry
+from docs_config import SIGNUP_DOC, LOGIN_DOC, REFRESH_DOC, DELETE_ACCOUNT_DOC, JWT_AUTH_HEADER, ADMIN_LIST_USERS_DOC
+
+
+# Written at build time by generate_openapi.py (see the Dockerfile).
+OPENAPI_FILE = Path(__file__).with_name("openapi.json")
+
+# Imported and started by start_provisioning(), once the app serves requests.
+grpc_client = None
+provisioning = None
+
+
+async def start_provisioning() -> None:
+    """
+    Open the gRPC channels to workout-core and start the outbox worker.
+
+    Nothing waits on them to answer a request (signups and deletions only add outbox
+    events), so the gRPC stack (grpclib, betterproto, the generated stubs) is imported in a
+    thread after startup instead of delaying the first request.
+    """
+    global grpc_client, provisioning
+    worker_module = await asyncio.to_thread(importlib.import_module, "provisioning_worker")
+    grpc_client = importlib.import_module("grpc_client")
+    await grpc_client.channel_manager.open()
+    worker_module.provisioning_worker.start()
+    provisioning = worker_module.provisioning_worker
+
+def notify_provisioning() -> None:
+    # Before start_provisioning() is done, the first run of the worker finds the events anyway.
+    if provisioning is not None:
+        provisioning.notify()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Long-lived resources (e.g. the database connection pool) live as long as the app.
+    await startup()
+    provisioning_start = asyncio.create_task(start_provisioning())
+    yield
+    provisioning_start.cancel()
+    await asyncio.gather(provisioning_start, return_exceptions=True)
+    if provisioning is not None:
+        await provisioning.stop()
+    if grpc_client is not None:
+        await grpc_client.close()
+    await shutdown()
 
 
 app = FastAPI(
     root_path=getenv("ROOT_PATH", ""),
     title="GymBunker Auth Service",
     description="Microservice for handling User Sign-up, Login (JWT), and Account Management.",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
+
+def openapi() -> dict:
+    """
+    The OpenAPI document of GET /openapi.json and /docs: the one written by
+    generate_openapi.py if it matches the routes of this version, else generated on first use.
+    """
+    if app.openapi_schema is None:
+        try:
+            schema = json.loads(OPENAPI_FILE.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            schema = None
+        documented = {route.path for route in app.routes if getattr(route, "include_in_schema", False)}
+        if schema is not None and schema.get("info", {}).get("version") == app.version \
+                and set(schema.get("paths", {})) == documented:
+            app.openapi_schema = schema
+        else:
+            app.openapi_schema = FastAPI.openapi(app)
+    return app.openapi_schema
+
+app.openapi = openapi
+
+# Per-stage latency histograms and response counters, exposed by GET /metrics (see metrics.py).
+app.router.route_class = InstrumentedRoute
+app.add_middleware(MetricsMiddleware)
+
+
+@app.exception_handler(RepositoryUnavailableError)
+async def repository_unavailable_handler(request: Request, exc: RepositoryUnavailableError):
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": "Service unavailable, try again later."},
+        headers={"Retry-After": "1"}
+    )
+
+@app.exception_handler(HashingQueueFullError)
+async def hashing_queue_full_handler(request: Request, exc: HashingQueueFullError):
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": "Service is overloaded, try again later."},
+        headers={"Retry-After": "1"}
+    )
+
+@app.exception_handler(RateLimitExceededError)
+async def rate_limit_exceeded_handler(request: Request, exc: RateLimitExceededError):
+    return JSONResponse(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        content={"detail": "Too many attempts, try again later."},
+        headers={"Retry-After": str(ceil(exc.retry_after))}
+    )
+
+
+@app.get('/stats', include_in_schema=False)
+async def stats(
+    repository: UserRepository = Depends(get_user_repository),
+    hashing_executor: PasswordHashingExecutor = Depends(get_hashing_executor),
+    token_cache: VerifiedTokenCache | None = Depends(get_token_cache),
+    rate_limiter: RateLimiter | None = Depends(get_rate_limiter)
+):
+    """
+    Runtime statistics of the service internals (e.g. database connection pool, gRPC channels),
+    for the worker process that served the request (see main.py).
+    """
+    return {
+        "pid": getpid(),
+        "repository": repository.stats(),
+        "grpc": grpc_client.stats() if grpc_client is not None else None,
+        "provisioning": provisioning.stats() if provisioning is not None else None,
+        "hashing": hashing_executor.stats(),
+        "keys": key_store.stats(),
+        "token_cache": token_cache.stats() if token_cache is not None else None,
+        "rate_limiter": rate_limiter.stats() if rate_limiter is not None else None,
+    }
+
+@app.get('/metrics', include_in_schema=False)
+async def metrics():
+    """
+    Prometheus metrics (see metrics.py).
+    """
+    return Response(generate_latest(metrics_registry()), media_type=CONTENT_TYPE_LATEST)
+
 @app.post('/signup', **SIGNUP_DOC)
 async def signup(
     user: UserSignUp,
     auth_manager: AuthManager = Depends(get_auth_manager),
 ):
-    is_username_taken = await auth_manager.username_exists(user.username)
-    if is_username_taken:
+    is_user_created = await auth_manager.create_user(user.username, user.password)
+    if not is_user_created:
         raise HTTPException(
             status_code=status.HTTP_409_CONFLICT,
             detail="Username already exists"
         )
 
-    await auth_manager.hash_password_and_store_user_in_database(
-        user.username, user.password
-    )
-    try:
-        await create_user(user.username)
-    except Exception as e:
-        import traceback
-        traceback.print_exc()
-        # Clean up the local DB so the user can try again later
-        await auth_manager.delete_user(user.username)
-        raise HTTPException(
-            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-            detail=f"Service unavailable: {e}" # <--- Add {e} temporarily to the response
-        )
+    # The user is created in workout-core in the background (see provisioning_worker.py).
+    notify_provisioning()
     return JSONResponse(
         status_code=status.HTTP_201_CREATED,
         content={
@@ -56,7 +182,13 @@ async def login(
     user: UserLogIn,
     auth_manager: AuthManager = Depends(get_auth_manager),
     jwt_util: JWTUtil = Depends(get_jwt_util),
+    rate_limiter: RateLimiter | None = Depends(get_rate_limiter),
+    client_ip: str | None = Depends(get_client_ip),
+    refresh_tokens: RefreshTokenManager = Depends(get_refresh_token_manager),
 ):
+    # Before any query or Argon2 work: throttled attempts cost next to nothing.
+    if rate_limiter is not None:
+        await rate_limiter.acquire(username=user.username, ip=client_ip)
 
     is_authenticated = await auth_manager.verify_password_and_update_its_hash_in_database_if_needed(
         user.username, user.password
@@ -69,6 +201,8 @@ async def login(
         )
 
     jwt_token = jwt_util.create_token(user.username)
+    # The next access tokens come from /refresh, without Argon2.
+    refresh_token = await refresh_tokens.issue(user.username)
 
     return JSONResponse(
         status_code=status.HTTP_200_OK,
@@ -76,6 +210,33 @@ async def login(
             "username": user.username,
             "message": "Login successful",
             "access_token": jwt_token,
+            "refresh_token": refresh_token,
+            "tokentype": "bearer"
+        }
+    )
+
+
+@app.post('/refresh', **REFRESH_DOC)
+async def refresh(
+    body: RefreshTokenRequest,
+    jwt_util: JWTUtil = Depends(get_jwt_util),
+    refresh_tokens: RefreshTokenManager = Depends(get_refresh_token_manager),
+):
+    rotation = await refresh_tokens.rotate(body.refresh_token)
+    if rotation is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Refresh token is invalid or expired."
+        )
+
+    username, refresh_token = rotation
+    return JSONResponse(
+        status_code=status.HTTP_200_OK,
+        content={
+            "username": username,
+            "message": "Token refreshed",
+            "access_token": jwt_util.create_token(username),
+            "refresh_token": refresh_token,
             "tokentype": "bearer"
         }
     )
@@ -87,7 +248,10 @@ async def delete_account(
     authorization: str = JWT_AUTH_HEADER,
     auth_manager: AuthManager = Depends(get_auth_manager),
     jwt_util: JWTUtil = Depends(get_jwt_util),
-    public_key: bytes = Depends(get_public_key)
+    public_key = Depends(get_public_key),
+    token_cache: VerifiedTokenCache | None = Depends(get_token_cache),
+    rate_limiter: RateLimiter | None = Depends(get_rate_limiter),
+    client_ip: str | None = Depends(get_client_ip),
 ):
 
     if not authorization or not authorization.startswith("Bearer "):
@@ -98,7 +262,7 @@ async def delete_account(
         )
 
     jwt_token = authorization.split(" ")[1]
-    token_data = jwt_util.verify_token(jwt_token, public_key)
+    token_data = jwt_util.verify_token(jwt_token, public_key, jwt_util.algorithm, cache=token_cache)
     if not token_data:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -106,33 +270,46 @@ async def delete_account(
             headers={"WWW-Authenticate": "Bearer"}
         )
     
-    if not await auth_manager.username_exists(token_data["username"]):
+    if rate_limiter is not None:
+        await rate_limiter.acquire(username=token_data["username"], ip=client_ip)
+
+    deletion = await auth_manager.delete_user_if_password_matches(
+        token_data["username"], user.password
+    )
+
+    if deletion == DeletionResult.USER_NOT_FOUND:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="User does not exist.",
             headers={"WWW-Authenticate": "Bearer"}
         )
 
-    valid_credentials = await auth_manager.verify_password_and_update_its_hash_in_database_if_needed(
-        token_data["username"], user.password
-    )
-
-    if not valid_credentials:
+    if deletion == DeletionResult.WRONG_PASSWORD:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect password.",
             headers={"WWW-Authenticate": "Bearer"}
         )
 
-    await auth_manager.delete_user(token_data["username"])
-    try:
-        await delete_user(token_data["username"])
-    except Exception as e:
-        # Doesnt raise an error here because the account is effectively deleted for the user.
-        pass
-        # ToDo: Logging? Queue for deletion later?
+    # Its refresh tokens were deleted with it (ON DELETE CASCADE): no new access token can be
+    # issued, and the ones already issued expire on their own.
+    # The workout data is deleted in the background, retried until workout-core confirms it.
+    notify_provisioning()
 
     return JSONResponse(
         status_code=status.HTTP_200_OK,
         content={"message": f"Account for user '{token_data['username']}' has been successfully deleted."}
-    )
\ No newline at end of file
+    )
+
+
+@app.get('/admin/users', response_model=UserPage, dependencies=[Depends(verify_admin_token)], **ADMIN_LIST_USERS_DOC)
+async def list_users(
+    cursor: int | None = Query(None, description="`next_cursor` of the previous page. Omit it for the first page."),
+    limit: int = Query(100, ge=1, le=1000),
+    repository: UserRepository = Depends(get_user_repository),
+):
+    users = await repository.get_page(cursor, limit)
+    return UserPage(
+        users=[UserSummary(id=user.id, username=user.username) for user in users],
+        next_cursor=users[-1].id if len(users) == limit else None
+    )
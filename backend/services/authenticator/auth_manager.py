@@ -1,14 +1,24 @@
 from repository import UserRepository
 from repository.user import User
+from hashing_executor import PasswordHashingExecutor
+from metrics import stage
+from tracing import tracer
 
-from argon2 import PasswordHasher
+from enum import Enum
 from argon2.exceptions import VerifyMismatchError
 
+class DeletionResult(Enum):
+    DELETED = "deleted"
+    USER_NOT_FOUND = "user_not_found"
+    WRONG_PASSWORD = "wrong_password"
+
+
 class AuthManager: 
 
-    def __init__(self, user_repository: UserRepository) -> None:
+    def __init__(self, user_repository: UserRepository, hashing_executor: PasswordHashingExecutor) -> None:
         self.__user_repository = user_repository
-        self.__hasher = PasswordHasher()
+        # Argon2 runs on the executor's threads, not on the event loop.
+        self.__hasher = hashing_executor
 
 
     async def username_exists(self, username: str) -> bool:
@@ -18,10 +28,19 @@ class AuthManager:
 
         return await self.__user_repository.check_if_username_already_exists(username)
     
-    # Maybe rename that function --> it is not precise --> why not "create_user" and some documentation?
-    async def hash_password_and_store_user_in_database(self, username: str, password: str) -> None:
-        hashed_password = self.__hash_password(password)
-        await self.__user_repository.add_user(username, hashed_password)
+    async def create_user(self, username: str, password: str) -> bool:
+        """
+            Hash the password and store the new user.
+
+            Returns False if the username already exists. Taken usernames are looked up
+            first, so repeated signups with one don't cost an Argon2 hash each; the insert
+            is still conditional, for two signups racing for a free one.
+        """
+
+        if await self.__user_repository.check_if_username_already_exists(username):
+            return False
+        hashed_password = await self.__hash_password(password)
+        return await self.__user_repository.add_user_if_absent(username, hashed_password) is not None
 
 
     async def verify_password_and_update_its_hash_in_database_if_needed(self, username: str, password: str) -> bool:
@@ -37,13 +56,14 @@ class AuthManager:
             return False
 
         try:    
-            self.__hasher.verify(user.password_hash, password)
+            await self.__verify(user.password_hash, password)
 
             password_needs_to_be_updated = self.__hasher.check_needs_rehash(user.password_hash)
             if password_needs_to_be_updated:
                 # Re-hash and update the database
-                new_hash = self.__hasher.hash(password)
-                await self.__user_repository.update_hash(username, new_hash)
+                with stage("rehash_and_update"), tracer.start_as_current_span("rehash_and_update"):
+                    new_hash = await self.__hash_password(password)
+                    await self.__user_repository.update_hash(username, new_hash)
             return True
         except VerifyMismatchError:
             return False
@@ -51,9 +71,49 @@ class AuthManager:
     async def delete_user(self, username: str):
         await self.__user_repository.delete(username)
 
-    def __hash_password(self, password: str) -> str:
+    async def delete_user_if_password_matches(self, username: str, password: str) -> DeletionResult:
+        """
+        Verify user's password and delete the user (two database round trips: fetch and delete).
+
+        The delete only succeeds if the stored hash is still the one that was verified, so a
+        concurrent hash update can't be overwritten; in that case it is verified once more.
+        """
+
+        for _ in range(2):
+            user: User = await self.__user_repository.get(username)
+            if user is None:
+                return DeletionResult.USER_NOT_FOUND
+
+            try:
+                await self.__verify(user.password_hash, password)
+            except VerifyMismatchError:
+                return DeletionResult.WRONG_PASSWORD
+
+            # No rehash here: the hash is about to be deleted anyway.
+            if await self.__user_repository.delete_if_hash_matches(username, user.password_hash):
+                return DeletionResult.DELETED
+
+        return DeletionResult.USER_NOT_FOUND
+
+    async def __hash_password(self, password: str) -> str:
         """
             Hash user's password
         """
 
-        return self.__hasher.hash(password)
\ No newline at end of file
+        with tracer.start_as_current_span("argon2.hash"):
+            return await self.__hasher.hash(password)
+
+    async def __verify(self, password_hash: str, password: str) -> None:
+        """
+            Raises VerifyMismatchError if the password is wrong.
+        """
+
+        with tracer.start_as_current_span(
+            "argon2.verify", record_exception=False, set_status_on_exception=False
+        ) as span:
+            try:
+                await self.__hasher.verify(password_hash, password)
+            except VerifyMismatchError:
+                span.set_attribute("auth.password_matches", False)
+                raise
+            span.set_attribute("auth.password_matches", True)
\ No newline at end of file
@@ -0,0 +1,225 @@
+"""
+Throughput and tail latency of /signup, /login, /refresh and /delete-account, driving auth_api.app
+in-process (no network, no uvicorn) with concurrent clients.
+
+The app is wired like tests/unit/test_auth_api.py: MockRepository instead of Postgres and a
+generated key pair. workout-core is not involved: the endpoints only queue the provisioning
+outbox events, and the provisioning worker is not started. Password hashing is real, so the
+numbers mostly measure Argon2 and the request handling around it.
+
+Each endpoint is measured in its own phase (all sign-ups, then all logins, then one
+refresh per session, then all deletions). Results are printed and can be saved as JSON; when a baseline is given, any
+endpoint whose requests/sec dropped, or whose p95/p99 grew, by more than --tolerance makes
+the run fail (exit code 1). Baselines depend on the machine: record them with
+--save-baseline on the machine that runs the comparison.
+
+Usage (from the authenticator folder):
+    python -m benchmarks.bench_auth_api [--users 100] [--concurrency 8] [--output results.json]
+    python -m benchmarks.bench_auth_api --baseline benchmarks/baselines/auth_api.json
+    python -m benchmarks.bench_auth_api --save-baseline benchmarks/baselines/auth_api.json
+"""
+import argparse
+import asyncio
+import json
+import platform
+import statistics
+import sys
+from datetime import datetime, timezone
+from os import cpu_count
+from time import perf_counter
+
+import httpx
+from cryptography.hazmat.primitives.serialization import load_pem_private_key, load_pem_public_key
+
+from auth_api import app
+from dependencies import get_user_repository, get_jwt_util, get_public_key, get_token_cache, get_hashing_executor
+from dependencies import get_rate_limiter
+from hashing_executor import PasswordHashingExecutor
+from jwt_utils import JWTUtil, VerifiedTokenCache
+from key_store import generate_key_pair
+from repository import MockRepository
+
+PASSWORD = "benchmark-password"
+
+
+def wire_app(concurrency: int, algorithm: str) -> PasswordHashingExecutor:
+    """
+    Same dependency overrides as the API unit tests. The hashing queue accepts every
+    concurrent request and login throttling is off (every request comes from one IP), so
+    the benchmark measures latency rather than load shedding.
+    """
+    private_pem, public_pem = generate_key_pair(algorithm)
+    jwt_util = JWTUtil(load_pem_private_key(private_pem, password=None), algorithm)
+    public_key = load_pem_public_key(public_pem)
+    repository = MockRepository()
+    token_cache = VerifiedTokenCache()
+    hashing_executor = PasswordHashingExecutor(max_queue_size=concurrency)
+
+    app.dependency_overrides[get_user_repository] = lambda: repository
+    app.dependency_overrides[get_jwt_util] = lambda: jwt_util
+    app.dependency_overrides[get_public_key] = lambda: public_key
+    app.dependency_overrides[get_token_cache] = lambda: token_cache
+    app.dependency_overrides[get_hashing_executor] = lambda: hashing_executor
+    app.dependency_overrides[get_rate_limiter] = lambda: None
+    return hashing_executor
+
+
+async def run_phase(client: httpx.AsyncClient, requests: list[dict], expected_status: int, concurrency: int,
+                    on_response=None) -> dict:
+    """
+    Send `requests` (httpx.request keyword arguments) with `concurrency` clients in parallel.
+    `on_response(request, response)` is called for each response, if given.
+    """
+    latencies: list[float] = []
+    errors = 0
+    queue = iter(requests)
+
+    async def worker():
+        nonlocal errors
+        for request in queue:
+            start = perf_counter()
+            response = await client.request(**request)
+            latencies.append(perf_counter() - start)
+            errors += response.status_code != expected_status
+            if on_response is not None:
+                on_response(request, response)
+
+    start = perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = perf_counter() - start
+
+    percentiles = statistics.quantiles(latencies, n=100, method="inclusive")
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "requests_per_second": round(len(latencies) / elapsed, 2),
+        "p50_ms": round(percentiles[49] * 1000, 2),
+        "p95_ms": round(percentiles[94] * 1000, 2),
+        "p99_ms": round(percentiles[98] * 1000, 2),
+    }
+
+
+async def run_benchmark(users: int, concurrency: int) -> dict:
+    usernames = [f"bench_user_{i}" for i in range(users)]
+    credentials = [{"username": username, "password": PASSWORD} for username in usernames]
+    results = {}
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        results["/signup"] = await run_phase(
+            client, [{"method": "POST", "url": "/signup", "json": body} for body in credentials], 201, concurrency
+        )
+
+        tokens = {}     # For the deletion phase.
+        refresh_tokens = {}
+        def keep_token(request, response):
+            tokens[request["json"]["username"]] = response.json()["access_token"]
+            refresh_tokens[request["json"]["username"]] = response.json()["refresh_token"]
+        results["/login"] = await run_phase(
+            client, [{"method": "POST", "url": "/login", "json": body} for body in credentials], 200, concurrency,
+            on_response=keep_token
+        )
+
+        results["/refresh"] = await run_phase(
+            client,
+            [{"method": "POST", "url": "/refresh", "json": {"refresh_token": refresh_tokens[username]}} for username in usernames],
+            200, concurrency
+        )
+
+        results["/delete-account"] = await run_phase(
+            client,
+            [
+                {
+                    "method": "POST", "url": "/delete-account", "json": {"password": PASSWORD},
+                    "headers": {"Authorization": f"Bearer {tokens[username]}"},
+                }
+                for username in usernames
+            ],
+            200, concurrency
+        )
+    return results
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    """
+    Returns one message per metric that regressed by more than `tolerance` (e.g. 0.2 = 20%),
+    and one per endpoint measured but missing from the baseline.
+    """
+    regressions = []
+    for setting in ("users", "concurrency", "algorithm"):
+        if results["meta"][setting] != baseline["meta"][setting]:
+            print(f"WARNING: {setting} is {results['meta'][setting]}, the baseline used {baseline['meta'][setting]}")
+    for endpoint, base in baseline["endpoints"].items():
+        current = results["endpoints"].get(endpoint)
+        if current is None:
+            regressions.append(f"{endpoint}: missing from the results")
+            continue
+        if current["requests_per_second"] < base["requests_per_second"] * (1 - tolerance):
+            regressions.append(
+                f"{endpoint}: {current['requests_per_second']} req/s, baseline {base['requests_per_second']} req/s"
+            )
+        for metric in ("p95_ms", "p99_ms"):
+            if current[metric] > base[metric] * (1 + tolerance):
+                regressions.append(f"{endpoint}: {metric} {current[metric]}, baseline {base[metric]}")
+        if current["errors"] > base["errors"]:
+            regressions.append(f"{endpoint}: {current['errors']} errors, baseline {base['errors']}")
+    for endpoint in results["endpoints"].keys() - baseline["endpoints"].keys():
+        # Nothing to compare it with: its regressions would go unnoticed.
+        regressions.append(f"{endpoint}: missing from the baseline, record it again with --save-baseline")
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=100, help="Users signed up, logged in and deleted.")
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent clients.")
+    parser.add_argument("--algorithm", default="RS256", help="JWT signing algorithm.")
+    parser.add_argument("--output", help="Write the results to this JSON file.")
+    parser.add_argument("--baseline", help="Fail if the results regressed compared to this JSON file.")
+    parser.add_argument("--save-baseline", help="Write the results to this JSON file, as the new baseline.")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed regression (0.2 = 20%%).")
+    args = parser.parse_args()
+
+    hashing_executor = wire_app(args.concurrency, args.algorithm)
+    try:
+        endpoints = asyncio.run(run_benchmark(args.users, args.concurrency))
+    finally:
+        hashing_executor.shutdown()
+        app.dependency_overrides.clear()
+
+    results = {
+        "meta": {
+            "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "cpu_count": cpu_count(),
+            "users": args.users,
+            "concurrency": args.concurrency,
+            "algorithm": args.algorithm,
+        },
+        "endpoints": endpoints,
+    }
+
+    print(f"{'endpoint':<16} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7}")
+    for endpoint, r in endpoints.items():
+        print(f"{endpoint:<16} {r['requests_per_second']:>8} {r['p50_ms']:>8} {r['p95_ms']:>8} {r['p99_ms']:>8} {r['errors']:>7}")
+
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(results, f, indent=2)
+                f.write("\n")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print(f"\nREGRESSION (more than {args.tolerance:.0%} worse than {args.baseline}):", file=sys.stderr)
+            for regression in regressions:
+                print(f"  {regression}", file=sys.stderr)
+            sys.exit(1)
+        print(f"\nNo regression compared to {args.baseline}.")
+
+
+if __name__ == "__main__":
+    main()
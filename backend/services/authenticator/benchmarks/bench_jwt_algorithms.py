@@ -0,0 +1,54 @@
+"""
+Tokens/sec of JWTUtil.create_token and JWTUtil.verify_token for each supported algorithm,
+measured on this machine.
+
+Usage (from the authenticator folder):
+    python -m benchmarks.bench_jwt_algorithms [--seconds 2]
+"""
+import argparse
+from time import perf_counter
+
+from cryptography.hazmat.primitives.serialization import load_pem_private_key, load_pem_public_key
+
+from jwt_utils import JWTUtil
+from key_store import generate_key_pair
+
+# (label, algorithm, RSA key size)
+CANDIDATES = [
+    ("RS256 (RSA-2048)", "RS256", 2048),
+    ("RS256 (RSA-4096)", "RS256", 4096),
+    ("ES256 (P-256)", "ES256", None),
+    ("EdDSA (Ed25519)", "EdDSA", None),
+]
+
+
+def operations_per_second(operation, seconds: float) -> float:
+    operation()     # Warm up
+    count = 0
+    start = perf_counter()
+    while (elapsed := perf_counter() - start) < seconds:
+        operation()
+        count += 1
+    return count / elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=2.0, help="Duration of each measurement.")
+    args = parser.parse_args()
+
+    print(f"{'algorithm':<18} {'create/s':>10} {'verify/s':>10} {'token bytes':>12}")
+    for label, algorithm, key_size in CANDIDATES:
+        private_pem, public_pem = generate_key_pair(algorithm, key_size or 2048)
+        jwt_util = JWTUtil(load_pem_private_key(private_pem, password=None), algorithm)
+        public_key = load_pem_public_key(public_pem)
+        token = jwt_util.create_token("JohnDoe")
+        assert JWTUtil.verify_token(token, public_key, algorithm) is not None
+
+        create_rate = operations_per_second(lambda: jwt_util.create_token("JohnDoe"), args.seconds)
+        verify_rate = operations_per_second(lambda: JWTUtil.verify_token(token, public_key, algorithm), args.seconds)
+        print(f"{label:<18} {create_rate:>10.0f} {verify_rate:>10.0f} {len(token):>12}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+"""
+Microbenchmarks of the primitives on the request path, each measured on its own so a
+slower endpoint can be traced back to the primitive that got slower:
+
+    argon2.*         PasswordHasher.hash / verify with the configured parameters ("current",
+                     see dependencies.hashing_executor) and candidate parameters, and
+                     check_needs_rehash
+    jwt.*            JWTUtil.create_token / verify_token for each supported algorithm
+    pydantic.*       validation of the UserSignUp and UserLogIn request bodies
+
+For each one: operations/sec, Python allocations per operation (tracemalloc, measured in a
+separate pass so tracing doesn't slow the timing) and the peak RSS of the process. Every
+benchmark runs in a fresh process, so the peak RSS is its own (Argon2 memory is allocated
+in C and is only visible there).
+
+Usage (from the authenticator folder):
+    python -m benchmarks.bench_primitives [--filter argon2] [--seconds 2] [--output results.json]
+"""
+import argparse
+import json
+import multiprocessing
+import resource
+import sys
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from time import perf_counter
+
+from argon2 import PasswordHasher
+
+# (label, time_cost, memory_cost in KiB, parallelism). "current" is the configured hasher;
+# rfc9106-low-memory is also argon2-cffi's default.
+ARGON2_CANDIDATES = [
+    ("rfc9106-low-memory", 3, 64 * 1024, 4),
+    ("owasp-19MiB", 2, 19 * 1024, 1),
+    ("owasp-46MiB", 1, 46 * 1024, 1),
+]
+
+
+def argon2_hasher(label: str) -> PasswordHasher:
+    if label == "current":
+        from dependencies import hashing_executor
+        return hashing_executor.hasher
+    _, time_cost, memory_cost, parallelism = next(c for c in ARGON2_CANDIDATES if c[0] == label)
+    return PasswordHasher(time_cost=time_cost, memory_cost=memory_cost, parallelism=parallelism)
+
+def setup_argon2_hash(label: str):
+    hasher = argon2_hasher(label)
+    return lambda: hasher.hash("correct horse battery staple")
+
+def setup_argon2_verify(label: str):
+    hasher = argon2_hasher(label)
+    password_hash = hasher.hash("correct horse battery staple")
+    return lambda: hasher.verify(password_hash, "correct horse battery staple")
+
+def setup_argon2_check_needs_rehash(label: str):
+    hasher = argon2_hasher(label)
+    password_hash = PasswordHasher(time_cost=2, memory_cost=19 * 1024, parallelism=1).hash("password")
+    return lambda: hasher.check_needs_rehash(password_hash)
+
+
+def jwt_util_and_public_key(algorithm: str):
+    from cryptography.hazmat.primitives.serialization import load_pem_private_key, load_pem_public_key
+    from jwt_utils import JWTUtil
+    from key_store import generate_key_pair
+
+    private_pem, public_pem = generate_key_pair(algorithm)
+    return JWTUtil(load_pem_private_key(private_pem, password=None), algorithm), load_pem_public_key(public_pem)
+
+def setup_jwt_create(algorithm: str):
+    jwt_util, _ = jwt_util_and_public_key(algorithm)
+    return lambda: jwt_util.create_token("JohnDoe")
+
+def setup_jwt_verify(algorithm: str):
+    jwt_util, public_key = jwt_util_and_public_key(algorithm)
+    token = jwt_util.create_token("JohnDoe")
+    return lambda: jwt_util.verify_token(token, public_key, algorithm)
+
+
+def setup_pydantic(model_name: str):
+    import api_models
+
+    model = getattr(api_models, model_name)
+    body = {"username": "JohnDoe_42", "password": "correct horse battery staple"}
+    return lambda: model.model_validate(body)
+
+
+BENCHMARKS = {
+    **{
+        f"argon2.{operation}[{label}]": (setup, label)
+        for label in ["current"] + [c[0] for c in ARGON2_CANDIDATES]
+        for operation, setup in (("hash", setup_argon2_hash), ("verify", setup_argon2_verify))
+    },
+    "argon2.check_needs_rehash[current]": (setup_argon2_check_needs_rehash, "current"),
+    **{
+        f"jwt.{operation}[{algorithm}]": (setup, algorithm)
+        for algorithm in ("RS256", "ES256", "EdDSA")
+        for operation, setup in (("create_token", setup_jwt_create), ("verify_token", setup_jwt_verify))
+    },
+    "pydantic.validate[UserSignUp]": (setup_pydantic, "UserSignUp"),
+    "pydantic.validate[UserLogIn]": (setup_pydantic, "UserLogIn"),
+}
+
+
+def run_benchmark(name: str, seconds: float) -> dict:
+    """
+    Runs in its own process (see main()).
+    """
+    setup, argument = BENCHMARKS[name]
+    operation = setup(argument)
+    operation()     # Warm up
+
+    count = 0
+    start = perf_counter()
+    while (elapsed := perf_counter() - start) < seconds:
+        operation()
+        count += 1
+
+    # Allocations, in a separate pass: tracing slows everything down.
+    samples = max(1, min(count, 50))
+    ignore_tracemalloc = [tracemalloc.Filter(False, tracemalloc.__file__)]
+    tracemalloc.start()
+    allocated_blocks = 0
+    peak_bytes = 0
+    for _ in range(samples):
+        before = tracemalloc.take_snapshot().filter_traces(ignore_tracemalloc)
+        tracemalloc.reset_peak()
+        current_before, _ = tracemalloc.get_traced_memory()
+        operation()
+        _, peak = tracemalloc.get_traced_memory()
+        after = tracemalloc.take_snapshot().filter_traces(ignore_tracemalloc)
+        allocated_blocks += sum(max(0, stat.count_diff) for stat in after.compare_to(before, "lineno"))
+        peak_bytes = max(peak_bytes, peak - current_before)
+    tracemalloc.stop()
+
+    # ru_maxrss is in KiB on Linux, in bytes on macOS.
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return {
+        "ops_per_second": round(count / elapsed, 2),
+        "retained_blocks_per_op": round(allocated_blocks / samples, 1),
+        "alloc_peak_bytes_per_op": peak_bytes,
+        "peak_rss_mib": round(max_rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=2.0, help="Duration of each measurement.")
+    parser.add_argument("--filter", default="", help="Only run the benchmarks whose name contains this.")
+    parser.add_argument("--output", help="Write the results to this JSON file.")
+    args = parser.parse_args()
+
+    names = [name for name in BENCHMARKS if args.filter in name]
+    results = {}
+    print(f"{'benchmark':<36} {'ops/s':>10} {'blocks/op':>10} {'peak alloc B':>13} {'peak RSS MiB':>13}")
+    # One process per benchmark (max_tasks_per_child=1), so each peak RSS is its own.
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=1, mp_context=context, max_tasks_per_child=1) as pool:
+        for name in names:
+            r = results[name] = pool.submit(run_benchmark, name, args.seconds).result()
+            print(f"{name:<36} {r['ops_per_second']:>10} {r['retained_blocks_per_op']:>10} "
+                  f"{r['alloc_peak_bytes_per_op']:>13} {r['peak_rss_mib']:>13}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+            f.write("\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""
+Latency of the repository queries against the database of the POSTGRES_* variables, on a
+pool of one connection so every call reuses the same session:
+
+    per query       get, check_if_username_already_exists and a failed
+                    rotate_refresh_token (two statements), with the statements
+                    prepared never (prepare_threshold off), after 5 executions
+                    (psycopg's default) or from the first one (the service's
+                    default), with and without the health check on checkout.
+                    "first" is the median of the first 5 calls on a new
+                    connection, "steady" the median of the later ones.
+    pipeline        export_users / import_users of a batch (one round trip,
+                    pipeline mode) against the same users one call at a time.
+
+The benchmark users (bench_query_*) are added if missing and left in the database.
+
+Usage (from the authenticator folder):
+    python -m benchmarks.bench_repository_queries [--calls 500] [--batch 100] [--output results.json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+from time import perf_counter
+
+from dependencies import db_variables
+from repository import PostgresqlUserRepository
+from repository.connection_pool import PoolSettings
+
+FIRST_CALLS = 5     # psycopg's default prepare_threshold
+PREPARE_THRESHOLDS = [("off", None), ("5", 5), ("0", 0)]
+
+
+def repository(prepare_threshold: int | None = 0, check_on_checkout: bool = True) -> PostgresqlUserRepository:
+    settings = PoolSettings(
+        min_size=1, max_size=1, check_on_checkout=check_on_checkout, prepare_threshold=prepare_threshold
+    )
+    return PostgresqlUserRepository(
+        db_variables["POSTGRES_DB"], db_variables["POSTGRES_USER"], db_variables["POSTGRES_PASSWORD"],
+        db_variables["POSTGRES_HOST"], db_variables["POSTGRES_PORT"], settings
+    )
+
+def usernames(count: int) -> list[str]:
+    return [f"bench_query_{i}" for i in range(count)]
+
+
+async def seed(count: int) -> None:
+    repo = repository()
+    await repo.open()
+    try:
+        for username in usernames(count):
+            await repo.add_user_if_absent(username, "$argon2id$v=19$m=65536,t=3,p=4$bench$bench")
+    finally:
+        await repo.close()
+
+
+async def time_calls(call, calls: int) -> list[float]:
+    timings = []
+    for i in range(calls):
+        start = perf_counter()
+        await call(i)
+        timings.append(perf_counter() - start)
+    return timings
+
+async def per_query(prepare_threshold: int | None, check_on_checkout: bool, calls: int) -> dict[str, dict]:
+    queries = {
+        "get": lambda repo, i: repo.get(f"bench_query_{i % 10}"),
+        "check_if_username_already_exists": lambda repo, i: repo.check_if_username_already_exists(f"bench_query_{i % 10}"),
+        "rotate_refresh_token (unknown)": lambda repo, i: repo.rotate_refresh_token(os.urandom(32), os.urandom(32), 60, 0),
+    }
+    results = {}
+    for name, query in queries.items():
+        # A new connection per query, so "first" really is the first executions of its statements.
+        repo = repository(prepare_threshold, check_on_checkout)
+        await repo.open()
+        try:
+            timings = await time_calls(lambda i: query(repo, i), calls)
+        finally:
+            await repo.close()
+        results[name] = {
+            "first_ms": statistics.median(timings[:FIRST_CALLS]) * 1000,
+            "steady_ms": statistics.median(timings[FIRST_CALLS:]) * 1000,
+        }
+    return results
+
+
+async def pipeline(batch: int, rounds: int) -> dict[str, float]:
+    repo = repository()
+    await repo.open()
+    try:
+        names = usernames(batch)
+        exports = await repo.export_users(names)
+
+        async def export_one_by_one():
+            for name in names:
+                await repo.export_users([name])
+
+        async def import_one_by_one():
+            for export in exports:
+                await repo.import_users([export])
+
+        timings = {}
+        for label, call in (
+            ("export_users, one call per user", export_one_by_one),
+            (f"export_users, {batch} per call", lambda: repo.export_users(names)),
+            ("import_users, one call per user", import_one_by_one),
+            (f"import_users, {batch} per call", lambda: repo.import_users(exports)),
+        ):
+            samples = await time_calls(lambda _: call(), rounds)
+            timings[label] = statistics.median(samples) / batch * 1000
+        return timings
+    finally:
+        await repo.close()
+
+
+async def main_async(args) -> dict:
+    await seed(max(args.batch, 10))
+    results = {"per_query": {}, "pipeline_ms_per_user": await pipeline(args.batch, args.rounds)}
+    for check_on_checkout in (True, False):
+        for label, threshold in PREPARE_THRESHOLDS:
+            config = f"prepare_threshold={label}, check={'on' if check_on_checkout else 'off'}"
+            results["per_query"][config] = await per_query(threshold, check_on_checkout, args.calls)
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=500, help="Calls per query and configuration.")
+    parser.add_argument("--batch", type=int, default=100, help="Users per export_users / import_users call.")
+    parser.add_argument("--rounds", type=int, default=10, help="Repetitions of each pipeline measurement.")
+    parser.add_argument("--output", help="Write the results to this JSON file.")
+    args = parser.parse_args()
+    if not db_variables["POSTGRES_HOST"]:
+        raise SystemExit("ERROR: Set the POSTGRES_* variables of the database to benchmark")
+
+    results = asyncio.run(main_async(args))
+
+    print(f"{'query':<34} {'configuration':<36} {'first ms':>9} {'steady ms':>10}")
+    for config, queries in results["per_query"].items():
+        for name, timings in queries.items():
+            print(f"{name:<34} {config:<36} {timings['first_ms']:>9.3f} {timings['steady_ms']:>10.3f}")
+    print()
+    print(f"{'batch operation':<44} {'ms per user':>12}")
+    for label, ms in results["pipeline_ms_per_user"].items():
+        print(f"{label:<44} {ms:>12.3f}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+            f.write("\n")
+
+
+if __name__ == "__main__":
+    main()
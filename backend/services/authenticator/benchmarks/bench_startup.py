@@ -0,0 +1,139 @@
+"""
+Cold start of the service, as seen by autoscaling: each run starts a fresh interpreter.
+
+    imports             `python -X importtime -c "import auth_api"`: cumulative import time of
+                        each module of this service and of each third-party package
+    first request       `python main.py` (one worker), from the process start to the first
+                        answered request (GET /stats), then the latency of the first
+                        GET /openapi.json and of the first POST /login
+
+The service runs with a generated key pair. Without the POSTGRES_* variables of a
+reachable database, the first /login measures the unavailable-database path instead (503).
+
+Usage (from the authenticator folder):
+    python -m benchmarks.bench_startup [--runs 5] [--top 15] [--output results.json]
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from pathlib import Path
+from time import perf_counter
+
+import httpx
+
+from key_store import generate_key_pair
+
+SERVICE_DIR = Path(__file__).resolve().parents[1]
+SERVICE_MODULES = {path.stem for path in SERVICE_DIR.glob("*.py")} | {"repository", "proto"}
+
+
+def import_times() -> dict[str, float]:
+    """
+    Cumulative import time (seconds) of each module of this service and of each
+    third-party top-level package, in a fresh interpreter.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import auth_api"],
+        cwd=SERVICE_DIR, capture_output=True, text=True, check=True
+    )
+    times: dict[str, float] = defaultdict(float)
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        name = name.strip()
+        package = name.split(".")[0]
+        if package in SERVICE_MODULES:
+            times[name] = max(times[name], int(cumulative) / 1e6)
+        elif depth <= 3:
+            # Counted once, where the package is first imported.
+            times[f"[{package}]"] = max(times[f"[{package}]"], int(cumulative) / 1e6)
+    return dict(times)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def first_request(key_dir: str) -> dict[str, float]:
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    env = {
+        **os.environ,
+        "AUTH_HOST": "127.0.0.1", "AUTH_PORT": str(port), "AUTH_WORKERS": "1",
+        "PRIVATE_KEY_PATH": os.path.join(key_dir, "key"), "PUBLIC_KEY_PATH": os.path.join(key_dir, "key.pub"),
+        "JWT_ALGORITHM": "ES256", "POSTGRES_POOL_TIMEOUT": "1",
+    }
+    start = perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "main.py"], cwd=SERVICE_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        with httpx.Client(base_url=base_url, timeout=10) as client:
+            while True:
+                try:
+                    client.get("/stats")
+                    break
+                except httpx.TransportError:
+                    if server.poll() is not None or perf_counter() - start > 60:
+                        raise RuntimeError("The service did not start")
+                    time.sleep(0.005)
+            ready = perf_counter() - start
+
+            timings = {"time_to_first_request": ready}
+            for name, method, url, body in (
+                ("first_openapi", "GET", "/openapi.json", None),
+                ("first_login", "POST", "/login", {"username": "bench_user", "password": "bench-password"}),
+            ):
+                request_start = perf_counter()
+                client.request(method, url, json=body)
+                timings[name] = perf_counter() - request_start
+            return timings
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+
+def median_ms(samples: list[dict[str, float]]) -> dict[str, float]:
+    keys = {key for sample in samples for key in sample}
+    return {key: round(statistics.median(s.get(key, 0.0) for s in samples) * 1000, 1) for key in keys}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="Fresh processes per measurement (medians are reported).")
+    parser.add_argument("--top", type=int, default=15, help="Modules shown in the import table.")
+    parser.add_argument("--output", help="Write the results to this JSON file.")
+    args = parser.parse_args()
+
+    imports = median_ms([import_times() for _ in range(args.runs)])
+    with tempfile.TemporaryDirectory() as key_dir:
+        private_pem, public_pem = generate_key_pair("ES256")
+        Path(key_dir, "key").write_bytes(private_pem)
+        Path(key_dir, "key.pub").write_bytes(public_pem)
+        startup = median_ms([first_request(key_dir) for _ in range(args.runs)])
+
+    print(f"{'module (cumulative import)':<36} {'ms':>8}")
+    for module, ms in sorted(imports.items(), key=lambda item: -item[1])[:args.top]:
+        print(f"{module:<36} {ms:>8}")
+    print()
+    for name in ("time_to_first_request", "first_openapi", "first_login"):
+        print(f"{name:<36} {startup[name]:>8}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"imports_ms": imports, "startup_ms": startup}, f, indent=2)
+            f.write("\n")
+
+
+if __name__ == "__main__":
+    main()
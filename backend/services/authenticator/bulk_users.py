@@ -0,0 +1,219 @@
+"""
+Bulk import and export of users, for onboarding many users at once (e.g. a whole gym chain).
+
+Usage (from this folder, with the same environment variables as the service):
+    python bulk_users.py import users.csv
+    python bulk_users.py export users.jsonl
+
+Import files are CSV (with a header) or JSONL, with a `username` and either a plain
+`password` (hashed here) or an already computed Argon2 `password_hash` (e.g. from an export).
+Passwords are hashed on every core and rows are loaded with COPY. Each new user gets a
+'create' event in user_provisioning_outbox in the same statement, as on /signup: the
+provisioning worker of the running service creates them in workout-core (see
+provisioning_worker.py), even if the import is interrupted. Usernames that already exist are
+skipped; rows with an invalid username, password or hash are counted as invalid.
+
+With POSTGRES_SHARDS, each user is loaded into the shard of its username and exports
+read every shard, with the ids seen by the service. Imports are refused while
+POSTGRES_SHARDS_PREVIOUS is set (run reshard.py first): a username could exist on its
+previous shard.
+
+Exports contain the password hashes: treat the file as a secret.
+"""
+import argparse
+import asyncio
+import csv
+import itertools
+import json
+import sys
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import AsyncExitStack
+from os import cpu_count
+from time import perf_counter
+
+import psycopg
+from argon2 import PasswordHasher, extract_parameters
+from argon2.exceptions import InvalidHashError
+from pydantic import ValidationError
+
+from api_models import UserSignUp
+from dependencies import POSTGRES_SHARDS, POSTGRES_SHARDS_PREVIOUS, hashing_executor, postgres_conn_details
+from repository import MAX_SHARDS, HashRing
+
+MAX_HASH_LENGTH = 200    # users.password_hash (postgres/init.sql)
+
+_worker_hasher: PasswordHasher | None = None
+
+def _init_hashing_worker(hasher: PasswordHasher) -> None:
+    global _worker_hasher
+    _worker_hasher = hasher
+
+def _hash_password(password: str) -> str:
+    return _worker_hasher.hash(password)
+
+
+def read_rows(path: str, file_format: str):
+    """
+    Yields one dict per user, without loading the whole file.
+    """
+    with open(path, newline="", encoding="utf-8") as f:
+        if file_format == "csv":
+            yield from csv.DictReader(f)
+        else:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def validate_row(row: dict) -> tuple[str, str | None, str | None] | None:
+    """
+    Returns (username, password, password_hash), or None if the row is invalid.
+    """
+    username = row.get("username")
+    password = row.get("password")
+    password_hash = row.get("password_hash")
+    try:
+        if password_hash:
+            # Same username rules as /signup, any placeholder password. A hash that doesn't
+            # fit the column would abort the COPY of its whole batch.
+            UserSignUp(username=username, password="placeholder")
+            if not isinstance(password_hash, str) or len(password_hash) > MAX_HASH_LENGTH:
+                return None
+            extract_parameters(password_hash)   # Raises unless it is an Argon2 hash
+            return username, None, password_hash
+        UserSignUp(username=username, password=password)
+        return username, password, None
+    except (ValidationError, InvalidHashError):
+        return None
+
+
+async def connect(stack: AsyncExitStack) -> dict[str, psycopg.AsyncConnection]:
+    """
+    One connection per shard of POSTGRES_SHARDS, in their order, or a single one to
+    POSTGRES_HOST (named "").
+    """
+    connections = {}
+    for name, address in (POSTGRES_SHARDS or {"": None}).items():
+        connections[name] = await stack.enter_async_context(
+            await psycopg.AsyncConnection.connect(**postgres_conn_details(address), autocommit=True)
+        )
+    return connections
+
+def by_shard(usernames: list[str]) -> dict[str, list[str]]:
+    """
+    Groups the usernames by the shard they belong to (all under "" without POSTGRES_SHARDS).
+    """
+    ring = HashRing(list(POSTGRES_SHARDS)) if POSTGRES_SHARDS else None
+    groups = defaultdict(list)
+    for username in usernames:
+        groups[ring.shard_for(username) if ring else ""].append(username)
+    return groups
+
+
+async def load_batch(conn: psycopg.AsyncConnection, rows: list[tuple[str, str]]) -> list[str]:
+    """
+    COPY the rows into a staging table and move the new usernames into users, with their
+    outbox events. Returns the usernames that were inserted (the others already existed).
+    """
+    async with conn.cursor() as cursor:
+        async with conn.transaction():
+            await cursor.execute(
+                "CREATE TEMP TABLE IF NOT EXISTS users_import "
+                "(username VARCHAR(50), password_hash VARCHAR(200)) ON COMMIT DELETE ROWS"
+            )
+            async with cursor.copy("COPY users_import (username, password_hash) FROM STDIN") as copy:
+                for row in rows:
+                    await copy.write_row(row)
+            await cursor.execute(
+                "WITH new_users AS ("
+                "    INSERT INTO users (username, password_hash) "
+                "    SELECT DISTINCT ON (username) username, password_hash FROM users_import "
+                "    ON CONFLICT (username) DO NOTHING RETURNING username"
+                "), events AS ("
+                "    INSERT INTO user_provisioning_outbox (username, operation) "
+                "    SELECT username, 'create' FROM new_users"
+                ") "
+                "SELECT username FROM new_users"
+            )
+            return [row[0] for row in await cursor.fetchall()]
+
+
+async def import_users(args) -> None:
+    if POSTGRES_SHARDS_PREVIOUS:
+        sys.exit("ERROR: POSTGRES_SHARDS_PREVIOUS is set: finish the resharding (reshard.py) before importing")
+    counters = {"read": 0, "invalid": 0, "already_exist": 0, "imported": 0}
+    start = perf_counter()
+    rows = read_rows(args.file, args.format)
+
+    with ProcessPoolExecutor(
+        max_workers=args.workers, initializer=_init_hashing_worker, initargs=(hashing_executor.hasher,)
+    ) as pool:
+        async with AsyncExitStack() as stack:
+            connections = await connect(stack)
+            while batch := list(itertools.islice(rows, args.batch_size)):
+                counters["read"] += len(batch)
+                valid = [row for row in map(validate_row, batch) if row is not None]
+                counters["invalid"] += len(batch) - len(valid)
+
+                to_hash = [password for _, password, password_hash in valid if password_hash is None]
+                hashes = iter(pool.map(_hash_password, to_hash, chunksize=max(1, len(to_hash) // (args.workers * 4))))
+                loaded = [
+                    (username, password_hash or next(hashes)) for username, _, password_hash in valid
+                ]
+
+                hashes = dict(loaded)
+                inserted = []
+                for shard, usernames in by_shard([username for username, _ in loaded]).items():
+                    inserted += await load_batch(
+                        connections[shard], [(username, hashes[username]) for username in usernames]
+                    )
+                counters["already_exist"] += len(loaded) - len(inserted)
+                counters["imported"] += len(inserted)
+
+                print(f"{counters['read']} rows read, {counters['imported']} imported", file=sys.stderr)
+
+    print(json.dumps({**counters, "seconds": round(perf_counter() - start, 1)}))
+
+
+async def export_users(args) -> None:
+    start = perf_counter()
+    exported = 0
+    query = "COPY (SELECT id, username, password_hash FROM users ORDER BY id) TO STDOUT"
+
+    async with AsyncExitStack() as stack:
+        connections = await connect(stack)
+        with open(args.file, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            if args.format == "csv":
+                writer.writerow(["id", "username", "password_hash"])
+            for index, conn in enumerate(connections.values()):
+                async with conn.cursor() as cursor, cursor.copy(query) as copy:
+                    copy.set_types(["int4", "text", "text"])
+                    async for user_id, username, password_hash in copy.rows():
+                        if POSTGRES_SHARDS:
+                            user_id = user_id * MAX_SHARDS + index     # As ShardedUserRepository numbers them
+                        if args.format == "csv":
+                            writer.writerow([user_id, username, password_hash])
+                        else:
+                            f.write(json.dumps({"id": user_id, "username": username, "password_hash": password_hash}) + "\n")
+                        exported += 1
+
+    print(json.dumps({"exported": exported, "seconds": round(perf_counter() - start, 1)}))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["import", "export"])
+    parser.add_argument("file")
+    parser.add_argument("--format", choices=["csv", "jsonl"], help="Default: from the file extension.")
+    parser.add_argument("--batch-size", type=int, default=5000, help="Rows hashed and loaded per COPY.")
+    parser.add_argument("--workers", type=int, default=cpu_count() or 1, help="Hashing processes.")
+    args = parser.parse_args()
+    args.format = args.format or ("jsonl" if args.file.endswith((".jsonl", ".json")) else "csv")
+
+    asyncio.run(import_users(args) if args.command == "import" else export_users(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+"""
+Pick the Argon2 parameters for the machine this runs on.
+
+Hashes are measured the way the service runs them: `concurrency` hashes at once (one per
+hashing thread, see hashing_executor.py), so memory bandwidth contention is included. The
+parameters are chosen in this order:
+
+    parallelism     the cores left to each concurrent hash (1 when every core has a hash)
+    memory_cost     the memory budget split between the concurrent hashes, halved until
+                    one pass fits the target latency (never below 19 MiB)
+    time_cost       as many passes as fit the target latency (at least 2 below 46 MiB)
+
+The memory floors are OWASP's minimums. concurrency x memory_cost is the most memory
+hashing can take, whatever the load: with HASHING_WORKERS set to the same concurrency,
+a flood of logins is answered with 503s instead of running the pod out of memory.
+
+The result is printed as environment variables, and written to an env file with
+--write-env. Once the service runs with new parameters, every login whose hash was made
+with other parameters rehashes the password (see
+AuthManager.verify_password_and_update_its_hash_in_database_if_needed).
+
+Usage (from this folder, on the machine, or a pod of the size, that will run the service):
+    python calibrate_argon2.py [--target-ms 250] [--concurrency 4] [--memory-budget-mib 1024]
+    python calibrate_argon2.py --write-env .env
+"""
+import argparse
+import os
+import statistics
+import sys
+import threading
+from dataclasses import dataclass
+from math import ceil
+from time import perf_counter
+
+from argon2 import PasswordHasher
+
+MIN_MEMORY_COST = 19 * 1024         # KiB, with time_cost >= 2
+MIN_SINGLE_PASS_MEMORY_COST = 46 * 1024     # KiB, with time_cost = 1
+MAX_MEMORY_COST = 1024 * 1024       # KiB
+MAX_TIME_COST = 20
+
+
+@dataclass
+class Argon2Profile:
+    time_cost: int
+    memory_cost: int    # KiB
+    parallelism: int
+    concurrency: int
+    latency: float      # Seconds per hash, with `concurrency` hashes at once
+
+    def env(self) -> dict[str, str]:
+        return {
+            "ARGON2_TIME_COST": str(self.time_cost),
+            "ARGON2_MEMORY_COST": str(self.memory_cost),
+            "ARGON2_PARALLELISM": str(self.parallelism),
+            "HASHING_WORKERS": str(self.concurrency),
+        }
+
+
+def available_cores() -> int:
+    """
+    CPU cores this process may use, including a cgroup (container) CPU quota.
+    """
+    cores = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+    try:
+        with open("/sys/fs/cgroup/cpu.max", encoding="utf-8") as f:
+            quota, period = f.read().split()
+        if quota != "max":
+            cores = min(cores, max(1, ceil(int(quota) / int(period))))
+    except (OSError, ValueError):
+        pass
+    return cores
+
+def available_memory_kib() -> int:
+    """
+    Physical memory, or the cgroup (container) memory limit if lower.
+    """
+    memory = os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    try:
+        with open("/sys/fs/cgroup/memory.max", encoding="utf-8") as f:
+            limit = f.read().strip()
+        if limit != "max":
+            memory = min(memory, int(limit))
+    except (OSError, ValueError):
+        pass
+    return memory // 1024
+
+
+def measure(time_cost: int, memory_cost: int, parallelism: int, concurrency: int, rounds: int = 3) -> float:
+    """
+    Median seconds per hash while `concurrency` threads hash at once.
+    """
+    hasher = PasswordHasher(time_cost=time_cost, memory_cost=memory_cost, parallelism=parallelism)
+    latencies: list[float] = []
+    lock = threading.Lock()
+    start_together = threading.Barrier(concurrency)
+
+    def hash_repeatedly():
+        start_together.wait()
+        for _ in range(rounds):
+            start = perf_counter()
+            hasher.hash("correct horse battery staple")
+            with lock:
+                latencies.append(perf_counter() - start)
+
+    # argon2-cffi releases the GIL while hashing, so the threads hash in parallel.
+    threads = [threading.Thread(target=hash_repeatedly) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return statistics.median(latencies)
+
+
+def choose_parameters(measure, target: float, concurrency: int, cores: int, memory_budget: int) -> Argon2Profile:
+    """
+    `measure(time_cost, memory_cost, parallelism)` returns the seconds per hash under load.
+    `memory_budget` (KiB) is shared by the `concurrency` hashes.
+    """
+    memory_cost = min(MAX_MEMORY_COST, memory_budget // concurrency) // 1024 * 1024
+    if memory_cost < MIN_MEMORY_COST:
+        raise ValueError(
+            f"{memory_budget // 1024} MiB cannot run {concurrency} hashes of at least {MIN_MEMORY_COST // 1024} MiB: "
+            f"lower the concurrency or raise the memory budget"
+        )
+    parallelism = max(1, cores // concurrency)
+
+    # Less memory until one pass fits the target.
+    latency = measure(1, memory_cost, parallelism)
+    while latency > target and memory_cost > MIN_MEMORY_COST:
+        memory_cost = max(MIN_MEMORY_COST, memory_cost // 2 // 1024 * 1024)
+        latency = measure(1, memory_cost, parallelism)
+
+    # Then as many passes as fit (the time grows linearly with the passes).
+    time_cost = max(1, min(MAX_TIME_COST, int(target / latency)))
+    if memory_cost < MIN_SINGLE_PASS_MEMORY_COST:
+        time_cost = max(2, time_cost)
+    latency = measure(time_cost, memory_cost, parallelism)
+    while latency > target and time_cost > (2 if memory_cost < MIN_SINGLE_PASS_MEMORY_COST else 1):
+        time_cost -= 1
+        latency = measure(time_cost, memory_cost, parallelism)
+
+    return Argon2Profile(time_cost, memory_cost, parallelism, concurrency, latency)
+
+
+def write_env(path: str, values: dict[str, str]) -> None:
+    """
+    Set `values` in the env file at `path`, keeping its other lines.
+    """
+    lines = []
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            lines = f.read().splitlines()
+
+    remaining = dict(values)
+    for i, line in enumerate(lines):
+        key = line.split("=", 1)[0].strip()
+        if key in remaining:
+            lines[i] = f"{key}={remaining.pop(key)}"
+    if remaining:
+        lines.append("# Argon2 profile (calibrate_argon2.py)")
+        lines += [f"{key}={value}" for key, value in remaining.items()]
+
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+
+
+def main() -> None:
+    cores = available_cores()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--target-ms", type=float, default=250.0, help="Latency of one hash under full load.")
+    parser.add_argument(
+        "--concurrency", type=int, default=int(os.getenv("HASHING_WORKERS", 0)) or cores,
+        help="Hashes running at once, i.e. HASHING_WORKERS (default: HASHING_WORKERS, or one per core)."
+    )
+    parser.add_argument(
+        "--memory-budget-mib", type=int, default=available_memory_kib() // 1024 // 4,
+        help="Memory for all the concurrent hashes (default: a quarter of the memory of the machine or container)."
+    )
+    parser.add_argument("--write-env", help="Also write the profile to this env file (e.g. .env).")
+    args = parser.parse_args()
+
+    print(f"Calibrating for {args.concurrency} concurrent hashes, {cores} cores, "
+          f"{args.memory_budget_mib} MiB, {args.target_ms:g} ms per hash...")
+    try:
+        profile = choose_parameters(
+            lambda t, m, p: measure(t, m, p, args.concurrency),
+            args.target_ms / 1000, args.concurrency, cores, args.memory_budget_mib * 1024
+        )
+    except ValueError as e:
+        sys.exit(f"ERROR: {e}")
+
+    print(f"time_cost={profile.time_cost} memory_cost={profile.memory_cost // 1024} MiB "
+          f"parallelism={profile.parallelism}: {profile.latency * 1000:.0f} ms per hash, "
+          f"{profile.concurrency / profile.latency:.1f} hashes/s, "
+          f"{profile.concurrency * profile.memory_cost // 1024} MiB at most")
+    if profile.latency > args.target_ms / 1000:
+        print("WARNING: even the minimum parameters are slower than the target on this machine")
+    print()
+    for key, value in profile.env().items():
+        print(f"{key}={value}")
+
+    if args.write_env:
+        write_env(args.write_env, profile.env())
+        print(f"\nWritten to {args.write_env}")
+
+
+if __name__ == "__main__":
+    main()
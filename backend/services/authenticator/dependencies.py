@@ -1,15 +1,36 @@
 from auth_manager import AuthManager
-from jwt_utils import JWTUtil
-from repository import UserRepository, PostgresqlUserRepository
+from hashing_executor import PasswordHashingExecutor
+from key_store import KeyStore
+from jwt_utils import JWTUtil, VerifiedTokenCache
+from repository import UserRepository, PostgresqlUserRepository, PoolSettings, BloomFilteredUserRepository
+from repository import ReplicaRoutingUserRepository, ShardedUserRepository
+from repository import CachedUserRepository, PostgresUserChangeListener
+from rate_limiter import RateLimiter, RateLimit, InMemoryRateLimiter, PostgresRateLimiter, client_ip
+from refresh_tokens import RefreshTokenManager, prune_expired_refresh_tokens
 
 from os import getenv
-from fastapi import Depends
+import asyncio
+import hmac
+import ipaddress
+from argon2 import PasswordHasher, DEFAULT_TIME_COST, DEFAULT_MEMORY_COST, DEFAULT_PARALLELISM
+from fastapi import Depends, HTTPException, Request, status
+from docs_config import ADMIN_TOKEN_HEADER
+from tracing import setup_tracing, shutdown_tracing
 
 GRPC_HOST = getenv("GRPC_HOST")
 GRPC_PORT = getenv("GRPC_PORT")
+GRPC_CHANNELS = int(getenv("GRPC_CHANNELS", 1))         # HTTP/2 connections kept open to workout-core
+GRPC_TIMEOUT = float(getenv("GRPC_TIMEOUT", 5.0))       # Seconds
+GRPC_BATCH_ENABLED = getenv("GRPC_BATCH_ENABLED", "true").lower() == "true"     # Coalesce concurrent create/delete calls
+GRPC_BATCH_MAX_SIZE = int(getenv("GRPC_BATCH_MAX_SIZE", 100))
+GRPC_BATCH_MAX_DELAY = float(getenv("GRPC_BATCH_MAX_DELAY_MS", 2)) / 1000      # Milliseconds in the env var
+
+ADMIN_API_TOKEN = getenv("ADMIN_API_TOKEN")     # Administration endpoints are disabled when unset
 
 PRIVATE_KEY_PATH = getenv("PRIVATE_KEY_PATH")
 PUBLIC_KEY_PATH = getenv("PUBLIC_KEY_PATH")
+JWT_ALGORITHM = getenv("JWT_ALGORITHM", "RS256")    # RS256, ES256 or EdDSA (see key_store.SUPPORTED_ALGORITHMS)
+KEY_CHECK_INTERVAL = float(getenv("KEY_CHECK_INTERVAL", 5.0))   # Seconds between key file checks (rotation)
 
 db_variables = {
     "POSTGRES_USER": getenv("POSTGRES_USER"),
@@ -19,9 +40,100 @@ db_variables = {
     "POSTGRES_PORT": getenv("POSTGRES_PORT"),
 }
 
-for var, value in db_variables.items():
-    if value is None:
-        print(f"WARNING: Missing environment variable: {var}")
+# Connection pool (optional, defaults in repository/connection_pool.py)
+pool_settings = PoolSettings()
+pool_settings.min_size = int(getenv("POSTGRES_POOL_MIN_SIZE", pool_settings.min_size))
+pool_settings.max_size = int(getenv("POSTGRES_POOL_MAX_SIZE", pool_settings.max_size))
+pool_settings.max_idle = float(getenv("POSTGRES_POOL_MAX_IDLE", pool_settings.max_idle))
+pool_settings.max_lifetime = float(getenv("POSTGRES_POOL_MAX_LIFETIME", pool_settings.max_lifetime))
+pool_settings.checkout_timeout = float(getenv("POSTGRES_POOL_TIMEOUT", pool_settings.checkout_timeout))
+pool_settings.check_on_checkout = getenv("POSTGRES_POOL_CHECK", "true").lower() == "true"
+pool_settings.open_timeout = float(getenv("POSTGRES_POOL_OPEN_TIMEOUT", pool_settings.open_timeout))
+# Server-side prepared statements: "off" behind PgBouncer in transaction pooling mode.
+POSTGRES_PREPARE_THRESHOLD = getenv("POSTGRES_PREPARE_THRESHOLD", str(pool_settings.prepare_threshold))
+pool_settings.prepare_threshold = None if POSTGRES_PREPARE_THRESHOLD.lower() == "off" else int(POSTGRES_PREPARE_THRESHOLD)
+
+# Argon2 parameters (optional, pick them with calibrate_argon2.py). Defaults: argon2-cffi's.
+# Hashes made with other parameters are rehashed on the next login.
+ARGON2_TIME_COST = int(getenv("ARGON2_TIME_COST", DEFAULT_TIME_COST))
+ARGON2_MEMORY_COST = int(getenv("ARGON2_MEMORY_COST", DEFAULT_MEMORY_COST))     # KiB
+ARGON2_PARALLELISM = int(getenv("ARGON2_PARALLELISM", DEFAULT_PARALLELISM))
+
+# Argon2 thread pool (optional). Requests above workers + queue size get a 503.
+HASHING_WORKERS = int(getenv("HASHING_WORKERS", 0)) or None            # None: one per CPU core
+HASHING_QUEUE_SIZE = int(getenv("HASHING_QUEUE_SIZE", -1))
+hashing_executor = PasswordHashingExecutor(
+    PasswordHasher(time_cost=ARGON2_TIME_COST, memory_cost=ARGON2_MEMORY_COST, parallelism=ARGON2_PARALLELISM),
+    max_workers=HASHING_WORKERS,
+    max_queue_size=HASHING_QUEUE_SIZE if HASHING_QUEUE_SIZE >= 0 else None
+)
+
+# Parsed once on startup, reloaded when the files change.
+key_store = KeyStore(PRIVATE_KEY_PATH, PUBLIC_KEY_PATH, JWT_ALGORITHM, check_interval=KEY_CHECK_INTERVAL)
+key_watcher: asyncio.Task | None = None
+
+# Refresh tokens (see refresh_tokens.py): a session ends after this long without a /refresh.
+REFRESH_TOKEN_TTL = float(getenv("REFRESH_TOKEN_TTL_DAYS", 30)) * 86400     # Days in the env var
+REFRESH_TOKEN_PRUNE_INTERVAL = float(getenv("REFRESH_TOKEN_PRUNE_INTERVAL", 3600.0))   # Seconds between deletions of expired tokens
+refresh_token_pruner: asyncio.Task | None = None
+
+# Verified-token cache (optional). TOKEN_CACHE_SIZE=0 disables it.
+TOKEN_CACHE_SIZE = int(getenv("TOKEN_CACHE_SIZE", 10_000))
+TOKEN_CACHE_TTL = float(getenv("TOKEN_CACHE_TTL", 60.0))    # Seconds, also capped by each token's 'exp'
+token_cache = VerifiedTokenCache(TOKEN_CACHE_SIZE, TOKEN_CACHE_TTL) if TOKEN_CACHE_SIZE > 0 else None
+
+# Login throttling (optional, see rate_limiter.py): memory, postgres or off. Token buckets per
+# username and per client IP, checked before the Argon2 verify of /login and /delete-account.
+RATE_LIMIT_BACKEND = getenv("RATE_LIMIT_BACKEND", "memory")
+RATE_LIMIT_USERNAME = RateLimit(
+    burst=int(getenv("RATE_LIMIT_USERNAME_BURST", 10)),
+    per_minute=float(getenv("RATE_LIMIT_USERNAME_PER_MINUTE", 5))
+)
+RATE_LIMIT_IP = RateLimit(
+    burst=int(getenv("RATE_LIMIT_IP_BURST", 30)),
+    per_minute=float(getenv("RATE_LIMIT_IP_PER_MINUTE", 30))
+)
+RATE_LIMIT_MAX_KEYS = int(getenv("RATE_LIMIT_MAX_KEYS", 100_000))     # Buckets kept per process (memory backend)
+# Header with the client IP set by the reverse proxy (e.g. X-Real-IP). It is only read from the
+# peers in RATE_LIMIT_TRUSTED_PROXIES (comma-separated CIDRs); from any other peer, and when the
+# header is missing, the client IP is the peer address.
+RATE_LIMIT_CLIENT_IP_HEADER = getenv("RATE_LIMIT_CLIENT_IP_HEADER", "")
+RATE_LIMIT_TRUSTED_PROXIES = [
+    ipaddress.ip_network(cidr.strip(), strict=False)
+    for cidr in getenv("RATE_LIMIT_TRUSTED_PROXIES", "").split(",") if cidr.strip()
+]
+if RATE_LIMIT_CLIENT_IP_HEADER and not RATE_LIMIT_TRUSTED_PROXIES:
+    print("WARNING: RATE_LIMIT_CLIENT_IP_HEADER is ignored without RATE_LIMIT_TRUSTED_PROXIES")
+
+rate_limits = {"username": RATE_LIMIT_USERNAME, "ip": RATE_LIMIT_IP}
+rate_limiter: RateLimiter | None = None
+if RATE_LIMIT_BACKEND == "memory":
+    rate_limiter = InMemoryRateLimiter(rate_limits, max_keys=RATE_LIMIT_MAX_KEYS)
+elif RATE_LIMIT_BACKEND == "postgres":
+    rate_limiter = PostgresRateLimiter(
+        {
+            "dbname": db_variables["POSTGRES_DB"],
+            "user": db_variables["POSTGRES_USER"],
+            "password": db_variables["POSTGRES_PASSWORD"],
+            "host": db_variables["POSTGRES_HOST"],
+            "port": db_variables["POSTGRES_PORT"],
+        },
+        rate_limits,
+        fallback=InMemoryRateLimiter(rate_limits, max_keys=RATE_LIMIT_MAX_KEYS)
+    )
+elif RATE_LIMIT_BACKEND != "off":
+    raise ValueError(f"Unknown RATE_LIMIT_BACKEND: {RATE_LIMIT_BACKEND}. Use memory, postgres or off")
+
+# Tracing (optional, see tracing.py): file, otlp (OTEL_EXPORTER_OTLP_ENDPOINT) or console. Off when unset.
+TRACING_EXPORTER = getenv("TRACING_EXPORTER")
+TRACING_FILE = getenv("TRACING_FILE", "traces.jsonl")
+OTEL_SERVICE_NAME = getenv("OTEL_SERVICE_NAME", "authenticator")
+
+# Provisioning outbox worker (optional, see provisioning_worker.py)
+OUTBOX_BATCH_SIZE = int(getenv("OUTBOX_BATCH_SIZE", 100))              # Events claimed per iteration
+OUTBOX_POLL_INTERVAL = float(getenv("OUTBOX_POLL_INTERVAL", 1.0))       # Seconds between polls when idle
+OUTBOX_LEASE = float(getenv("OUTBOX_LEASE", 30.0))                      # Seconds before a claimed event can be claimed again
+OUTBOX_MAX_BACKOFF = float(getenv("OUTBOX_MAX_BACKOFF", 300.0))         # Seconds, cap of the retry delay
 
 # Singleton
 database: UserRepository = PostgresqlUserRepository(
@@ -29,19 +141,176 @@ database: UserRepository = PostgresqlUserRepository(
     database_user=db_variables["POSTGRES_USER"],
     database_password=db_variables["POSTGRES_PASSWORD"],
     host_database=db_variables["POSTGRES_HOST"],
-    port_database=db_variables["POSTGRES_PORT"]
+    port_database=db_variables["POSTGRES_PORT"],
+    pool_settings=pool_settings
 )
 
+# Read replicas (optional, see repository/read_replicas.py): comma-separated host or host:port,
+# same database, user and password as the primary. User lookups go to them, writes to the primary.
+POSTGRES_REPLICA_HOSTS = [host.strip() for host in getenv("POSTGRES_REPLICA_HOSTS", "").split(",") if host.strip()]
+POSTGRES_REPLICA_MAX_LAG = float(getenv("POSTGRES_REPLICA_MAX_LAG", 1.0))          # Seconds, more: no reads
+POSTGRES_READ_YOUR_WRITES = float(getenv("POSTGRES_READ_YOUR_WRITES", 5.0))        # Seconds on the primary after a write
+POSTGRES_REPLICA_CHECK_INTERVAL = float(getenv("POSTGRES_REPLICA_CHECK_INTERVAL", 1.0))    # Seconds between lag checks
+
+def postgres_repository(address: str) -> PostgresqlUserRepository:
+    """
+    A repository on another server (host or host:port) with the database, user and password
+    of POSTGRES_*.
+    """
+    host, _, port = address.partition(":")
+    return PostgresqlUserRepository(
+        database_name=db_variables["POSTGRES_DB"],
+        database_user=db_variables["POSTGRES_USER"],
+        database_password=db_variables["POSTGRES_PASSWORD"],
+        host_database=host,
+        port_database=port or db_variables["POSTGRES_PORT"],
+        pool_settings=pool_settings
+    )
+
+def postgres_conn_details(address: str | None = None) -> dict:
+    """
+    psycopg connection parameters of POSTGRES_*, or of another server (host or host:port).
+    """
+    host, _, port = (address or "").partition(":")
+    return {
+        "dbname": db_variables["POSTGRES_DB"],
+        "user": db_variables["POSTGRES_USER"],
+        "password": db_variables["POSTGRES_PASSWORD"],
+        "host": host or db_variables["POSTGRES_HOST"],
+        "port": port or db_variables["POSTGRES_PORT"],
+    }
+
+if POSTGRES_REPLICA_HOSTS:
+    database = ReplicaRoutingUserRepository(
+        database,
+        [postgres_repository(address) for address in POSTGRES_REPLICA_HOSTS],
+        max_lag=POSTGRES_REPLICA_MAX_LAG,
+        read_your_writes=POSTGRES_READ_YOUR_WRITES,
+        check_interval=POSTGRES_REPLICA_CHECK_INTERVAL
+    )
+
+# Sharding (optional, see repository/sharding.py): comma-separated name=host[:port], users are
+# spread over them by username. Shards are only ever appended. While reshard.py moves the users
+# after adding shards, POSTGRES_SHARDS_PREVIOUS lists the names of the shards before the change.
+POSTGRES_SHARDS = dict(
+    shard.strip().split("=", 1) for shard in getenv("POSTGRES_SHARDS", "").split(",") if shard.strip()
+)
+POSTGRES_SHARDS_PREVIOUS = [name.strip() for name in getenv("POSTGRES_SHARDS_PREVIOUS", "").split(",") if name.strip()]
+
+def sharded_repository() -> ShardedUserRepository:
+    return ShardedUserRepository(
+        {name: postgres_repository(address) for name, address in POSTGRES_SHARDS.items()},
+        previous_shards=POSTGRES_SHARDS_PREVIOUS or None
+    )
+
+if POSTGRES_SHARDS:
+    if POSTGRES_REPLICA_HOSTS:
+        raise ValueError("POSTGRES_SHARDS and POSTGRES_REPLICA_HOSTS can't be used together")
+    database = sharded_repository()
+
+# User cache (optional, see repository/user_cache.py): users looked up again (logins, the lookup
+# before a /delete-account) are read from memory. Changes made by other processes are notified
+# by Postgres (the users_notify_change trigger of postgres/init.sql): the cache stays off on a
+# database without the trigger. USER_CACHE_SIZE=0 disables it.
+USER_CACHE_SIZE = int(getenv("USER_CACHE_SIZE", 10_000))     # Users per process, at most ~8 MB for 10 000
+USER_CACHE_TTL = float(getenv("USER_CACHE_TTL", 30.0))      # Seconds, bounds the staleness if a notification is lost
+if USER_CACHE_SIZE > 0:
+    database = CachedUserRepository(
+        database, USER_CACHE_SIZE, USER_CACHE_TTL,
+        # Notifications only exist on the database written to: the primary, or every shard.
+        listener=PostgresUserChangeListener(
+            [postgres_conn_details(address) for address in POSTGRES_SHARDS.values()] or [postgres_conn_details()]
+        ),
+        stale_reads=POSTGRES_REPLICA_MAX_LAG if POSTGRES_REPLICA_HOSTS else 0.0
+    )
+
+# In-memory username filter (optional): unknown usernames are answered without a query.
+# Only enable it when this process is the only one writing to the users table (main.py refuses
+# to start it with AUTH_WORKERS > 1).
+USERNAME_FILTER_ENABLED = getenv("USERNAME_FILTER_ENABLED", "false").lower() == "true"
+USERNAME_FILTER_CAPACITY = int(getenv("USERNAME_FILTER_CAPACITY", 1_000_000))     # ~9.6 MB at a 1% false positive rate
+USERNAME_FILTER_FALSE_POSITIVE_RATE = float(getenv("USERNAME_FILTER_FALSE_POSITIVE_RATE", 0.01))
+if USERNAME_FILTER_ENABLED:
+    database = BloomFilteredUserRepository(database, USERNAME_FILTER_CAPACITY, USERNAME_FILTER_FALSE_POSITIVE_RATE)
+
+async def startup() -> None:
+    """
+    Called once by the FastAPI lifespan before the first request is served.
+
+    Importing this module only reads the configuration and builds the singletons: nothing
+    is printed, parsed, opened or started until here (see benchmarks/bench_startup.py).
+    """
+    global key_watcher, refresh_token_pruner
+    for var, value in db_variables.items():
+        if value is None:
+            print(f"WARNING: Missing environment variable: {var}")
+    setup_tracing(TRACING_EXPORTER, OTEL_SERVICE_NAME, TRACING_FILE)
+    key_store.reload_if_changed()      # Already loaded when forked by the main.py supervisor
+    key_watcher = asyncio.create_task(key_store.watch())
+    await database.open()
+    refresh_token_pruner = asyncio.create_task(prune_expired_refresh_tokens(database, REFRESH_TOKEN_PRUNE_INTERVAL))
+    if rate_limiter is not None:
+        await rate_limiter.open()
+
+async def shutdown() -> None:
+    """
+    Called once by the FastAPI lifespan after the last request was served.
+    """
+    if key_watcher is not None:
+        key_watcher.cancel()
+    if refresh_token_pruner is not None:
+        refresh_token_pruner.cancel()
+    await database.close()
+    if rate_limiter is not None:
+        await rate_limiter.close()
+    hashing_executor.shutdown()
+    shutdown_tracing()
+
 def get_user_repository() -> UserRepository:
     return database
 
-def get_auth_manager(repository: UserRepository = Depends(get_user_repository)) -> AuthManager:
-    return AuthManager(repository)
+def get_hashing_executor() -> PasswordHashingExecutor:
+    return hashing_executor
+
+def get_auth_manager(
+    repository: UserRepository = Depends(get_user_repository),
+    executor: PasswordHashingExecutor = Depends(get_hashing_executor)
+) -> AuthManager:
+    return AuthManager(repository, executor)
+
+def get_refresh_token_manager(repository: UserRepository = Depends(get_user_repository)) -> RefreshTokenManager:
+    return RefreshTokenManager(repository, REFRESH_TOKEN_TTL)
 
 def get_jwt_util() -> JWTUtil:
-    with open(PRIVATE_KEY_PATH, "rb") as f:
-        return JWTUtil(f.read(), "RS256")
+    return key_store.jwt_util()
+
+def get_token_cache() -> VerifiedTokenCache | None:
+    return token_cache
+
+def get_rate_limiter() -> RateLimiter | None:
+    return rate_limiter
+
+def get_client_ip(request: Request) -> str | None:
+    return client_ip(
+        request.client.host if request.client is not None else None,
+        request.headers.get(RATE_LIMIT_CLIENT_IP_HEADER) if RATE_LIMIT_CLIENT_IP_HEADER else None,
+        RATE_LIMIT_TRUSTED_PROXIES
+    )
+
+def get_public_key():
+    """
+    Parsed public key (cryptography key object), usable wherever PyJWT takes a PEM key.
+    """
+    return key_store.public_key()
+
+def get_admin_api_token() -> str | None:
+    return ADMIN_API_TOKEN
 
-def get_public_key() -> str:
-    with open(PUBLIC_KEY_PATH, "rb") as f:
-        return f.read()
\ No newline at end of file
+def verify_admin_token(
+    x_admin_token: str | None = ADMIN_TOKEN_HEADER,
+    admin_api_token: str | None = Depends(get_admin_api_token)
+) -> None:
+    if not admin_api_token:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    if not x_admin_token or not hmac.compare_digest(x_admin_token.encode(), admin_api_token.encode()):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Admin token is invalid.")
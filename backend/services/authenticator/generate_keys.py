@@ -0,0 +1,37 @@
+"""
+Generate a key pair for signing the access tokens.
+
+Usage (from this folder):
+    python generate_keys.py EdDSA --private-key ./keys/jwtEdDSA.key --public-key ../../keys/jwtEdDSA.key.pub
+
+Then set JWT_ALGORITHM to the same algorithm here and in workout-core, and point
+the auth_private_key / auth_public_key secrets (docker-compose.yml) to the new files.
+"""
+import argparse
+import os
+
+from key_store import SUPPORTED_ALGORITHMS, generate_key_pair
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Generate a JWT signing key pair.")
+    parser.add_argument("algorithm", choices=list(SUPPORTED_ALGORITHMS))
+    parser.add_argument("--private-key", required=True, help="Where to write the private key (PEM, PKCS8).")
+    parser.add_argument("--public-key", required=True, help="Where to write the public key (PEM, SubjectPublicKeyInfo).")
+    parser.add_argument("--rsa-key-size", type=int, default=2048, help="Only used by RS256.")
+    args = parser.parse_args()
+
+    private_pem, public_pem = generate_key_pair(args.algorithm, args.rsa_key_size)
+
+    # The private key is written readable by its owner only.
+    fd = os.open(args.private_key, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "wb") as f:
+        f.write(private_pem)
+    with open(args.public_key, "wb") as f:
+        f.write(public_pem)
+
+    print(f"{args.algorithm} key pair written to {args.private_key} and {args.public_key}")
+
+
+if __name__ == "__main__":
+    main()
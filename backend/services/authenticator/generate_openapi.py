@@ -0,0 +1,31 @@
+"""
+Write the OpenAPI document of the service, so it isn't generated on the first request to
+/openapi.json or /docs of every process (see auth_api.openapi).
+
+Usage (from this folder, run by the Dockerfile at build time):
+    python generate_openapi.py [--output openapi.json]
+
+A document that doesn't match the routes or the version of the app is ignored.
+"""
+import argparse
+import json
+
+from fastapi import FastAPI
+
+from auth_api import app, OPENAPI_FILE
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Write the OpenAPI document of the service.")
+    parser.add_argument("--output", default=str(OPENAPI_FILE), help="Where to write it (default: next to auth_api.py).")
+    args = parser.parse_args()
+
+    schema = FastAPI.openapi(app)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(schema, f, separators=(",", ":"))
+
+    print(f"OpenAPI document ({len(schema['paths'])} paths) written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,19 +1,259 @@
+import asyncio
+from itertools import cycle
+from time import perf_counter
+
 from grpclib.client import Channel
+from grpclib.const import Status
+from grpclib.events import SendRequest, listen
+from grpclib.exceptions import GRPCError
+from opentelemetry import trace
+from opentelemetry.trace import Link, SpanKind
 from proto.usermanagement.v1 import UserManagementServiceStub as Stub
 
-from dependencies import GRPC_HOST, GRPC_PORT
+from metrics import observe_stage
+from tracing import tracer, inject_into_grpc_metadata
+from dependencies import GRPC_HOST, GRPC_PORT, GRPC_CHANNELS, GRPC_TIMEOUT
+from dependencies import GRPC_BATCH_ENABLED, GRPC_BATCH_MAX_SIZE, GRPC_BATCH_MAX_DELAY
+
+
+class GrpcChannelManager:
+    """
+    Application-scoped set of HTTP/2 channels to the workout-core gRPC server.
+
+    Channels are created once (open(), called from the FastAPI lifespan) and shared by
+    every call; HTTP/2 multiplexes concurrent calls over the same connection. A channel
+    whose connection dropped reconnects on its next call, and a call that fails while
+    connecting is retried once on the next channel.
+    """
+
+    def __init__(self, host: str | None, port: str | int | None, channels: int = 1, timeout: float = 5.0) -> None:
+        self.__host = host
+        self.__port = int(port) if port is not None else None
+        self.__number_of_channels = max(1, channels)
+        self.__timeout = timeout
+        self.__channels: list[Channel] = []
+        self.__stubs = None
+        self.__calls: dict[str, dict] = {}
+
+
+    async def open(self) -> None:
+        # Channels connect lazily on their first call, so this doesn't block startup.
+        # It must run inside the event loop: grpclib binds a channel to the running loop.
+        self.__channels = [
+            Channel(host=self.__host, port=self.__port) for _ in range(self.__number_of_channels)
+        ]
+        for channel in self.__channels:
+            # Every call carries the trace context (traceparent) in its metadata.
+            listen(channel, SendRequest, inject_into_grpc_metadata)
+        self.__stubs = cycle([Stub(channel, timeout=self.__timeout) for channel in self.__channels])
+
+    def close(self) -> None:
+        for channel in self.__channels:
+            channel.close()
+        self.__channels = []
+        self.__stubs = None
+
+
+    async def call(self, method: str, links: list[Link] | None = None, **kwargs):
+        """
+        Call `method` of UserManagementServiceStub (e.g. "create_user") and record its latency.
+        `links` are added to the call's trace span (e.g. the requests of a batch).
+        """
+
+        if self.__stubs is None:
+            # Used outside the app lifespan (e.g. a script): open lazily.
+            await self.open()
+
+        start = perf_counter()
+        try:
+            with tracer.start_as_current_span(
+                f"grpc UserManagementService/{method}", kind=SpanKind.CLIENT, links=links,
+                attributes={"rpc.system": "grpc", "rpc.method": method},
+            ):
+                try:
+                    response = await getattr(next(self.__stubs), method)(**kwargs)
+                except ConnectionError:
+                    # Nothing was sent: the connection could not be (re)established. Try another channel.
+                    response = await getattr(next(self.__stubs), method)(**kwargs)
+        except Exception:
+            self.__record_call(method, perf_counter() - start, failed=True)
+            observe_stage("grpc", perf_counter() - start, "error")
+            raise
+        self.__record_call(method, perf_counter() - start, failed=False)
+        observe_stage("grpc", perf_counter() - start)
+        return response
+
+
+    def stats(self) -> dict:
+        """
+        Per-method call latency and the state of each channel.
+        """
+
+        return {
+            "channels": [
+                # grpclib has no public accessor for the connection state.
+                "CONNECTED" if getattr(channel, "_connected", False) else "DISCONNECTED"
+                for channel in self.__channels
+            ],
+            "calls": {
+                method: {
+                    **counters,
+                    "latency_seconds_avg": counters["latency_seconds_total"] / counters["calls"],
+                }
+                for method, counters in self.__calls.items()
+            },
+        }
+
+    def __record_call(self, method: str, elapsed: float, failed: bool) -> None:
+        counters = self.__calls.setdefault(
+            method, {"calls": 0, "failures": 0, "latency_seconds_total": 0.0, "latency_seconds_max": 0.0}
+        )
+        counters["calls"] += 1
+        counters["failures"] += int(failed)
+        counters["latency_seconds_total"] += elapsed
+        counters["latency_seconds_max"] = max(counters["latency_seconds_max"], elapsed)
+
+
+class MicroBatcher:
+    """
+    Coalesces concurrent single-user calls into one batch RPC (e.g. many create_user
+    calls into one create_users call).
+
+    A batch is sent when it reaches max_batch_size users or max_delay seconds after its
+    first user, whichever comes first, so a lone call waits at most max_delay. Each caller
+    gets its own outcome: None, or the GRPCError of its user (e.g. ALREADY_EXISTS). If the
+    batch RPC itself fails, every caller of that batch gets the error.
+    """
+
+    def __init__(self, manager: GrpcChannelManager, method: str, max_batch_size: int = 100, max_delay: float = 0.002) -> None:
+        self.__manager = manager
+        self.__method = method
+        self.__max_batch_size = max(1, max_batch_size)
+        self.__max_delay = max_delay
+        self.__pending: list[tuple[str, asyncio.Future, Link]] = []
+        self.__timer: asyncio.TimerHandle | None = None
+        self.__in_flight: set[asyncio.Task] = set()
+        self.__batches = 0
+        self.__users = 0
+        self.__max_batch_seen = 0
 
-# ToDo: Performance improvement: one global channel when FastAPI starts and reuse it.
-# Right now, it is openning a new Channel for every single request (slow).
+
+    async def submit(self, user_id: str) -> None:
+        """
+        Add `user_id` to the next batch and wait for its outcome.
+        """
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        # The batch's span links to the span of each caller.
+        self.__pending.append((user_id, future, Link(trace.get_current_span().get_span_context())))
+
+        if len(self.__pending) >= self.__max_batch_size:
+            self.__flush()
+        elif self.__timer is None:
+            self.__timer = loop.call_later(self.__max_delay, self.__flush)
+        await future
+
+    async def close(self) -> None:
+        """
+        Send what is still pending and wait for the batches in flight.
+        """
+
+        self.__flush()
+        if self.__in_flight:
+            await asyncio.gather(*self.__in_flight, return_exceptions=True)
+
+
+    @property
+    def method(self) -> str:
+        return self.__method
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.__batches,
+            "users": self.__users,
+            "batch_size_avg": self.__users / self.__batches if self.__batches else 0.0,
+            "batch_size_max": self.__max_batch_seen,
+            "pending": len(self.__pending),
+        }
+
+
+    def __flush(self) -> None:
+        if self.__timer is not None:
+            self.__timer.cancel()
+            self.__timer = None
+        batch, self.__pending = self.__pending, []
+        if not batch:
+            return
+
+        self.__batches += 1
+        self.__users += len(batch)
+        self.__max_batch_seen = max(self.__max_batch_seen, len(batch))
+        # Keep a reference: the event loop only keeps weak references to tasks.
+        task = asyncio.get_running_loop().create_task(self.__send(batch))
+        self.__in_flight.add(task)
+        task.add_done_callback(self.__in_flight.discard)
+
+    async def __send(self, batch: list[tuple[str, asyncio.Future, Link]]) -> None:
+        try:
+            response = await self.__manager.call(
+                self.__method,
+                links=[link for _, _, link in batch if link.context.is_valid],
+                ids=[user_id for user_id, _, _ in batch]
+            )
+            if len(response.results) != len(batch):
+                raise GRPCError(Status.INTERNAL, f"Expected {len(batch)} results, got {len(response.results)}")
+
+            for (_, future, _), result in zip(batch, response.results):
+                if future.done():
+                    continue    # The caller was cancelled (e.g. the request was aborted).
+                if result.code == Status.OK.value:
+                    future.set_result(None)
+                else:
+                    future.set_exception(GRPCError(self.__status(result.code), result.message))
+        except Exception as e:
+            # Whatever went wrong, no caller is left waiting.
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+
+    @staticmethod
+    def __status(code: int) -> Status:
+        """
+        The Status of a result code, UNKNOWN for a code this version of grpclib doesn't know.
+        """
+        return Status(code) if code in Status._value2member_map_ else Status.UNKNOWN
+
+
+# Singleton, opened and closed by the FastAPI lifespan (see auth_api.lifespan).
+channel_manager = GrpcChannelManager(GRPC_HOST, GRPC_PORT, channels=GRPC_CHANNELS, timeout=GRPC_TIMEOUT)
+
+create_batcher = MicroBatcher(channel_manager, "create_users", GRPC_BATCH_MAX_SIZE, GRPC_BATCH_MAX_DELAY)
+delete_batcher = MicroBatcher(channel_manager, "delete_users", GRPC_BATCH_MAX_SIZE, GRPC_BATCH_MAX_DELAY)
 
 async def create_user(user_id: str):
-    channel = Channel(host=GRPC_HOST, port=GRPC_PORT)
-    service = Stub(channel)
-    await service.create_user(id=user_id)
-    channel.close()
+    if GRPC_BATCH_ENABLED:
+        await create_batcher.submit(user_id)
+    else:
+        await channel_manager.call("create_user", id=user_id)
 
 async def delete_user(user_id: str):
-    channel = Channel(host=GRPC_HOST, port=GRPC_PORT)
-    service = Stub(channel)
-    await service.delete_user(id=user_id)
-    channel.close()
\ No newline at end of file
+    if GRPC_BATCH_ENABLED:
+        await delete_batcher.submit(user_id)
+    else:
+        await channel_manager.call("delete_user", id=user_id)
+
+async def close() -> None:
+    """
+    Send the pending batches, then close the channels.
+    """
+    for batcher in (create_batcher, delete_batcher):
+        await batcher.close()
+    channel_manager.close()
+
+def stats() -> dict:
+    return {
+        **channel_manager.stats(),
+        "batching": {batcher.method: batcher.stats() for batcher in (create_batcher, delete_batcher)}
+                    if GRPC_BATCH_ENABLED else None,
+    }
@@ -0,0 +1,100 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from os import cpu_count
+
+from argon2 import PasswordHasher
+
+from metrics import stage
+
+
+class HashingQueueFullError(Exception):
+    """
+    Raised when the hashing executor already has as much work as it accepts.
+    The API answers it with a 503 and a Retry-After header.
+    """
+
+
+class PasswordHashingExecutor:
+    """
+    Runs Argon2 hashing and verification off the event loop.
+
+    Each hash/verify takes tens of milliseconds of CPU. Running them inline in an
+    async handler blocks every other request, so they run on a thread pool instead
+    (argon2-cffi releases the GIL while hashing, so threads run in parallel).
+
+    At most max_workers + max_queue_size operations are accepted at once (running or
+    waiting); above that, HashingQueueFullError is raised immediately instead of
+    building an unbounded backlog.
+    """
+
+    def __init__(self, hasher: PasswordHasher | None = None, max_workers: int | None = None, max_queue_size: int | None = None) -> None:
+        self.__hasher = hasher or PasswordHasher()
+        self.__max_workers = max_workers or cpu_count() or 1
+        self.__max_queue_size = self.__max_workers * 4 if max_queue_size is None else max_queue_size
+        self.__executor = ThreadPoolExecutor(max_workers=self.__max_workers, thread_name_prefix="argon2")
+
+        self.__lock = threading.Lock()      # Done callbacks run on the worker threads.
+        self.__pending = 0
+        self.__completed = 0
+        self.__rejected = 0
+
+    @property
+    def hasher(self) -> PasswordHasher:
+        return self.__hasher
+
+
+    async def hash(self, password: str) -> str:
+        with stage("argon2_hash"):
+            return await self.__submit(self.__hasher.hash, password)
+
+    async def verify(self, password_hash: str, password: str) -> bool:
+        """
+        Same as PasswordHasher.verify: raises VerifyMismatchError if the password is wrong.
+        """
+        with stage("argon2_verify"):
+            return await self.__submit(self.__hasher.verify, password_hash, password)
+
+    def check_needs_rehash(self, password_hash: str) -> bool:
+        # Only parses the hash string, cheap enough to run inline.
+        return self.__hasher.check_needs_rehash(password_hash)
+
+
+    def shutdown(self) -> None:
+        self.__executor.shutdown(wait=True, cancel_futures=True)
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.__max_workers,
+            "queue_size": self.__max_queue_size,
+            "pending": self.__pending,
+            "completed": self.__completed,
+            "rejected": self.__rejected,
+            "argon2": {
+                "time_cost": self.__hasher.time_cost,
+                "memory_cost": self.__hasher.memory_cost,
+                "parallelism": self.__hasher.parallelism,
+            },
+        }
+
+
+    async def __submit(self, function, *args):
+        with self.__lock:
+            if self.__pending >= self.__max_workers + self.__max_queue_size:
+                self.__rejected += 1
+                raise HashingQueueFullError("Too many password hashing operations in progress")
+            self.__pending += 1
+
+        try:
+            future = self.__executor.submit(function, *args)
+        except BaseException:
+            self.__release()
+            raise
+        # The slot is released when the work finishes, even if the awaiting request was cancelled.
+        future.add_done_callback(lambda _: self.__release())
+        return await asyncio.wrap_future(future)
+
+    def __release(self) -> None:
+        with self.__lock:
+            self.__pending -= 1
+            self.__completed += 1
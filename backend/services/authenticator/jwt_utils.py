@@ -1,19 +1,109 @@
 import jwt
+import hashlib
+import time
+from collections import OrderedDict
 from datetime import datetime, timedelta, timezone
 
+from metrics import stage
+
+
+class VerifiedTokenCache:
+    """
+    Bounded LRU cache of already verified tokens, so a token presented again
+    skips the signature verification.
+
+    Entries are keyed by a SHA-256 digest of the token (the token itself is not kept)
+    and live at most `ttl` seconds and never past the token's own 'exp'. The cache is
+    bound to one public key: it is cleared when a different key is used (key rotation).
+    """
+
+    def __init__(self, max_size: int = 10_000, ttl: float = 60.0) -> None:
+        self.__max_size = max_size
+        self.__ttl = ttl
+        self.__entries: OrderedDict[bytes, tuple[float, dict]] = OrderedDict()
+        self.__public_key = None
+        self.__hits = 0
+        self.__misses = 0
+        self.__evictions = 0
+        self.__expirations = 0
+
+
+    def get(self, token: str, public_key) -> dict | None:
+        self.__bind(public_key)
+        key = self.__digest(token)
+        entry = self.__entries.get(key)
+        if entry is None:
+            self.__misses += 1
+            return None
+
+        expires_at, payload = entry
+        if expires_at <= time.time():
+            del self.__entries[key]
+            self.__expirations += 1
+            self.__misses += 1
+            return None
+
+        self.__entries.move_to_end(key)
+        self.__hits += 1
+        return dict(payload)
+
+    def put(self, token: str, public_key, payload: dict) -> None:
+        self.__bind(public_key)
+        expires_at = time.time() + self.__ttl
+        if "exp" in payload:
+            expires_at = min(expires_at, float(payload["exp"]))
+
+        key = self.__digest(token)
+        self.__entries[key] = (expires_at, dict(payload))
+        self.__entries.move_to_end(key)
+        while len(self.__entries) > self.__max_size:
+            self.__entries.popitem(last=False)
+            self.__evictions += 1
+
+    def clear(self) -> None:
+        self.__entries.clear()
+
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self.__entries),
+            "max_size": self.__max_size,
+            "hits": self.__hits,
+            "misses": self.__misses,
+            "evictions": self.__evictions,
+            "expirations": self.__expirations,
+        }
+
+    def __bind(self, public_key) -> None:
+        if public_key is not self.__public_key and public_key != self.__public_key:
+            self.__entries.clear()
+            self.__public_key = public_key
+
+    @staticmethod
+    def __digest(token: str) -> bytes:
+        return hashlib.sha256(token.encode()).digest()
+
+
 class JWTUtil:
     """
     Utility class for handling JWT creation and verification.
     
     Note: When using a symmetric algorithm (e.g., HS256), pass the shared secret 
     as the 'private_key' during initialization and as the 'public_key' during verification.
+
+    Keys can be PEM encoded (bytes | str) or already parsed cryptography key objects.
+    Parsed keys are faster: PyJWT re-parses PEM keys on every call (see key_store.py).
     """
 
 
-    def __init__(self, private_key_pem_encoded: bytes | str, algorithm: str = "RS256") -> None:
+    def __init__(self, private_key_pem_encoded, algorithm: str = "RS256") -> None:
         self.__private_key = private_key_pem_encoded
         self.__algorithm = algorithm
 
+    @property
+    def algorithm(self) -> str:
+        return self.__algorithm
+
 
     def create_token(self, username: str, lifetime_in_minutes: int = 30) -> str:
         """
@@ -25,21 +115,33 @@ class JWTUtil:
             'exp' : datetime.now(timezone.utc) + timedelta(minutes=lifetime_in_minutes),
             'iat': datetime.now(timezone.utc)
         }
-        encoded_jwt = jwt.encode(payload, self.__private_key, algorithm=self.__algorithm)
+        with stage("jwt_sign"):
+            encoded_jwt = jwt.encode(payload, self.__private_key, algorithm=self.__algorithm)
 
         return encoded_jwt
     
     @staticmethod
-    def verify_token(token: str, public_key_pem_encoded: bytes | str, algorithm: str = "RS256") -> dict | None:
+    def verify_token(token: str, public_key_pem_encoded, algorithm: str = "RS256",
+                     cache: VerifiedTokenCache | None = None) -> dict | None:
         """
             Verifies the token. Returns the payload if the token is valid, otherwise returns None.
+
+            If a cache is given, a token already verified with the same key is not verified again.
         """
-        try:
-            payload = jwt.decode(
-                token, 
-                public_key_pem_encoded, 
-                algorithms=[algorithm]
-            )
-            return payload
-        except (jwt.ExpiredSignatureError, jwt.InvalidTokenError):
-            return None
\ No newline at end of file
+        with stage("jwt_verify"):
+            if cache is not None:
+                payload = cache.get(token, public_key_pem_encoded)
+                if payload is not None:
+                    return payload
+            try:
+                payload = jwt.decode(
+                    token, 
+                    public_key_pem_encoded, 
+                    algorithms=[algorithm]
+                )
+            except (jwt.ExpiredSignatureError, jwt.InvalidTokenError):
+                return None
+
+            if cache is not None:
+                cache.put(token, public_key_pem_encoded, payload)
+            return payload
\ No newline at end of file
@@ -0,0 +1,190 @@
+import asyncio
+import os
+from dataclasses import dataclass
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519, rsa
+from cryptography.hazmat.primitives.serialization import load_pem_private_key, load_pem_public_key
+
+from jwt_utils import JWTUtil
+from metrics import stage
+
+# Signing algorithms supported for the access tokens, with the private key type each one needs.
+# RS256 is by far the slowest to sign and has the largest tokens; ES256 and EdDSA sign
+# several times faster but verify somewhat slower (see benchmarks/bench_jwt_algorithms.py).
+# Token consumers (e.g. workout-core) must be configured with the same algorithm.
+SUPPORTED_ALGORITHMS = {
+    "RS256": rsa.RSAPrivateKey,
+    "ES256": ec.EllipticCurvePrivateKey,
+    "EdDSA": ed25519.Ed25519PrivateKey,
+}
+
+
+def generate_key_pair(algorithm: str, rsa_key_size: int = 2048) -> tuple[bytes, bytes]:
+    """
+    Generate a new key pair for `algorithm`. Returns (private key PEM, public key PEM).
+    """
+
+    if algorithm == "RS256":
+        private_key = rsa.generate_private_key(public_exponent=65537, key_size=rsa_key_size)
+    elif algorithm == "ES256":
+        private_key = ec.generate_private_key(ec.SECP256R1())
+    elif algorithm == "EdDSA":
+        private_key = ed25519.Ed25519PrivateKey.generate()
+    else:
+        raise ValueError(f"Unsupported algorithm: {algorithm}. Use one of {list(SUPPORTED_ALGORITHMS)}")
+
+    private_pem = private_key.private_bytes(
+        encoding=serialization.Encoding.PEM,
+        format=serialization.PrivateFormat.PKCS8,
+        encryption_algorithm=serialization.NoEncryption()
+    )
+    public_pem = private_key.public_key().public_bytes(
+        encoding=serialization.Encoding.PEM,
+        format=serialization.PublicFormat.SubjectPublicKeyInfo
+    )
+    return private_pem, public_pem
+
+
+def check_key_matches_algorithm(private_key, algorithm: str) -> None:
+    """
+    Raises ValueError if `private_key` can't sign tokens with `algorithm`.
+    """
+
+    if algorithm not in SUPPORTED_ALGORITHMS:
+        raise ValueError(f"Unsupported algorithm: {algorithm}. Use one of {list(SUPPORTED_ALGORITHMS)}")
+    if not isinstance(private_key, SUPPORTED_ALGORITHMS[algorithm]):
+        raise ValueError(f"A {type(private_key).__name__} can't sign {algorithm} tokens")
+    if algorithm == "ES256" and not isinstance(private_key.curve, ec.SECP256R1):
+        raise ValueError("ES256 requires a P-256 (secp256r1) key")
+
+
+def check_public_key_matches(private_key, public_key) -> None:
+    """
+    Raises ValueError if `public_key` is not the public half of `private_key` (e.g. only one
+    of the files was rotated yet): the tokens signed with it couldn't be verified.
+    """
+
+    def encoded(key) -> bytes:
+        return key.public_bytes(
+            encoding=serialization.Encoding.DER,
+            format=serialization.PublicFormat.SubjectPublicKeyInfo
+        )
+
+    if encoded(private_key.public_key()) != encoded(public_key):
+        raise ValueError("The public key doesn't match the private key")
+
+
+@dataclass(frozen=True)
+class KeyMaterial:
+    """
+    Parsed key pair plus the file versions it was read from.
+    """
+    private_key: object
+    public_key: object
+    jwt_util: JWTUtil
+    file_versions: tuple
+
+
+class KeyStore:
+    """
+    Reads and parses the JWT key pair once, and reloads it when the files change.
+
+    Parsing a PEM file into a key object is expensive, so it is done on startup and on
+    rotation only; every request reuses the same key objects. The files are polled by
+    mtime (watch(), started by the FastAPI lifespan), and a new key pair replaces the old
+    one atomically: a request sees either the old pair or the new pair, never a mix.
+    If the new files can't be parsed (e.g. a rotation is half written) the old keys stay.
+    """
+
+    def __init__(self, private_key_path: str, public_key_path: str, algorithm: str = "RS256", check_interval: float = 5.0) -> None:
+        self.__private_key_path = private_key_path
+        self.__public_key_path = public_key_path
+        self.__algorithm = algorithm
+        self.__check_interval = check_interval
+        self.__material: KeyMaterial | None = None
+        self.__reloads = 0
+
+
+    def load(self) -> None:
+        """
+        Read and parse both key files. Raises if they are missing or invalid.
+        """
+
+        with stage("key_load"):
+            versions = self.__file_versions()
+            with open(self.__private_key_path, "rb") as f:
+                private_key = load_pem_private_key(f.read(), password=None)
+            with open(self.__public_key_path, "rb") as f:
+                public_key = load_pem_public_key(f.read())
+            check_key_matches_algorithm(private_key, self.__algorithm)
+            check_public_key_matches(private_key, public_key)
+
+        # Single assignment, so readers never see a half-updated pair.
+        self.__material = KeyMaterial(
+            private_key=private_key,
+            public_key=public_key,
+            jwt_util=JWTUtil(private_key, self.__algorithm),
+            file_versions=versions,
+        )
+        self.__reloads += 1
+
+    def reload_if_changed(self) -> bool:
+        """
+        Reload the key pair if any of the files changed since the last load.
+        Returns True if new keys were loaded.
+        """
+
+        try:
+            if self.__material is not None and self.__file_versions() == self.__material.file_versions:
+                return False
+            self.load()
+            return True
+        except Exception as e:
+            # Not only OSError and ValueError: e.g. an encrypted key raises TypeError, a key
+            # type the backend doesn't support UnsupportedAlgorithm.
+            if self.__material is None:
+                raise
+            print(f"WARNING: Could not reload JWT keys, keeping the previous ones: {e!r}")
+            return False
+
+    async def watch(self) -> None:
+        """
+        Poll the key files forever. Meant to run as a background task.
+        """
+
+        while True:
+            await asyncio.sleep(self.__check_interval)
+            try:
+                self.reload_if_changed()
+            except Exception as e:
+                # Any error ending this task would stop the rotations silently.
+                print(f"WARNING: Could not check the JWT key files: {e!r}")
+
+
+    @property
+    def algorithm(self) -> str:
+        return self.__algorithm
+
+    def jwt_util(self) -> JWTUtil:
+        return self.__current().jwt_util
+
+    def public_key(self):
+        return self.__current().public_key
+
+    def stats(self) -> dict:
+        return {"algorithm": self.__algorithm, "reloads": self.__reloads}
+
+
+    def __current(self) -> KeyMaterial:
+        if self.__material is None:
+            # Not loaded by the lifespan (e.g. used from a script): load on first use.
+            self.load()
+        return self.__material
+
+    def __file_versions(self) -> tuple:
+        versions = []
+        for path in (self.__private_key_path, self.__public_key_path):
+            stat = os.stat(path)    # Follows symlinks, so rotated (re-linked) secrets are noticed too.
+            versions.append((stat.st_ino, stat.st_mtime_ns, stat.st_size))
+        return tuple(versions)
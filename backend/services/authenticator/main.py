@@ -1,6 +1,141 @@
+"""
+Entry point of the service:
+    python main.py
+
+AUTH_HOST and AUTH_PORT set the address to listen on. AUTH_WORKERS sets the number of
+processes (0: one per core). Argon2 keeps one core busy per hash, so a single process
+serves as many logins as one core can hash. With more than one worker, this process
+becomes a prefork supervisor:
+
+    - It imports the app once: the configuration and the singletons of dependencies.py are
+      built here, and the JWT keys are parsed here. The workers inherit them through fork().
+      Nothing with a thread, a socket or an event loop exists yet at that point.
+    - Each worker binds its own socket with SO_REUSEPORT, so the kernel spreads new
+      connections evenly between the workers. Where SO_REUSEPORT is missing, the
+      supervisor binds one socket and the workers share it.
+    - Each worker opens its own database pool, gRPC channels and background tasks in the
+      FastAPI lifespan (see auth_api.lifespan).
+    - A worker that dies is replaced. SIGTERM or SIGINT stops the workers gracefully.
+
+Per-process state stays per worker: the verified-token cache, the in-memory login
+throttling buckets (use RATE_LIMIT_BACKEND=postgres to share them) and /stats. /metrics
+adds up every worker (PROMETHEUS_MULTIPROC_DIR, see metrics.py). The username filter
+(USERNAME_FILTER_ENABLED) only sees the sign-ups of its own process: a worker would reject
+the users who signed up through another one, so the supervisor refuses to start with it.
+"""
+import os
+import signal
+import socket
+import sys
+import tempfile
+import time
+import traceback
+
 import uvicorn
+
+# Read here rather than in dependencies.py: PROMETHEUS_MULTIPROC_DIR must be set before
+# prometheus_client is first imported.
+AUTH_HOST = os.getenv("AUTH_HOST", "0.0.0.0")
+AUTH_PORT = int(os.getenv("AUTH_PORT", 5000))
+AUTH_WORKERS = int(os.getenv("AUTH_WORKERS", 1)) or os.cpu_count() or 1
+
+if AUTH_WORKERS > 1 and not os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+    os.environ["PROMETHEUS_MULTIPROC_DIR"] = tempfile.mkdtemp(prefix="authenticator-metrics-")
+
 from auth_api import app
+from dependencies import key_store, USERNAME_FILTER_ENABLED
+
+# No endpoint uses websockets: uvicorn doesn't import a websockets implementation on startup.
+UVICORN_OPTIONS = {"ws": "none"}
+
+
+def bind_socket(reuse_port: bool) -> socket.socket:
+    family = socket.AF_INET6 if ":" in AUTH_HOST else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if reuse_port:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((AUTH_HOST, AUTH_PORT))
+    sock.set_inheritable(True)
+    return sock
+
+
+def spawn_worker(shared_socket: socket.socket | None) -> int:
+    pid = os.fork()
+    if pid != 0:
+        return pid
+
+    # Worker: its own process group, so a Ctrl-C only reaches the supervisor, which stops
+    # the workers once. uvicorn installs its own graceful SIGTERM / SIGINT handlers.
+    os.setpgid(0, 0)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    exit_code = 0
+    try:
+        sock = shared_socket or bind_socket(reuse_port=True)
+        uvicorn.Server(uvicorn.Config(app, **UVICORN_OPTIONS)).run(sockets=[sock])
+    except BaseException:
+        traceback.print_exc()
+        exit_code = 1
+    finally:
+        os._exit(exit_code)
+
+
+def supervise(workers: int) -> None:
+    """
+    Fork `workers` workers and keep that many running until SIGTERM / SIGINT.
+    """
+    multiprocess_dir = os.environ["PROMETHEUS_MULTIPROC_DIR"]
+    for name in os.listdir(multiprocess_dir):   # Metrics of a previous run
+        if name.endswith(".db"):
+            os.remove(os.path.join(multiprocess_dir, name))
+
+    reuse_port = hasattr(socket, "SO_REUSEPORT")
+    # Fails now, rather than in every worker, if the address is taken.
+    shared_socket = bind_socket(reuse_port)
+    if reuse_port:
+        shared_socket.close()
+
+    # Parsed once here, inherited by every worker (which then only watch the files).
+    key_store.load()
+
+    children = set()
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for child in children:
+            os.kill(child, signal.SIGTERM)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    for _ in range(workers):
+        children.add(spawn_worker(None if reuse_port else shared_socket))
+    print(f"Started {workers} workers on {AUTH_HOST}:{AUTH_PORT} "
+          f"({'SO_REUSEPORT' if reuse_port else 'shared socket'})")
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        children.discard(pid)
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(pid)
+
+        if not stopping:
+            print(f"WARNING: Worker {pid} exited (status {status}), starting a new one")
+            time.sleep(1)   # Don't spin if workers die on startup.
+            if not stopping:
+                children.add(spawn_worker(None if reuse_port else shared_socket))
+
 
 if __name__ == "__main__":
-    import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=5000)  # ToDo: Port should be configurable
\ No newline at end of file
+    if AUTH_WORKERS > 1:
+        if USERNAME_FILTER_ENABLED:
+            sys.exit("ERROR: USERNAME_FILTER_ENABLED=true requires AUTH_WORKERS=1 (each worker would have its own filter)")
+        supervise(AUTH_WORKERS)
+        sys.exit(0)
+    uvicorn.run(app, host=AUTH_HOST, port=AUTH_PORT, **UVICORN_OPTIONS)
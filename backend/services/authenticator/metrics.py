@@ -0,0 +1,150 @@
+"""
+Prometheus metrics, exposed by GET /metrics (see auth_api.py).
+
+Every request is split into stages, each timed in a histogram labeled by endpoint, stage
+and outcome ("ok", or "error" if the stage raised, e.g. a wrong password in argon2_verify),
+so a slower endpoint can be traced to Postgres, Argon2, the JWT keys or workout-core:
+
+    validation          body parsing, validation and dependencies, before the handler runs
+    repository          one repository query, including the wait for a pooled connection
+    argon2_hash         one Argon2 hash, including the wait for a hashing thread
+    argon2_verify       one Argon2 verification, same
+    rehash_and_update   new hash and its update after a login (contains argon2_hash and repository)
+    jwt_sign            JWTUtil.create_token
+    jwt_verify          JWTUtil.verify_token (cache hits included)
+    key_load            reading and parsing the key files (startup and rotation)
+    grpc                one call to workout-core, retry included
+
+Stages that run outside of a request (e.g. the provisioning worker) have the endpoint "background".
+
+With several worker processes (see main.py), PROMETHEUS_MULTIPROC_DIR is set and every
+process writes its metrics there: /metrics reports the sum of all the workers.
+"""
+import functools
+import inspect
+import os
+from contextlib import contextmanager
+from contextvars import ContextVar
+from time import perf_counter
+
+from fastapi.exceptions import RequestValidationError
+from fastapi.routing import APIRoute
+from prometheus_client import REGISTRY, CollectorRegistry, Counter, Histogram, multiprocess
+
+# From 100 µs (validation) to 10 s (Argon2 under load).
+LATENCY_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+REQUEST_SECONDS = Histogram(
+    "auth_request_duration_seconds", "Duration of HTTP requests.",
+    ["endpoint", "method", "status"], buckets=LATENCY_BUCKETS
+)
+RESPONSES = Counter(
+    "auth_responses_total", "HTTP responses by status code (e.g. 401, 409, 503).",
+    ["endpoint", "method", "status"]
+)
+STAGE_SECONDS = Histogram(
+    "auth_stage_duration_seconds", "Duration of one stage of a request.",
+    ["endpoint", "stage", "outcome"], buckets=LATENCY_BUCKETS
+)
+REFRESH_TOKEN_REUSES = Counter(
+    "auth_refresh_token_reuses_total", "Rotated refresh tokens presented again (their session was revoked)."
+)
+
+# Route of the request being served (e.g. "/login"), set by InstrumentedRoute.
+current_endpoint: ContextVar[str] = ContextVar("current_endpoint", default="background")
+_request_started: ContextVar[float] = ContextVar("request_started", default=0.0)
+
+
+@contextmanager
+def stage(name: str):
+    """
+    Time the enclosed block as stage `name` of the current request.
+    """
+    start = perf_counter()
+    outcome = "error"
+    try:
+        yield
+        outcome = "ok"
+    finally:
+        STAGE_SECONDS.labels(current_endpoint.get(), name, outcome).observe(perf_counter() - start)
+
+def observe_stage(name: str, seconds: float, outcome: str = "ok") -> None:
+    STAGE_SECONDS.labels(current_endpoint.get(), name, outcome).observe(seconds)
+
+def observe_request(endpoint: str, method: str, status: int, seconds: float) -> None:
+    REQUEST_SECONDS.labels(endpoint, method, str(status)).observe(seconds)
+    RESPONSES.labels(endpoint, method, str(status)).inc()
+
+def registry() -> CollectorRegistry:
+    """
+    The metrics to expose: those of every worker process when there are several.
+    """
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        workers = CollectorRegistry()
+        multiprocess.MultiProcessCollector(workers)
+        return workers
+    return REGISTRY
+
+
+class InstrumentedRoute(APIRoute):
+    """
+    APIRoute that sets current_endpoint for the stages of its requests, and times the
+    validation stage: from the route being matched to the handler being called.
+    """
+
+    def __init__(self, path: str, endpoint, **kwargs) -> None:
+        if inspect.iscoroutinefunction(endpoint):
+            endpoint = self.__time_validation(endpoint)
+        super().__init__(path, endpoint, **kwargs)
+
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+        path = self.path
+
+        async def instrumented_handler(request):
+            current_endpoint.set(path)
+            _request_started.set(perf_counter())
+            try:
+                return await handler(request)
+            except RequestValidationError:
+                observe_stage("validation", perf_counter() - _request_started.get(), "error")
+                raise
+
+        return instrumented_handler
+
+    @staticmethod
+    def __time_validation(endpoint):
+        @functools.wraps(endpoint)      # FastAPI reads the parameters from the wrapped signature.
+        async def timed_endpoint(*args, **kwargs):
+            observe_stage("validation", perf_counter() - _request_started.get())
+            return await endpoint(*args, **kwargs)
+        return timed_endpoint
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording the duration and status code of every HTTP request.
+    """
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        start = perf_counter()
+        status = 500    # If the app fails before sending a response.
+
+        async def send_and_record_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_and_record_status)
+        finally:
+            route = scope.get("route")      # Set by the router once a route matched.
+            endpoint = route.path if route is not None else "unmatched"
+            observe_request(endpoint, scope["method"], status, perf_counter() - start)
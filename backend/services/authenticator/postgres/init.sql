@@ -2,4 +2,60 @@ CREATE TABLE users (
     id SERIAL PRIMARY KEY,
     username VARCHAR(50) NOT NULL UNIQUE,
     password_hash VARCHAR(200) NOT NULL -- Argon2
-);
\ No newline at end of file
+);
+
+-- Invalidations of the user caches of every process (repository/user_cache.py), sent when the
+-- transaction commits. Only a digest of the new hash is sent: a process that made the change
+-- itself recognizes it and keeps its entry.
+CREATE FUNCTION notify_user_change() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('user_changes', json_build_object(
+        'username', OLD.username,
+        'password_hash_sha256', CASE WHEN TG_OP = 'UPDATE'
+            THEN encode(sha256(convert_to(NEW.password_hash, 'UTF8')), 'hex') END
+    )::text);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER users_notify_change AFTER UPDATE OR DELETE ON users
+    FOR EACH ROW EXECUTE FUNCTION notify_user_change();
+
+-- Transactional outbox: users to create or delete in workout-core. Rows are written in the
+-- same statement as the change to users, and deleted once workout-core acknowledged them.
+CREATE TABLE user_provisioning_outbox (
+    id BIGSERIAL PRIMARY KEY,
+    username VARCHAR(50) NOT NULL,
+    operation VARCHAR(10) NOT NULL CHECK (operation IN ('create', 'delete')),
+    created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at TIMESTAMPTZ NOT NULL DEFAULT now(),  -- Also the lease of claimed events
+    last_error TEXT,
+    traceparent VARCHAR(55)     -- Trace of the request that wrote the event, continued on delivery
+);
+
+CREATE INDEX user_provisioning_outbox_next_attempt_at ON user_provisioning_outbox (next_attempt_at);
+CREATE INDEX user_provisioning_outbox_username ON user_provisioning_outbox (username, id);
+
+-- Refresh tokens (see refresh_tokens.py). Only a SHA-256 digest of each token is stored.
+-- Rotated tokens are kept until they expire: presenting one again revokes its family.
+CREATE TABLE refresh_tokens (
+    token_hash BYTEA PRIMARY KEY,
+    user_id INTEGER NOT NULL REFERENCES users (id) ON DELETE CASCADE,   -- Revoked with the account
+    family_id BYTEA NOT NULL,       -- token_hash of the first token of the session (the login)
+    expires_at TIMESTAMPTZ NOT NULL,
+    rotated_at TIMESTAMPTZ          -- Set when exchanged for its successor on /refresh
+);
+
+CREATE INDEX refresh_tokens_user_id ON refresh_tokens (user_id);
+CREATE INDEX refresh_tokens_family_id ON refresh_tokens (family_id);
+CREATE INDEX refresh_tokens_expires_at ON refresh_tokens (expires_at);
+
+-- Login throttling token buckets (RATE_LIMIT_BACKEND=postgres, see rate_limiter.py). UNLOGGED:
+-- no WAL for these frequent writes, the limits are only reset if the database crashes.
+CREATE UNLOGGED TABLE login_rate_limits (
+    key VARCHAR(100) PRIMARY KEY,   -- Kind and SHA-256 of the value, e.g. "username:<64 hex digits>"
+    tokens DOUBLE PRECISION NOT NULL,
+    rate DOUBLE PRECISION NOT NULL,     -- Tokens regained per second
+    updated_at TIMESTAMPTZ NOT NULL
+);
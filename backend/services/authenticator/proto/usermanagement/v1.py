@@ -2,6 +2,7 @@
 # sources: user_management.proto
 # plugin: python-betterproto
 from dataclasses import dataclass
+from typing import List
 
 import betterproto
 import grpclib
@@ -27,6 +28,37 @@ class DeleteUserResponse(betterproto.Message):
     pass
 
 
+@dataclass
+class UserResult(betterproto.Message):
+    """
+    Outcome for one user of a batch. code is a gRPC status code (0 = OK).
+    """
+
+    id: str = betterproto.string_field(1)
+    code: int = betterproto.int32_field(2)
+    message: str = betterproto.string_field(3)
+
+
+@dataclass
+class CreateUsersRequest(betterproto.Message):
+    ids: List[str] = betterproto.string_field(1)
+
+
+@dataclass
+class CreateUsersResponse(betterproto.Message):
+    results: List["UserResult"] = betterproto.message_field(1)
+
+
+@dataclass
+class DeleteUsersRequest(betterproto.Message):
+    ids: List[str] = betterproto.string_field(1)
+
+
+@dataclass
+class DeleteUsersResponse(betterproto.Message):
+    results: List["UserResult"] = betterproto.message_field(1)
+
+
 class UserManagementServiceStub(betterproto.ServiceStub):
     async def create_user(self, *, id: str = "") -> CreateUserResponse:
         request = CreateUserRequest()
@@ -47,3 +79,25 @@ class UserManagementServiceStub(betterproto.ServiceStub):
             request,
             DeleteUserResponse,
         )
+
+    async def create_users(self, *, ids: List[str] = []) -> CreateUsersResponse:
+        """Batch variants: one round trip for many users."""
+
+        request = CreateUsersRequest()
+        request.ids = ids
+
+        return await self._unary_unary(
+            "/usermanagement.v1.UserManagementService/CreateUsers",
+            request,
+            CreateUsersResponse,
+        )
+
+    async def delete_users(self, *, ids: List[str] = []) -> DeleteUsersResponse:
+        request = DeleteUsersRequest()
+        request.ids = ids
+
+        return await self._unary_unary(
+            "/usermanagement.v1.UserManagementService/DeleteUsers",
+            request,
+            DeleteUsersResponse,
+        )
@@ -0,0 +1,150 @@
+import asyncio
+import random
+from collections import defaultdict
+from time import perf_counter
+
+from grpclib.const import Status
+from grpclib.exceptions import GRPCError
+
+from dependencies import database, OUTBOX_BATCH_SIZE, OUTBOX_POLL_INTERVAL, OUTBOX_LEASE, OUTBOX_MAX_BACKOFF
+from grpc_client import create_user, delete_user
+from repository import UserRepository, OutboxEvent, OutboxOperation
+from tracing import tracer, context_from_traceparent
+
+
+class ProvisioningWorker:
+    """
+    Delivers the provisioning outbox to workout-core in the background.
+
+    /signup and /delete-account only write the user change and its outbox event (in one
+    transaction) and return; this worker claims the due events in batches, sends them
+    concurrently (the gRPC micro-batcher turns them into batch RPCs) and removes the
+    delivered ones. Failed events are retried with exponential backoff, forever: the
+    outbox depth and lag in stats() show when workout-core is not keeping up.
+    """
+
+    def __init__(self, repository: UserRepository, create_user, delete_user, batch_size: int = 100,
+                 poll_interval: float = 1.0, lease: float = 30.0, max_backoff: float = 300.0) -> None:
+        self.__repository = repository
+        self.__senders = {OutboxOperation.CREATE: create_user, OutboxOperation.DELETE: delete_user}
+        self.__batch_size = batch_size
+        self.__poll_interval = poll_interval
+        self.__lease = lease
+        self.__max_backoff = max_backoff
+
+        self.__task: asyncio.Task | None = None
+        self.__wakeup: asyncio.Event | None = None
+        self.__delivered = 0
+        self.__failed_attempts = 0
+        self.__outbox = {"depth": None, "lag_seconds": None}
+        self.__outbox_checked_at = 0.0
+
+
+    def start(self) -> None:
+        self.__task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        if self.__task is not None:
+            self.__task.cancel()
+            try:
+                await self.__task
+            except asyncio.CancelledError:
+                pass
+            self.__task = None
+
+    def notify(self) -> None:
+        """
+        New events were written: deliver them now instead of at the next poll.
+        """
+        if self.__wakeup is not None:
+            self.__wakeup.set()
+
+
+    async def run(self) -> None:
+        """
+        Drain the outbox forever. Meant to run as a background task (see start()).
+        """
+
+        self.__wakeup = asyncio.Event()
+        while True:
+            try:
+                claimed = await self.run_once()
+            except Exception as e:
+                # E.g. the database is unavailable: keep the worker alive and try again later.
+                print(f"WARNING: Provisioning outbox delivery failed: {e!r}")
+                claimed = 0
+
+            if claimed < self.__batch_size:
+                await self.__wait()
+
+    async def run_once(self) -> int:
+        """
+        Deliver one batch of due events. Returns the number of events claimed.
+        """
+
+        events = await self.__repository.claim_outbox_events(self.__batch_size, self.__lease)
+        if events:
+            results = await asyncio.gather(*(self.__deliver(event) for event in events), return_exceptions=True)
+
+            delivered = [event.id for event, result in zip(events, results) if result is None]
+            retries = defaultdict(list)
+            for event, result in zip(events, results):
+                if result is not None:
+                    retries[(event.attempts, repr(result))].append(event.id)
+
+            if delivered:
+                await self.__repository.complete_outbox_events(delivered)
+            for (attempts, error), event_ids in retries.items():
+                await self.__repository.retry_outbox_events(event_ids, self.__backoff(attempts), error)
+            self.__delivered += len(delivered)
+            self.__failed_attempts += len(events) - len(delivered)
+
+        if perf_counter() - self.__outbox_checked_at >= self.__poll_interval:
+            self.__outbox = await self.__repository.outbox_stats()
+            self.__outbox_checked_at = perf_counter()
+        return len(events)
+
+
+    def stats(self) -> dict:
+        return {
+            "outbox_depth": self.__outbox["depth"],
+            "outbox_lag_seconds": self.__outbox["lag_seconds"],
+            "delivered": self.__delivered,
+            "failed_attempts": self.__failed_attempts,
+        }
+
+
+    async def __deliver(self, event: OutboxEvent) -> None:
+        # Continues the trace of the request that wrote the event (e.g. the /signup).
+        with tracer.start_as_current_span(
+            f"provision {event.operation.value}", context=context_from_traceparent(event.traceparent),
+            attributes={"outbox.event_id": event.id, "outbox.attempts": event.attempts},
+        ):
+            try:
+                await self.__senders[event.operation](event.username)
+            except GRPCError as e:
+                # A retried create may have succeeded the first time (e.g. the response was lost).
+                if not (event.operation == OutboxOperation.CREATE and e.status == Status.ALREADY_EXISTS):
+                    raise
+
+    def __backoff(self, attempts: int) -> float:
+        # 1 s, 2 s, 4 s... up to max_backoff, with jitter so failed events don't all come back at once.
+        delay = min(self.__max_backoff, 2.0 ** min(attempts - 1, 30))
+        return round(delay * random.uniform(0.5, 1.0), 3)
+
+    async def __wait(self) -> None:
+        try:
+            await asyncio.wait_for(self.__wakeup.wait(), timeout=self.__poll_interval)
+        except asyncio.TimeoutError:
+            pass
+        self.__wakeup.clear()
+
+
+# Singleton, started and stopped by the FastAPI lifespan (see auth_api.lifespan).
+provisioning_worker = ProvisioningWorker(
+    database, create_user, delete_user,
+    batch_size=OUTBOX_BATCH_SIZE,
+    poll_interval=OUTBOX_POLL_INTERVAL,
+    lease=OUTBOX_LEASE,
+    max_backoff=OUTBOX_MAX_BACKOFF,
+)
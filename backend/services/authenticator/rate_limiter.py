@@ -0,0 +1,284 @@
+"""
+Login throttling with token buckets, checked before any Argon2 work.
+
+/login and /delete-account take one token from the bucket of the username and one from
+the bucket of the client IP; if either is empty the request is answered with a 429 right
+away, without querying the user or verifying the password. A bucket holds at most `burst`
+tokens and gets `per_minute` new ones per minute.
+
+Two backends (RATE_LIMIT_BACKEND, see dependencies.py):
+    memory      buckets in the memory of each process: a rejection costs microseconds
+    postgres    buckets in the login_rate_limits table, shared by every worker and replica:
+                one round trip per request, still a fraction of an Argon2 verify
+"""
+import asyncio
+import hashlib
+import ipaddress
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import dataclass
+from time import monotonic
+
+import psycopg
+
+from repository import RepositoryUnavailableError
+from repository.connection_pool import PostgresConnectionPool, PoolSettings
+
+
+class RateLimitExceededError(Exception):
+    """
+    Raised when a bucket of the request is empty. The API answers it with a 429 and a
+    Retry-After header.
+    """
+
+    def __init__(self, retry_after: float) -> None:
+        super().__init__(f"Too many attempts, retry in {retry_after:.1f} s")
+        self.retry_after = retry_after
+
+
+@dataclass
+class RateLimit:
+    burst: int          # Attempts allowed in a row
+    per_minute: float   # Attempts regained per minute
+
+    @property
+    def rate(self) -> float:
+        return self.per_minute / 60
+
+
+def bucket_key(kind: str, value: str) -> str:
+    """
+    The key of a bucket: a digest of the value, so a key has the same size however long the
+    username sent to /login is.
+    """
+    return f"{kind}:{hashlib.sha256(value.encode()).hexdigest()}"
+
+
+def client_ip(peer: str | None, forwarded: str | None, trusted_proxies: list) -> str | None:
+    """
+    The IP of the client of a request: `forwarded` (the value of the header set by the
+    reverse proxy) if the peer is in one of the `trusted_proxies` networks, otherwise the
+    peer itself. Anyone else could send the header with any IP.
+    """
+    if forwarded and peer is not None:
+        try:
+            peer_address = ipaddress.ip_address(peer)
+        except ValueError:
+            return peer
+        if any(peer_address in network for network in trusted_proxies):
+            return forwarded.strip()
+    return peer
+
+
+class RateLimiter(ABC):
+    """
+    Token buckets keyed by kind and value (e.g. username="alice", ip="10.0.0.1"), with one
+    RateLimit per kind.
+    """
+
+    async def open(self) -> None:
+        pass
+
+    async def close(self) -> None:
+        pass
+
+    @abstractmethod
+    async def acquire(self, **keys: str | None) -> None:
+        """
+        Take one token from the bucket of each key (None values are skipped). Raises
+        RateLimitExceededError if any of them was empty.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def stats(self) -> dict:
+        raise NotImplementedError
+
+
+class InMemoryRateLimiter(RateLimiter):
+    """
+    Token buckets in the memory of this process.
+
+    The buckets are spread by key hash over `shards` LRU dicts, each with its own lock and
+    at most max_keys / shards buckets: the memory stays bounded however many usernames an
+    attacker cycles through, and the evicted bucket is the one refilled the longest ago.
+    """
+
+    def __init__(self, limits: dict[str, RateLimit], max_keys: int = 100_000, shards: int = 16, clock=monotonic) -> None:
+        self.__limits = limits
+        self.__shards: list[OrderedDict[str, list[float]]] = [OrderedDict() for _ in range(shards)]
+        self.__locks = [threading.Lock() for _ in range(shards)]
+        self.__shard_size = max(1, max_keys // shards)
+        self.__clock = clock
+        self.__allowed = 0
+        self.__rejected = 0
+        self.__evictions = 0
+
+
+    async def acquire(self, **keys: str | None) -> None:
+        self.check(**keys)
+
+    def check(self, **keys: str | None) -> None:
+        """
+        Same as acquire(), without the event loop (e.g. for the PostgresRateLimiter fallback).
+        """
+        now = self.__clock()
+        # Every bucket is charged, even if another one is empty.
+        retry_after = max([
+            self.__take(bucket_key(kind, value), self.__limits[kind], now) for kind, value in keys.items() if value is not None
+        ], default=0.0)
+        if retry_after > 0:
+            self.__rejected += 1
+            raise RateLimitExceededError(retry_after)
+        self.__allowed += 1
+
+    def stats(self) -> dict:
+        return {
+            "backend": "memory",
+            "keys": sum(len(shard) for shard in self.__shards),
+            "max_keys": self.__shard_size * len(self.__shards),
+            "allowed": self.__allowed,
+            "rejected": self.__rejected,
+            "evictions": self.__evictions,
+        }
+
+
+    def __take(self, key: str, limit: RateLimit, now: float) -> float:
+        """
+        Returns 0 if a token was taken, else the seconds until there is one.
+        """
+        index = hash(key) % len(self.__shards)
+        shard = self.__shards[index]
+        with self.__locks[index]:
+            bucket = shard.get(key)     # [tokens, last refill]
+            if bucket is None:
+                bucket = shard[key] = [float(limit.burst), now]
+                if len(shard) > self.__shard_size:
+                    shard.popitem(last=False)
+                    self.__evictions += 1
+            else:
+                shard.move_to_end(key)
+                bucket[0] = min(limit.burst, bucket[0] + (now - bucket[1]) * limit.rate)
+                bucket[1] = now
+
+            if bucket[0] >= 1:
+                bucket[0] -= 1
+                return 0.0
+            return (1 - bucket[0]) / limit.rate
+
+
+class PostgresRateLimiter(RateLimiter):
+    """
+    Token buckets in the login_rate_limits table (UNLOGGED: losing them in a crash only
+    resets the limits), shared by every process using the database.
+
+    One statement refills and takes the tokens of all the keys of a request; the row locks
+    serialize concurrent attempts on the same key. Rows idle long enough to be full again
+    are deleted every `prune_interval` seconds. If Postgres can't be reached within
+    `checkout_timeout`, requests are checked against per-process in-memory buckets instead
+    of failing the logins, and Postgres is tried again after `retry_interval` seconds.
+    """
+
+    TAKE_TOKENS = (
+        # EXCLUDED.tokens + 1 is the burst of the key (the row that would have been inserted).
+        "INSERT INTO login_rate_limits AS bucket (key, tokens, rate, updated_at) "
+        "SELECT key, burst - 1, rate, clock_timestamp() "
+        "FROM unnest(%s::text[], %s::float8[], %s::float8[]) AS request(key, burst, rate) "
+        "ORDER BY key "     # Same locking order in every statement: no deadlock
+        "ON CONFLICT (key) DO UPDATE SET "
+        "    tokens = LEAST(EXCLUDED.tokens + 1, "
+        "        bucket.tokens + EXTRACT(EPOCH FROM clock_timestamp() - bucket.updated_at) * EXCLUDED.rate) - 1, "
+        "    rate = EXCLUDED.rate, "
+        "    updated_at = clock_timestamp() "
+        "WHERE LEAST(EXCLUDED.tokens + 1, "
+        "    bucket.tokens + EXTRACT(EPOCH FROM clock_timestamp() - bucket.updated_at) * EXCLUDED.rate) >= 1 "
+        "RETURNING key"
+    )
+
+    def __init__(self, conn_details: dict, limits: dict[str, RateLimit], pool_size: int = 4,
+                 checkout_timeout: float = 0.5, retry_interval: float = 5.0, prune_interval: float = 60.0,
+                 fallback: InMemoryRateLimiter | None = None) -> None:
+        self.__pool = PostgresConnectionPool(
+            conn_details, PoolSettings(max_size=pool_size, checkout_timeout=checkout_timeout, open_timeout=0),
+            name="rate-limiter"
+        )
+        self.__limits = limits
+        self.__retry_interval = retry_interval
+        self.__unavailable_until = 0.0
+        self.__prune_interval = prune_interval
+        self.__pruned_at = monotonic()
+        self.__prune_task: asyncio.Task | None = None
+        self.__fallback = fallback or InMemoryRateLimiter(limits)
+        self.__allowed = 0
+        self.__rejected = 0
+        self.__fallbacks = 0
+
+    async def open(self) -> None:
+        await self.__pool.open()
+
+    async def close(self) -> None:
+        if self.__prune_task is not None:
+            await asyncio.gather(self.__prune_task, return_exceptions=True)
+        await self.__pool.close()
+
+
+    async def acquire(self, **keys: str | None) -> None:
+        if monotonic() < self.__unavailable_until:
+            self.__fallbacks += 1
+            self.__fallback.check(**keys)
+            return
+
+        requested = {bucket_key(kind, value): self.__limits[kind] for kind, value in keys.items() if value is not None}
+        try:
+            async with self.__pool.connection() as conn:
+                cursor = await conn.execute(self.TAKE_TOKENS, (
+                    list(requested), [limit.burst for limit in requested.values()],
+                    [limit.rate for limit in requested.values()]
+                ))
+                taken = {row[0] for row in await cursor.fetchall()}
+        except (RepositoryUnavailableError, psycopg.Error) as e:
+            # Fail open: the request is checked against the in-memory buckets instead.
+            if isinstance(e, (RepositoryUnavailableError, psycopg.OperationalError)):
+                self.__unavailable_until = monotonic() + self.__retry_interval
+            else:
+                print(f"WARNING: Login throttling query failed: {e!r}")
+            self.__fallbacks += 1
+            self.__fallback.check(**keys)
+            return
+
+        self.__schedule_prune()
+        empty = [limit for key, limit in requested.items() if key not in taken]
+        if empty:
+            self.__rejected += 1
+            # The bucket had less than one token: one is back within 1 / rate.
+            raise RateLimitExceededError(max(1 / limit.rate for limit in empty))
+        self.__allowed += 1
+
+    def stats(self) -> dict:
+        return {
+            "backend": "postgres",
+            "allowed": self.__allowed,
+            "rejected": self.__rejected,
+            "fallbacks": self.__fallbacks,
+            "pool": self.__pool.stats(),
+        }
+
+
+    def __schedule_prune(self) -> None:
+        if monotonic() - self.__pruned_at < self.__prune_interval:
+            return
+        self.__pruned_at = monotonic()
+        self.__prune_task = asyncio.create_task(self.__prune())
+
+    async def __prune(self) -> None:
+        # A bucket idle for longer than its full refill time is full: same as no row.
+        refill_seconds = max(limit.burst / limit.rate for limit in self.__limits.values())
+        try:
+            async with self.__pool.connection() as conn:
+                await conn.execute(
+                    "DELETE FROM login_rate_limits WHERE updated_at < clock_timestamp() - make_interval(secs => %s)",
+                    (refill_seconds,)
+                )
+        except (RepositoryUnavailableError, psycopg.Error) as e:
+            print(f"WARNING: Pruning login_rate_limits failed: {e!r}")
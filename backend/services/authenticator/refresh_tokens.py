@@ -0,0 +1,98 @@
+"""
+Opaque, rotating refresh tokens: an active session is renewed on POST /refresh, with one
+indexed query and one JWT signature, instead of a login and its Argon2 verify.
+
+    - A token is 256 random bits. Only its SHA-256 digest is stored (a fast hash is enough
+      for random secrets: Argon2 protects guessable passwords).
+    - It starts with the HashRing position of its username ("<16 hex digits>.<random>"),
+      so that with POSTGRES_SHARDS /refresh only queries the shard of the user. A token
+      without it is invalid.
+    - /login starts a family of tokens. Each /refresh exchanges the token for a new one of
+      the same family, valid for another `ttl` seconds: a session lasts as long as it is
+      used at least once per `ttl`.
+    - A rotated token presented again means two parties hold the session (e.g. a stolen
+      token): the whole family is revoked, and both have to log in again.
+    - Deleting the account deletes its tokens (ON DELETE CASCADE, see postgres/init.sql).
+"""
+import asyncio
+import hashlib
+import secrets
+
+from metrics import REFRESH_TOKEN_REUSES
+from repository import HashRing, UserRepository
+
+
+def new_refresh_token(username_hash: int) -> str:
+    return f"{username_hash:016x}.{secrets.token_urlsafe(32)}"
+
+def refresh_token_username_hash(token: str) -> int | None:
+    """
+    The username position carried by the token, or None if it is malformed.
+    """
+    prefix, dot, _ = token.partition(".")
+    if not dot or len(prefix) != 16:
+        return None
+    try:
+        return int(prefix, 16)
+    except ValueError:
+        return None
+
+def refresh_token_digest(token: str) -> bytes:
+    return hashlib.sha256(token.encode()).digest()
+
+
+class RefreshTokenManager:
+
+    def __init__(self, user_repository: UserRepository, ttl_seconds: float) -> None:
+        self.__user_repository = user_repository
+        self.__ttl_seconds = ttl_seconds
+
+
+    async def issue(self, username: str) -> str | None:
+        """
+        Start a new session of the user. Returns its first refresh token, or None if the
+        user doesn't exist (anymore).
+        """
+
+        token = new_refresh_token(HashRing.position(username))
+        if not await self.__user_repository.add_refresh_token(username, refresh_token_digest(token), self.__ttl_seconds):
+            return None
+        return token
+
+    async def rotate(self, token: str) -> tuple[str, str] | None:
+        """
+        Exchange a refresh token for the next one of its session.
+
+        Returns (username, new refresh token), or None if the token is unknown, expired or
+        was already rotated (then its session is revoked).
+        """
+
+        username_hash = refresh_token_username_hash(token)
+        if username_hash is None:
+            return None
+        new_token = new_refresh_token(username_hash)
+        rotation = await self.__user_repository.rotate_refresh_token(
+            refresh_token_digest(token), refresh_token_digest(new_token), self.__ttl_seconds, username_hash
+        )
+        if rotation.reused:
+            REFRESH_TOKEN_REUSES.inc()
+            print("WARNING: A rotated refresh token was reused, its session was revoked")
+        if rotation.username is None:
+            return None
+        return rotation.username, new_token
+
+
+async def prune_expired_refresh_tokens(repository: UserRepository, interval: float, batch_size: int = 1000) -> None:
+    """
+    Delete the expired refresh tokens every `interval` seconds, `batch_size` rows per
+    statement. Meant to run as a background task.
+    """
+
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            while await repository.delete_expired_refresh_tokens(batch_size) == batch_size:
+                pass
+        except Exception as e:
+            # E.g. the database is unavailable: try again at the next interval.
+            print(f"WARNING: Pruning refresh_tokens failed: {e!r}")
@@ -1,4 +1,13 @@
 from .user import *
+from .outbox_event import *
+from .refresh_token import *
+from .user_export import *
 from .repository import *
+from .connection_pool import *
 from .postgresql_repository import *
-from .mock_repository import *
\ No newline at end of file
+from .mock_repository import *
+from .delegating_repository import *
+from .username_filter import *
+from .read_replicas import *
+from .sharding import *
+from .user_cache import *
@@ -0,0 +1,128 @@
+from repository.repository import RepositoryUnavailableError
+
+from dataclasses import dataclass
+from time import perf_counter
+import contextlib
+
+import psycopg
+from psycopg_pool import AsyncConnectionPool, PoolTimeout
+
+@dataclass
+class PoolSettings:
+    """
+    Sizing and lifecycle parameters of the PostgreSQL connection pool.
+
+    Times are in seconds. See https://www.psycopg.org/psycopg3/docs/api/pool.html
+    """
+    min_size: int = 1
+    max_size: int = 10
+    max_idle: float = 300.0             # Idle connections above min_size are closed after this.
+    max_lifetime: float = 3600.0        # Connections are closed and replaced after this.
+    checkout_timeout: float = 5.0       # How long a request waits for a free connection.
+    check_on_checkout: bool = True      # Health check (cheap round trip) before handing a connection out.
+    open_timeout: float = 2.0           # How long open() waits for min_size connections (0: don't wait).
+    # Executions of a query on a connection before it becomes a server-side prepared statement
+    # (parsed and planned once per connection). None: never, e.g. behind PgBouncer in
+    # transaction pooling mode, where the next statement may run on another server connection.
+    prepare_threshold: int | None = 0
+
+
+class PostgresConnectionPool:
+    """
+    Application-scoped pool of async PostgreSQL connections.
+
+    Wraps psycopg's AsyncConnectionPool so connections are opened once and
+    reused across requests, and keeps track of how long callers wait to get one.
+    The pool is created closed: open() and close() must be called from the
+    FastAPI lifespan (see dependencies.startup / dependencies.shutdown).
+    """
+
+    def __init__(self, conn_details: dict, settings: PoolSettings | None = None, name: str = "authenticator") -> None:
+        self.__settings = settings or PoolSettings()
+        self.__pool = AsyncConnectionPool(
+            kwargs={**conn_details, "autocommit": True, "prepare_threshold": self.__settings.prepare_threshold},
+            min_size=self.__settings.min_size,
+            max_size=self.__settings.max_size,
+            max_idle=self.__settings.max_idle,
+            max_lifetime=self.__settings.max_lifetime,
+            timeout=self.__settings.checkout_timeout,
+            check=AsyncConnectionPool.check_connection if self.__settings.check_on_checkout else None,
+            name=name,
+            open=False,
+        )
+        self.__checkouts = 0
+        self.__checkout_timeouts = 0
+        self.__checkout_seconds_total = 0.0
+        self.__checkout_seconds_max = 0.0
+
+
+    async def open(self) -> None:
+        # wait=False: the service can start before the database accepts connections,
+        # the pool keeps trying in the background.
+        await self.__pool.open(wait=False)
+        if self.__settings.open_timeout > 0:
+            # The first requests find a connection ready instead of paying for the connect
+            # (and TLS handshake), but a database that is down doesn't hold the startup longer.
+            try:
+                await self.__pool.wait(timeout=self.__settings.open_timeout)
+            except PoolTimeout:
+                print(f"WARNING: No database connection after {self.__settings.open_timeout:g} s, starting anyway")
+
+    async def close(self) -> None:
+        await self.__pool.close()
+
+    @contextlib.asynccontextmanager
+    async def connection(self):
+        """
+        Borrow a connection from the pool and give it back when the block ends.
+
+        Raises RepositoryUnavailableError if no connection is available within
+        the checkout timeout, or if the connection is lost while the block uses it
+        (e.g. the database went down after the checkout).
+        """
+
+        start = perf_counter()
+        checked_out = False
+        try:
+            async with self.__pool.connection() as conn:
+                checked_out = True
+                self.__record_checkout(perf_counter() - start)
+                yield conn
+        except PoolTimeout as e:
+            if checked_out:
+                raise
+            self.__checkout_timeouts += 1
+            raise RepositoryUnavailableError("No database connection available") from e
+        except (psycopg.OperationalError, psycopg.InterfaceError) as e:
+            # InterfaceError: the connection was already closed.
+            raise RepositoryUnavailableError(f"Database connection lost: {e}") from e
+
+
+    def stats(self) -> dict:
+        """
+        Pool gauges and counters: connections in use, requests waiting and checkout latency.
+        """
+
+        pool_stats = self.__pool.get_stats()
+        pool_size = pool_stats.get("pool_size", 0)
+        pool_available = pool_stats.get("pool_available", 0)
+        return {
+            "min_size": self.__settings.min_size,
+            "max_size": self.__settings.max_size,
+            "connections_open": pool_size,
+            "connections_in_use": pool_size - pool_available,
+            "requests_waiting": pool_stats.get("requests_waiting", 0),
+            "connection_errors": pool_stats.get("connections_errors", 0),
+            "checkouts": self.__checkouts,
+            "checkout_timeouts": self.__checkout_timeouts,
+            "checkout_latency_seconds_avg": (
+                self.__checkout_seconds_total / self.__checkouts if self.__checkouts else 0.0
+            ),
+            "checkout_latency_seconds_max": self.__checkout_seconds_max,
+        }
+
+    def __record_checkout(self, elapsed: float) -> None:
+        self.__checkouts += 1
+        self.__checkout_seconds_total += elapsed
+        if elapsed > self.__checkout_seconds_max:
+            self.__checkout_seconds_max = elapsed
@@ -0,0 +1,89 @@
+from repository.user import User
+from repository.outbox_event import OutboxEvent
+from repository.refresh_token import RefreshTokenRotation
+from repository.user_export import UserExport
+from repository.repository import UserRepository
+
+class DelegatingUserRepository(UserRepository):
+    """
+    A UserRepository that forwards every call to another repository.
+
+    Base class for repositories that add behaviour in front of a real one
+    (e.g. BloomFilteredUserRepository): subclasses override only what they change.
+    """
+
+    def __init__(self, repository: UserRepository):
+        self._repository = repository
+
+    async def open(self) -> None:
+        await self._repository.open()
+
+    async def close(self) -> None:
+        await self._repository.close()
+
+    def stats(self) -> dict:
+        return self._repository.stats()
+
+    async def replication_lag(self) -> float:
+        return await self._repository.replication_lag()
+
+    async def get(self, username: str) -> User | None:
+        return await self._repository.get(username)
+
+    async def get_all(self) -> list[User]:
+        return await self._repository.get_all()
+
+    async def get_page(self, after_id: int | None, limit: int) -> list[User]:
+        return await self._repository.get_page(after_id, limit)
+
+    async def add_user(self, username: str, password_hash: str) -> None:
+        await self._repository.add_user(username, password_hash)
+
+    async def add_user_if_absent(self, username: str, password_hash: str) -> int | None:
+        return await self._repository.add_user_if_absent(username, password_hash)
+
+    async def update_hash(self, username: str, new_password_hash: str) -> None:
+        await self._repository.update_hash(username, new_password_hash)
+
+    async def delete(self, username: str) -> bool:
+        return await self._repository.delete(username)
+
+    async def delete_if_hash_matches(self, username: str, password_hash: str) -> bool:
+        return await self._repository.delete_if_hash_matches(username, password_hash)
+
+    async def check_if_username_already_exists(self, username: str) -> bool:
+        return await self._repository.check_if_username_already_exists(username)
+
+
+    async def claim_outbox_events(self, limit: int, lease_seconds: float) -> list[OutboxEvent]:
+        return await self._repository.claim_outbox_events(limit, lease_seconds)
+
+    async def complete_outbox_events(self, event_ids: list[int]) -> None:
+        await self._repository.complete_outbox_events(event_ids)
+
+    async def retry_outbox_events(self, event_ids: list[int], delay_seconds: float, error: str) -> None:
+        await self._repository.retry_outbox_events(event_ids, delay_seconds, error)
+
+    async def outbox_stats(self) -> dict:
+        return await self._repository.outbox_stats()
+
+
+    async def add_refresh_token(self, username: str, token_hash: bytes, ttl_seconds: float) -> bool:
+        return await self._repository.add_refresh_token(username, token_hash, ttl_seconds)
+
+    async def rotate_refresh_token(self, token_hash: bytes, new_token_hash: bytes, ttl_seconds: float,
+                                   username_hash: int) -> RefreshTokenRotation:
+        return await self._repository.rotate_refresh_token(token_hash, new_token_hash, ttl_seconds, username_hash)
+
+    async def delete_expired_refresh_tokens(self, limit: int) -> int:
+        return await self._repository.delete_expired_refresh_tokens(limit)
+
+
+    async def export_users(self, usernames: list[str]) -> list[UserExport]:
+        return await self._repository.export_users(usernames)
+
+    async def import_users(self, exports: list[UserExport]) -> None:
+        await self._repository.import_users(exports)
+
+    async def remove_users(self, exports: list[UserExport]) -> list[str]:
+        return await self._repository.remove_users(exports)
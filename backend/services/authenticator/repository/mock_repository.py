@@ -1,5 +1,12 @@
+import time
+from datetime import datetime, timezone
+
 from repository.user import User
+from repository.outbox_event import OutboxEvent, OutboxOperation
+from repository.refresh_token import RefreshTokenRotation, StoredRefreshToken
+from repository.user_export import UserExport, refresh_tokens_digest
 from repository import UserRepository
+from tracing import current_traceparent
 
 class MockRepository(UserRepository):
     """
@@ -9,6 +16,10 @@ class MockRepository(UserRepository):
     def __init__(self):
         """Initializes the mock database as an empty dictionary."""
         self.__mockDb = {}
+        self.__next_id = 1
+        self.__outbox: dict[int, dict] = {}     # Event id -> event fields, in insertion order.
+        self.__next_event_id = 1
+        self.__refresh_tokens: dict[bytes, dict] = {}     # Token hash -> token fields
 
     async def get(self, username: str) -> User | None:
         """
@@ -35,13 +46,37 @@ class MockRepository(UserRepository):
         return list(self.__mockDb.values())
 
 
+    async def get_page(self, after_id: int | None, limit: int) -> list[User]:
+        """
+        Retrieves up to `limit` users with id > after_id, ordered by id.
+        """
+
+        users = sorted(
+            (user for user in self.__mockDb.values() if user.id > (after_id or 0)),
+            key=lambda user: user.id
+        )
+        return users[:limit]
+
+
     async def add_user(self, username: str, password_hash: str) -> None:
         """
         Adds a new user with their username and password hash to the mock database.
         """
         if username not in self.__mockDb:     # Postgresql repository doesnt check that
-            new_user = User(username=username, password_hash=password_hash)
+            new_user = User(username=username, password_hash=password_hash, id=self.__next_id)
+            self.__next_id += 1
             self.__mockDb[username] = new_user
+            self.__add_outbox_event(username, OutboxOperation.CREATE)
+
+
+    async def add_user_if_absent(self, username: str, password_hash: str) -> int | None:
+        """
+        Adds the user unless the username is taken. Returns its id, or None if it was taken.
+        """
+        if username in self.__mockDb:
+            return None
+        await self.add_user(username, password_hash)
+        return self.__mockDb[username].id
 
 
     async def update_hash(self, username: str, new_password_hash: str) -> None:
@@ -52,12 +87,30 @@ class MockRepository(UserRepository):
             self.__mockDb[username].password_hash = new_password_hash
 
 
-    async def delete(self, username: str) -> None:
+    async def delete(self, username: str) -> bool:
         """
         Deletes a user from the mock database based on their username.
+        Returns True if the user existed.
         """
         if username in self.__mockDb:
             del self.__mockDb[username]
+            self.__add_outbox_event(username, OutboxOperation.DELETE)
+            self.__delete_refresh_tokens(username)
+            return True
+        return False
+
+
+    async def delete_if_hash_matches(self, username: str, password_hash: str) -> bool:
+        """
+        Deletes the user if its password hash is still the given one.
+        """
+        user = self.__mockDb.get(username)
+        if user is None or user.password_hash != password_hash:
+            return False
+        del self.__mockDb[username]
+        self.__add_outbox_event(username, OutboxOperation.DELETE)
+        self.__delete_refresh_tokens(username)
+        return True
 
 
     async def check_if_username_already_exists(self, username: str) -> bool:
@@ -67,5 +120,162 @@ class MockRepository(UserRepository):
 
         return username in self.__mockDb
     
+
+
+    async def claim_outbox_events(self, limit: int, lease_seconds: float) -> list[OutboxEvent]:
+        """
+        Claims up to `limit` due events, only the oldest one of each username.
+        """
+        now = time.time()
+        claimed, seen_usernames = [], set()
+        for event_id, event in self.__outbox.items():
+            if event["username"] in seen_usernames:
+                continue
+            seen_usernames.add(event["username"])
+            if event["next_attempt_at"] <= now and len(claimed) < limit:
+                event["attempts"] += 1
+                event["next_attempt_at"] = now + lease_seconds
+                claimed.append(OutboxEvent(
+                    id=event_id, username=event["username"], operation=event["operation"],
+                    attempts=event["attempts"], traceparent=event["traceparent"]
+                ))
+        return claimed
+
+
+    async def complete_outbox_events(self, event_ids: list[int]) -> None:
+        for event_id in event_ids:
+            self.__outbox.pop(event_id, None)
+
+
+    async def retry_outbox_events(self, event_ids: list[int], delay_seconds: float, error: str) -> None:
+        for event_id in event_ids:
+            if event_id in self.__outbox:
+                self.__outbox[event_id]["next_attempt_at"] = time.time() + delay_seconds
+                self.__outbox[event_id]["last_error"] = error
+
+
+    async def outbox_stats(self) -> dict:
+        oldest = min((event["created_at"] for event in self.__outbox.values()), default=None)
+        return {"depth": len(self.__outbox), "lag_seconds": time.time() - oldest if oldest else 0.0}
+
+
+    async def add_refresh_token(self, username: str, token_hash: bytes, ttl_seconds: float) -> bool:
+        if username not in self.__mockDb:
+            return False
+        self.__refresh_tokens[token_hash] = {
+            "username": username, "family_id": token_hash, "expires_at": time.time() + ttl_seconds, "rotated": False,
+        }
+        return True
+
+
+    async def rotate_refresh_token(self, token_hash: bytes, new_token_hash: bytes, ttl_seconds: float,
+                                   username_hash: int) -> RefreshTokenRotation:
+        token = self.__refresh_tokens.get(token_hash)
+        if token is None:
+            return RefreshTokenRotation()
+        if token["rotated"]:
+            self.__refresh_tokens = {
+                key: other for key, other in self.__refresh_tokens.items() if other["family_id"] != token["family_id"]
+            }
+            return RefreshTokenRotation(reused=True)
+        if token["expires_at"] <= time.time():
+            return RefreshTokenRotation()
+
+        token["rotated"] = True
+        self.__refresh_tokens[new_token_hash] = {
+            **token, "expires_at": time.time() + ttl_seconds, "rotated": False,
+        }
+        return RefreshTokenRotation(username=token["username"])
+
+
+    async def delete_expired_refresh_tokens(self, limit: int) -> int:
+        now = time.time()
+        expired = [key for key, token in self.__refresh_tokens.items() if token["expires_at"] <= now][:limit]
+        for key in expired:
+            del self.__refresh_tokens[key]
+        return len(expired)
+
+
+    async def export_users(self, usernames: list[str]) -> list[UserExport]:
+        wanted = set(usernames)
+        exports = {
+            user.username: UserExport(User(username=user.username, password_hash=user.password_hash, id=user.id))
+            for user in self.__mockDb.values() if user.username in wanted
+        }
+        for token_hash, token in self.__refresh_tokens.items():
+            if token["username"] in exports:
+                exports[token["username"]].refresh_tokens.append(StoredRefreshToken(
+                    token_hash=token_hash, family_id=token["family_id"],
+                    expires_at=datetime.fromtimestamp(token["expires_at"], timezone.utc),
+                    rotated_at=datetime.now(timezone.utc) if token["rotated"] else None,
+                ))
+        for event_id, event in self.__outbox.items():
+            if event["username"] in exports:
+                exports[event["username"]].outbox_events.append(OutboxEvent(
+                    id=event_id, username=event["username"], operation=event["operation"],
+                    attempts=event["attempts"], traceparent=event["traceparent"]
+                ))
+        return list(exports.values())
+
+
+    async def import_users(self, exports: list[UserExport]) -> None:
+        for export in exports:
+            username = export.user.username
+            inserted = username not in self.__mockDb
+            if inserted:
+                self.__mockDb[username] = User(username=username, password_hash=export.user.password_hash, id=self.__next_id)
+                self.__next_id += 1
+            else:
+                self.__mockDb[username].password_hash = export.user.password_hash
+
+            self.__delete_refresh_tokens(username)
+            for token in export.refresh_tokens:
+                self.__refresh_tokens[token.token_hash] = {
+                    "username": username, "family_id": token.family_id,
+                    "expires_at": token.expires_at.timestamp(), "rotated": token.rotated_at is not None,
+                }
+            if inserted:
+                for event in export.outbox_events:
+                    self.__add_outbox_event(username, event.operation, event.attempts, event.traceparent)
+
+
+    async def remove_users(self, exports: list[UserExport]) -> list[str]:
+        removed = []
+        for export in exports:
+            user = export.user
+            stored = self.__mockDb.get(user.username)
+            tokens_digest = refresh_tokens_digest(
+                (token_hash, token["rotated"]) for token_hash, token in self.__refresh_tokens.items()
+                if token["username"] == user.username
+            )
+            if (stored is not None and stored.password_hash == user.password_hash
+                    and tokens_digest == export.refresh_tokens_digest()):
+                del self.__mockDb[user.username]
+                self.__delete_refresh_tokens(user.username)
+                self.__outbox = {
+                    event_id: event for event_id, event in self.__outbox.items() if event["username"] != user.username
+                }
+                removed.append(user.username)
+        return removed
+
+    def __delete_refresh_tokens(self, username: str) -> None:
+        # The refresh_tokens rows reference the user ON DELETE CASCADE.
+        self.__refresh_tokens = {
+            key: token for key, token in self.__refresh_tokens.items() if token["username"] != username
+        }
+
+    def __add_outbox_event(self, username: str, operation: OutboxOperation, attempts: int = 0,
+                           traceparent: str | None = None) -> None:
+        now = time.time()
+        self.__outbox[self.__next_event_id] = {
+            "username": username, "operation": operation, "attempts": attempts, "created_at": now,
+            "next_attempt_at": now, "last_error": None, "traceparent": traceparent or current_traceparent(),
+        }
+        self.__next_event_id += 1
+
     def clear(self):
-        self.__mockDb = {}
\ No newline at end of file
+        self.__mockDb = {}
+        self.__next_id = 1
+        self.__outbox = {}
+        self.__next_event_id = 1
+        self.__refresh_tokens = {}
\ No newline at end of file
@@ -0,0 +1,17 @@
+from dataclasses import dataclass
+from enum import Enum
+
+class OutboxOperation(str, Enum):
+    CREATE = "create"
+    DELETE = "delete"
+
+@dataclass
+class OutboxEvent:
+    """
+    A user to create or delete in workout-core, waiting in the provisioning outbox.
+    """
+    id: int
+    username: str
+    operation: OutboxOperation
+    attempts: int = 0
+    traceparent: str | None = None     # W3C trace context of the request that wrote the event
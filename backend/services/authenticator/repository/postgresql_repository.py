@@ -1,19 +1,31 @@
 from repository.user import User
+from repository.outbox_event import OutboxEvent, OutboxOperation
+from repository.refresh_token import RefreshTokenRotation, StoredRefreshToken
+from repository.user_export import UserExport
 from repository import UserRepository
+from repository.connection_pool import PostgresConnectionPool, PoolSettings
 
-import psycopg
 import contextlib
 
+from opentelemetry.trace import SpanKind
+
+from metrics import stage
+from tracing import tracer, current_traceparent
+
 class PostgresqlUserRepository(UserRepository):
     """
     A repository class for managing User data in a PostgreSQL database.
 
     This class implements the UserRepository interface for PostgreSQL, handling
     database connections, and CRUD-like operations for users.
+
+    Connections come from a PostgresConnectionPool, which must be opened
+    with open() before the first query and closed with close() on shutdown.
     """
 
 
-    def __init__(self, database_name, database_user, database_password, host_database, port_database):
+    def __init__(self, database_name, database_user, database_password, host_database, port_database,
+                 pool_settings: PoolSettings | None = None):
         self.__conn_details = {
             "dbname": database_name,
             "user": database_user,
@@ -21,18 +33,45 @@ class PostgresqlUserRepository(UserRepository):
             "host": host_database,
             "port": port_database
         }
+        self.__pool = PostgresConnectionPool(self.__conn_details, pool_settings)
+
+    async def open(self) -> None:
+        await self.__pool.open()
+
+    async def close(self) -> None:
+        await self.__pool.close()
+
+    def stats(self) -> dict:
+        return {"pool": self.__pool.stats()}
+
+    async def replication_lag(self) -> float:
+        """
+        Replay delay of a streaming replica: 0 once it replayed all the WAL it received (an
+        idle primary doesn't make it lag), and 0 on a primary. Not traced: it is polled by
+        ReplicaRoutingUserRepository, outside of any request.
+        """
+        async with self.__pool.connection() as conn:
+            cursor = await conn.execute(
+                "SELECT CASE WHEN NOT pg_is_in_recovery() "
+                "    OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+                "    ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END::float8"
+            )
+            return (await cursor.fetchone())[0]
 
     @contextlib.asynccontextmanager     # So it is possible to call in a 'with' statement.
-    async def __connect(self):
+    async def __connect(self, operation: str):
         """
-        A private context manager to establish and manage a database connection.
+        A private context manager that borrows a pooled connection and yields a cursor.
+        `operation` (the repository method) names the trace span.
         """
 
-        # https://www.psycopg.org/psycopg3/docs/advanced/async.html
-        # AsyncConnectionPool would have better performance
-        async with await psycopg.AsyncConnection.connect(**self.__conn_details, autocommit=True) as conn:
-            async with conn.cursor() as cur:
-              yield cur
+        with stage("repository"), tracer.start_as_current_span(
+            f"postgres {operation}", kind=SpanKind.CLIENT,
+            attributes={"db.system.name": "postgresql", "db.operation.name": operation},
+        ):
+            async with self.__pool.connection() as conn:
+                async with conn.cursor() as cur:
+                    yield cur
         
 
     async def get(self, username: str) -> User | None:
@@ -46,7 +85,7 @@ class PostgresqlUserRepository(UserRepository):
             User: The User object if found, otherwise returns None. 
         """
 
-        async with self.__connect() as cursor:
+        async with self.__connect("get") as cursor:
             await cursor.execute(
                 "SELECT username, password_hash, id FROM users WHERE username = %s",
                 (username,)
@@ -67,7 +106,7 @@ class PostgresqlUserRepository(UserRepository):
 
         sql_query = "SELECT username, password_hash, id FROM users"
         users_list: list[User] = [] 
-        async with self.__connect() as cursor:
+        async with self.__connect("get_all") as cursor:
             await cursor.execute(sql_query)
             rows = await cursor.fetchall()
             for row in rows:
@@ -75,48 +114,358 @@ class PostgresqlUserRepository(UserRepository):
         return users_list
 
 
+    async def get_page(self, after_id: int | None, limit: int) -> list[User]:
+        """
+        Keyset pagination on the primary key: each page is an index range scan,
+        however deep into the table it is (unlike OFFSET).
+        """
+        async with self.__connect("get_page") as cursor:
+            await cursor.execute(
+                "SELECT username, password_hash, id FROM users WHERE id > %s ORDER BY id LIMIT %s",
+                (after_id or 0, limit)
+            )
+            return [User(username=row[0], password_hash=row[1], id=row[2]) for row in await cursor.fetchall()]
+
+
     async def add_user(self, username: str, password_hash: str) -> None:
         """
-        Adds a new user with their username and password hash to the database.
+        Adds a new user with their username and password hash to the database,
+        and its 'create' event to the outbox (one statement, so one transaction).
         """
-        async with self.__connect() as cursor:
+        async with self.__connect("add_user") as cursor:
             await cursor.execute(
-                "INSERT INTO users (username, password_hash) VALUES (%s, %s)",
-                (username, password_hash)
+                "WITH new_user AS ("
+                "    INSERT INTO users (username, password_hash) VALUES (%s, %s) RETURNING username"
+                ") "
+                "INSERT INTO user_provisioning_outbox (username, operation, traceparent) "
+                "SELECT username, 'create', %s FROM new_user",
+                (username, password_hash, current_traceparent())
             )
 
 
+    async def add_user_if_absent(self, username: str, password_hash: str) -> int | None:
+        """
+        Inserts the user in one round trip; the UNIQUE constraint on username
+        resolves concurrent sign-ups with the same name.
+        """
+        async with self.__connect("add_user_if_absent") as cursor:
+            await cursor.execute(
+                "WITH new_user AS ("
+                "    INSERT INTO users (username, password_hash) VALUES (%s, %s) "
+                "    ON CONFLICT (username) DO NOTHING RETURNING id, username"
+                "), event AS ("
+                "    INSERT INTO user_provisioning_outbox (username, operation, traceparent) "
+                "    SELECT username, 'create', %s FROM new_user"
+                ") "
+                "SELECT id FROM new_user",
+                (username, password_hash, current_traceparent())
+            )
+            row = await cursor.fetchone()
+            return row[0] if row else None
+
+
     async def update_hash(self, username: str, new_password_hash: str) -> None:
         """
         Updates the password hash for an existing user identified by their username.
         """
-        async with self.__connect() as cursor:
+        async with self.__connect("update_hash") as cursor:
               await cursor.execute(
                    "UPDATE users SET password_hash=%s WHERE username=%s",
                    (new_password_hash, username)
               )
 
 
-    async def delete(self, username: str) -> None:
+    async def delete(self, username: str) -> bool:
         """
-        Deletes a user from the database based on their username.
+        Deletes a user from the database based on their username, and adds its
+        'delete' event to the outbox. Returns True if the user existed.
         """
-        async with self.__connect() as cursor:
+        async with self.__connect("delete") as cursor:
             await cursor.execute(
-                "DELETE FROM users WHERE username = %s",
-                (username,)
+                "WITH deleted AS ("
+                "    DELETE FROM users WHERE username = %s RETURNING username"
+                "), event AS ("
+                "    INSERT INTO user_provisioning_outbox (username, operation, traceparent) "
+                "    SELECT username, 'delete', %s FROM deleted"
+                ") "
+                "SELECT 1 FROM deleted",
+                (username, current_traceparent())
             )
+            return await cursor.fetchone() is not None
+
+
+    async def delete_if_hash_matches(self, username: str, password_hash: str) -> bool:
+        """
+        Deletes the user if its password hash is still the given one.
+        """
+        async with self.__connect("delete_if_hash_matches") as cursor:
+            await cursor.execute(
+                "WITH deleted AS ("
+                "    DELETE FROM users WHERE username = %s AND password_hash = %s RETURNING username"
+                "), event AS ("
+                "    INSERT INTO user_provisioning_outbox (username, operation, traceparent) "
+                "    SELECT username, 'delete', %s FROM deleted"
+                ") "
+                "SELECT 1 FROM deleted",
+                (username, password_hash, current_traceparent())
+            )
+            return await cursor.fetchone() is not None
 
 
     async def check_if_username_already_exists(self, username: str) -> bool:
         """
         Checks if a username already exists in the users table.
         """
-        async with self.__connect() as cursor:
+        async with self.__connect("check_if_username_already_exists") as cursor:
             await cursor.execute(
                 "SELECT 1 FROM users WHERE username = %s",
                 (username,)
             )
             result = await cursor.fetchone()
 
-            return result is not None
\ No newline at end of file
+            return result is not None
+
+
+    async def claim_outbox_events(self, limit: int, lease_seconds: float) -> list[OutboxEvent]:
+        """
+        SKIP LOCKED lets several workers (e.g. one per process) claim disjoint events,
+        and the lease is the new next_attempt_at.
+        """
+        async with self.__connect("claim_outbox_events") as cursor:
+            await cursor.execute(
+                "WITH due AS ("
+                "    SELECT id FROM user_provisioning_outbox AS event "
+                "    WHERE next_attempt_at <= now() AND NOT EXISTS ("
+                "        SELECT 1 FROM user_provisioning_outbox AS earlier "
+                "        WHERE earlier.username = event.username AND earlier.id < event.id"
+                "    ) "
+                "    ORDER BY id LIMIT %s FOR UPDATE SKIP LOCKED"
+                ") "
+                "UPDATE user_provisioning_outbox AS event "
+                "SET attempts = event.attempts + 1, next_attempt_at = now() + make_interval(secs => %s) "
+                "FROM due WHERE event.id = due.id "
+                "RETURNING event.id, event.username, event.operation, event.attempts, event.traceparent",
+                (limit, lease_seconds)
+            )
+            rows = sorted(await cursor.fetchall())
+            return [
+                OutboxEvent(
+                    id=row[0], username=row[1], operation=OutboxOperation(row[2]), attempts=row[3], traceparent=row[4]
+                )
+                for row in rows
+            ]
+
+
+    async def complete_outbox_events(self, event_ids: list[int]) -> None:
+        async with self.__connect("complete_outbox_events") as cursor:
+            await cursor.execute(
+                "DELETE FROM user_provisioning_outbox WHERE id = ANY(%s)",
+                (event_ids,)
+            )
+
+
+    async def retry_outbox_events(self, event_ids: list[int], delay_seconds: float, error: str) -> None:
+        async with self.__connect("retry_outbox_events") as cursor:
+            await cursor.execute(
+                "UPDATE user_provisioning_outbox "
+                "SET next_attempt_at = now() + make_interval(secs => %s), last_error = %s "
+                "WHERE id = ANY(%s)",
+                (delay_seconds, error, event_ids)
+            )
+
+
+    async def outbox_stats(self) -> dict:
+        async with self.__connect("outbox_stats") as cursor:
+            await cursor.execute(
+                "SELECT count(*), COALESCE(EXTRACT(EPOCH FROM now() - min(created_at)), 0)::float8 "
+                "FROM user_provisioning_outbox"
+            )
+            depth, lag_seconds = await cursor.fetchone()
+            return {"depth": depth, "lag_seconds": lag_seconds}
+
+
+    async def add_refresh_token(self, username: str, token_hash: bytes, ttl_seconds: float) -> bool:
+        """
+        The first token of a family is its own family_id.
+        """
+        async with self.__connect("add_refresh_token") as cursor:
+            await cursor.execute(
+                "INSERT INTO refresh_tokens (token_hash, user_id, family_id, expires_at) "
+                "SELECT %s, id, %s, now() + make_interval(secs => %s) FROM users WHERE username = %s",
+                (token_hash, token_hash, ttl_seconds, username)
+            )
+            return cursor.rowcount == 1
+
+
+    async def rotate_refresh_token(self, token_hash: bytes, new_token_hash: bytes, ttl_seconds: float,
+                                   username_hash: int) -> RefreshTokenRotation:
+        """
+        One statement on the primary key for a valid token. Of two concurrent rotations of
+        the same token, the second one waits for the row lock, then finds it rotated.
+        """
+        async with self.__connect("rotate_refresh_token") as cursor:
+            await cursor.execute(
+                "WITH rotated AS ("
+                "    UPDATE refresh_tokens SET rotated_at = now() "
+                "    WHERE token_hash = %s AND rotated_at IS NULL AND expires_at > now() "
+                "    RETURNING user_id, family_id"
+                "), issued AS ("
+                "    INSERT INTO refresh_tokens (token_hash, user_id, family_id, expires_at) "
+                "    SELECT %s, user_id, family_id, now() + make_interval(secs => %s) FROM rotated"
+                ") "
+                "SELECT users.username FROM rotated JOIN users ON users.id = rotated.user_id",
+                (token_hash, new_token_hash, ttl_seconds)
+            )
+            row = await cursor.fetchone()
+            if row:
+                return RefreshTokenRotation(username=row[0])
+
+            await cursor.execute(
+                "DELETE FROM refresh_tokens WHERE family_id = ("
+                "    SELECT family_id FROM refresh_tokens WHERE token_hash = %s AND rotated_at IS NOT NULL"
+                ")",
+                (token_hash,)
+            )
+            return RefreshTokenRotation(reused=cursor.rowcount > 0)
+
+
+    async def delete_expired_refresh_tokens(self, limit: int) -> int:
+        async with self.__connect("delete_expired_refresh_tokens") as cursor:
+            await cursor.execute(
+                "DELETE FROM refresh_tokens WHERE token_hash IN ("
+                "    SELECT token_hash FROM refresh_tokens WHERE expires_at <= now() LIMIT %s"
+                ")",
+                (limit,)
+            )
+            return cursor.rowcount
+
+
+    async def export_users(self, usernames: list[str]) -> list[UserExport]:
+        """
+        The three queries are sent together (pipeline mode): one round trip instead of three.
+        """
+        async with self.__connect("export_users") as cursor:
+            conn = cursor.connection
+            async with conn.pipeline():
+                users = await conn.execute(
+                    "SELECT username, password_hash, id FROM users WHERE username = ANY(%s) ORDER BY id",
+                    (usernames,)
+                )
+                tokens = await conn.execute(
+                    "SELECT users.id, token_hash, family_id, expires_at, rotated_at "
+                    "FROM refresh_tokens JOIN users ON users.id = refresh_tokens.user_id "
+                    "WHERE users.username = ANY(%s)",
+                    (usernames,)
+                )
+                events = await conn.execute(
+                    "SELECT id, username, operation, attempts, traceparent FROM user_provisioning_outbox "
+                    "WHERE username = ANY(%s) ORDER BY id",
+                    (usernames,)
+                )
+
+            exports = {
+                row[2]: UserExport(User(username=row[0], password_hash=row[1], id=row[2]))
+                for row in await users.fetchall()
+            }
+            # Each query has its own snapshot: rows of users added since the first one are skipped.
+            for row in await tokens.fetchall():
+                if row[0] in exports:
+                    exports[row[0]].refresh_tokens.append(StoredRefreshToken(*row[1:]))
+            by_username = {export.user.username: export for export in exports.values()}
+            for row in await events.fetchall():
+                if row[1] in by_username:
+                    by_username[row[1]].outbox_events.append(OutboxEvent(
+                        id=row[0], username=row[1], operation=OutboxOperation(row[2]), attempts=row[3], traceparent=row[4]
+                    ))
+            return list(exports.values())
+
+
+    async def import_users(self, exports: list[UserExport]) -> None:
+        """
+        One statement (so one transaction) per user, and executemany() sends them all in
+        pipeline mode: one round trip for the batch. `xmax = 0` tells a new row from an
+        updated one; the outbox events are only copied with a new row.
+        """
+        async with self.__connect("import_users") as cursor:
+            await cursor.executemany(
+                "WITH imported AS ("
+                "    INSERT INTO users (username, password_hash) VALUES (%s, %s) "
+                "    ON CONFLICT (username) DO UPDATE SET password_hash = EXCLUDED.password_hash "
+                "    RETURNING id, xmax = 0 AS inserted"
+                "), stale_tokens AS ("
+                "    DELETE FROM refresh_tokens USING imported "
+                "    WHERE refresh_tokens.user_id = imported.id AND token_hash <> ALL(%s::bytea[])"
+                "), tokens AS ("
+                "    INSERT INTO refresh_tokens (token_hash, user_id, family_id, expires_at, rotated_at) "
+                "    SELECT token.token_hash, imported.id, token.family_id, token.expires_at, token.rotated_at "
+                "    FROM imported, unnest(%s::bytea[], %s::bytea[], %s::timestamptz[], %s::timestamptz[]) "
+                "        AS token(token_hash, family_id, expires_at, rotated_at) "
+                "    ON CONFLICT (token_hash) DO UPDATE SET user_id = EXCLUDED.user_id, family_id = EXCLUDED.family_id, "
+                "        expires_at = EXCLUDED.expires_at, rotated_at = EXCLUDED.rotated_at"
+                "), events AS ("
+                "    INSERT INTO user_provisioning_outbox (username, operation, attempts, traceparent) "
+                "    SELECT %s, event.operation, event.attempts, event.traceparent "
+                "    FROM imported, unnest(%s::text[], %s::int[], %s::text[]) WITH ORDINALITY "
+                "        AS event(operation, attempts, traceparent, position) "
+                "    WHERE imported.inserted ORDER BY event.position"
+                ") "
+                "SELECT 1",
+                [self.__import_params(export) for export in exports]
+            )
+
+    @staticmethod
+    def __import_params(export: UserExport) -> tuple:
+        tokens, events = export.refresh_tokens, export.outbox_events
+        token_hashes = [token.token_hash for token in tokens]
+        return (
+            export.user.username, export.user.password_hash,
+            token_hashes,
+            token_hashes, [token.family_id for token in tokens],
+            [token.expires_at for token in tokens], [token.rotated_at for token in tokens],
+            export.user.username,
+            [event.operation.value for event in events], [event.attempts for event in events],
+            [event.traceparent for event in events],
+        )
+
+
+    async def remove_users(self, exports: list[UserExport]) -> list[str]:
+        """
+        The refresh tokens go with the users (ON DELETE CASCADE).
+
+        The rows are locked first, tokens then users (the order in which rotate_refresh_token
+        and add_refresh_token lock them): a rotation or an issue in progress is waited for,
+        and is seen by the DELETE, whose snapshot is taken after the locks. Later ones wait
+        for the removal, then find no user.
+        """
+        usernames = [export.user.username for export in exports]
+        async with self.__connect("remove_users") as cursor:
+            async with cursor.connection.transaction():
+                await cursor.execute(
+                    "SELECT 1 FROM refresh_tokens JOIN users ON users.id = refresh_tokens.user_id "
+                    "WHERE users.username = ANY(%s) FOR UPDATE OF refresh_tokens",
+                    (usernames,)
+                )
+                await cursor.execute("SELECT 1 FROM users WHERE username = ANY(%s) FOR UPDATE", (usernames,))
+                await cursor.execute(
+                    "WITH removed AS ("
+                    "    DELETE FROM users "
+                    "    USING unnest(%s::text[], %s::text[], %s::bytea[]) AS moved(username, password_hash, tokens_digest) "
+                    "    WHERE users.username = moved.username AND users.password_hash = moved.password_hash "
+                    "    AND moved.tokens_digest = ("
+                    "        SELECT sha256(coalesce(string_agg("
+                    "            token_hash || CASE WHEN rotated_at IS NULL THEN '\\x00'::bytea ELSE '\\x01'::bytea END, "
+                    "            ''::bytea ORDER BY token_hash"
+                    "        ), ''::bytea)) "
+                    "        FROM refresh_tokens WHERE refresh_tokens.user_id = users.id"
+                    "    ) "
+                    "    RETURNING users.username"
+                    "), events AS ("
+                    "    DELETE FROM user_provisioning_outbox WHERE username IN (SELECT username FROM removed)"
+                    ") "
+                    "SELECT username FROM removed",
+                    (
+                        usernames, [export.user.password_hash for export in exports],
+                        [export.refresh_tokens_digest() for export in exports],
+                    )
+                )
+                return [row[0] for row in await cursor.fetchall()]
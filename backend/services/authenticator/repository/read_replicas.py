@@ -0,0 +1,179 @@
+from repository.user import User
+from repository.repository import UserRepository, RepositoryUnavailableError
+from repository.delegating_repository import DelegatingUserRepository
+
+import asyncio
+from collections import OrderedDict
+from time import monotonic
+
+import psycopg
+
+
+class ReplicaRoutingUserRepository(DelegatingUserRepository):
+    """
+    Sends the user lookups to read replicas and everything else to the primary.
+
+    get(), check_if_username_already_exists() and the enumerations (get_all, get_page,
+    iter_users) go to the healthy replicas in turn. Writes, the outbox and the refresh
+    tokens stay on the primary (the wrapped repository).
+
+    Replication is asynchronous, so a replica can be behind the primary:
+        - For `read_your_writes` seconds after this process changed a user, lookups of
+          that username go to the primary.
+        - A user that get() doesn't find on a replica is looked up on the primary, so a
+          sign-up served by another process or pod can log in right away. Only unknown
+          usernames cost a primary query (the username filter and the login throttling
+          keep those cheap).
+        - Every `check_interval` seconds each replica reports its replication lag. One
+          behind by more than `max_lag` seconds, or unreachable, gets no reads until a
+          later check finds it caught up. A replica failing a query is out until then too,
+          and the query is retried on the primary.
+    """
+
+    def __init__(self, primary: UserRepository, replicas: list[UserRepository], max_lag: float = 1.0,
+                 read_your_writes: float = 5.0, check_interval: float = 1.0, clock=monotonic):
+        super().__init__(primary)
+        self.__replicas = replicas
+        self.__healthy = [True] * len(replicas)
+        self.__lags = [0.0] * len(replicas)
+        self.__reads = [0] * len(replicas)
+        self.__next_replica = 0
+        self.__max_lag = max_lag
+        self.__read_your_writes = read_your_writes
+        self.__check_interval = check_interval
+        self.__clock = clock
+        # Username -> time of its last write, oldest first (the window is the same for all).
+        self.__recent_writes: OrderedDict[str, float] = OrderedDict()
+        self.__health_task: asyncio.Task | None = None
+        self.__primary_reads = 0
+        self.__recent_write_reads = 0
+        self.__confirmed_misses = 0
+        self.__fallbacks = 0
+
+    async def open(self) -> None:
+        await super().open()
+        await asyncio.gather(*(replica.open() for replica in self.__replicas))
+        await self.check_replicas()
+        self.__health_task = asyncio.create_task(self.__watch_replicas())
+
+    async def close(self) -> None:
+        if self.__health_task is not None:
+            self.__health_task.cancel()
+            await asyncio.gather(self.__health_task, return_exceptions=True)
+        await asyncio.gather(*(replica.close() for replica in self.__replicas))
+        await super().close()
+
+    async def check_replicas(self) -> None:
+        """
+        Ask every replica for its replication lag and update which ones get reads.
+        """
+        async def check(index: int, replica: UserRepository) -> None:
+            try:
+                self.__lags[index] = await replica.replication_lag()
+                self.__healthy[index] = self.__lags[index] <= self.__max_lag
+            except Exception:
+                self.__healthy[index] = False
+
+        await asyncio.gather(*(check(index, replica) for index, replica in enumerate(self.__replicas)))
+
+
+    async def get(self, username: str) -> User | None:
+        if self.__recently_written(username):
+            self.__recent_write_reads += 1
+            return await super().get(username)
+        user = await self.__read(lambda repository: repository.get(username))
+        if user is None:
+            # Maybe created after the replica's last replayed transaction.
+            self.__confirmed_misses += 1
+            return await super().get(username)
+        return user
+
+    async def check_if_username_already_exists(self, username: str) -> bool:
+        # A stale "no" is harmless: add_user_if_absent runs on the primary.
+        if self.__recently_written(username):
+            self.__recent_write_reads += 1
+            return await super().check_if_username_already_exists(username)
+        return await self.__read(lambda repository: repository.check_if_username_already_exists(username))
+
+    async def get_all(self) -> list[User]:
+        return await self.__read(lambda repository: repository.get_all())
+
+    async def get_page(self, after_id: int | None, limit: int) -> list[User]:
+        return await self.__read(lambda repository: repository.get_page(after_id, limit))
+
+
+    async def add_user(self, username: str, password_hash: str) -> None:
+        self.__record_write(username)
+        await super().add_user(username, password_hash)
+
+    async def add_user_if_absent(self, username: str, password_hash: str) -> int | None:
+        self.__record_write(username)
+        return await super().add_user_if_absent(username, password_hash)
+
+    async def update_hash(self, username: str, new_password_hash: str) -> None:
+        self.__record_write(username)
+        await super().update_hash(username, new_password_hash)
+
+    async def delete(self, username: str) -> bool:
+        self.__record_write(username)
+        return await super().delete(username)
+
+    async def delete_if_hash_matches(self, username: str, password_hash: str) -> bool:
+        self.__record_write(username)
+        return await super().delete_if_hash_matches(username, password_hash)
+
+
+    def stats(self) -> dict:
+        return {
+            **super().stats(),
+            "replicas": [
+                {"healthy": healthy, "lag_seconds": lag, "reads": reads, **replica.stats()}
+                for replica, healthy, lag, reads in zip(self.__replicas, self.__healthy, self.__lags, self.__reads)
+            ],
+            "primary_reads": self.__primary_reads,
+            "recent_write_reads": self.__recent_write_reads,
+            "confirmed_misses": self.__confirmed_misses,
+            "replica_fallbacks": self.__fallbacks,
+        }
+
+
+    async def __read(self, query):
+        """
+        Run `query(repository)` on the next healthy replica, or on the primary if there is
+        none or the replica fails.
+        """
+        index = self.__pick_replica()
+        if index is None:
+            self.__primary_reads += 1
+            return await query(self._repository)
+        try:
+            result = await query(self.__replicas[index])
+        except (RepositoryUnavailableError, psycopg.OperationalError):
+            self.__healthy[index] = False
+            self.__fallbacks += 1
+            return await query(self._repository)
+        self.__reads[index] += 1
+        return result
+
+    def __pick_replica(self) -> int | None:
+        for offset in range(len(self.__replicas)):
+            index = (self.__next_replica + offset) % len(self.__replicas)
+            if self.__healthy[index]:
+                self.__next_replica = index + 1
+                return index
+        return None
+
+    def __record_write(self, username: str) -> None:
+        self.__recent_writes[username] = self.__clock()
+        self.__recent_writes.move_to_end(username)
+
+    def __recently_written(self, username: str) -> bool:
+        expired_before = self.__clock() - self.__read_your_writes
+        while self.__recent_writes and next(iter(self.__recent_writes.values())) < expired_before:
+            self.__recent_writes.popitem(last=False)
+        return username in self.__recent_writes
+
+    async def __watch_replicas(self) -> None:
+        while True:
+            await asyncio.sleep(self.__check_interval)
+            await self.check_replicas()
@@ -0,0 +1,21 @@
+from dataclasses import dataclass
+from datetime import datetime
+
+@dataclass
+class RefreshTokenRotation:
+    """
+    Outcome of UserRepository.rotate_refresh_token.
+    """
+    username: str | None = None     # Owner of the token, if it was valid
+    reused: bool = False            # The token had already been rotated: its whole family was revoked
+
+
+@dataclass
+class StoredRefreshToken:
+    """
+    A row of refresh_tokens, as moved between databases by reshard.py.
+    """
+    token_hash: bytes
+    family_id: bytes
+    expires_at: datetime
+    rotated_at: datetime | None = None
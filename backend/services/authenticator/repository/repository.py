@@ -1,27 +1,206 @@
 from abc import ABC, abstractmethod
+from collections.abc import AsyncIterator
 from repository.user import User
+from repository.outbox_event import OutboxEvent
+from repository.refresh_token import RefreshTokenRotation
+from repository.user_export import UserExport
+
+class RepositoryUnavailableError(Exception):
+    """
+    Raised when the storage backend can't serve the request right now
+    (e.g. no free database connection). The API answers it with a 503.
+    """
+
 
 class UserRepository(ABC):
+    """
+    Storage of the users.
+
+    Every change that workout-core must mirror (a user created or deleted) also writes an
+    event to the provisioning outbox, atomically with the change itself. The events are
+    delivered in the background by the ProvisioningWorker (see provisioning_worker.py).
+
+    The refresh tokens of a user (see refresh_tokens.py) are stored with it, and deleted
+    with it.
+    """
+
+    async def open(self) -> None:
+        """
+        Acquire long-lived resources (e.g. a connection pool). Called once on application startup.
+        """
+
+    async def close(self) -> None:
+        """
+        Release the resources acquired by open(). Called once on application shutdown.
+        """
+
+    def stats(self) -> dict:
+        """
+        Runtime statistics of the repository (e.g. connection pool usage).
+        """
+        return {}
+
+    async def replication_lag(self) -> float:
+        """
+        Seconds this copy of the data is behind the primary database (0 on the primary).
+        Raises if the storage can't be reached.
+        """
+        return 0.0
+
     @abstractmethod
     async def get(self, username: str) -> User | None:
         raise NotImplementedError
 
     @abstractmethod
     async def get_all(self) -> list[User]:
+        """
+        Loads every user in memory: prefer iter_users() or get_page() on big tables.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_page(self, after_id: int | None, limit: int) -> list[User]:
+        """
+        Keyset pagination: up to `limit` users with id > after_id, ordered by id.
+        Pass the id of the last user of a page to get the next one (None for the first page).
+        """
         raise NotImplementedError
 
+    async def iter_users(self, batch_size: int = 1000) -> AsyncIterator[User]:
+        """
+        Yields every user, ordered by id, fetching `batch_size` users at a time.
+        Memory use doesn't depend on the table size.
+        """
+        after_id = None
+        while True:
+            page = await self.get_page(after_id, batch_size)
+            for user in page:
+                yield user
+            if len(page) < batch_size:
+                return
+            after_id = page[-1].id
+
     @abstractmethod
     async def add_user(self, username: str, password_hash: str) -> None:
         raise NotImplementedError
 
+    @abstractmethod
+    async def add_user_if_absent(self, username: str, password_hash: str) -> int | None:
+        """
+        Atomically insert the user unless the username is taken.
+        Returns the new user's id, or None if the username already exists.
+        """
+        raise NotImplementedError
+
     @abstractmethod
     async def update_hash(self, username: str, new_password_hash: str) -> None:
         raise NotImplementedError
 
     @abstractmethod
-    async def delete(self, username: str) -> None:
+    async def delete(self, username: str) -> bool:
+        """
+        Returns True if a user was deleted.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    async def delete_if_hash_matches(self, username: str, password_hash: str) -> bool:
+        """
+        Atomically delete the user only if its stored hash is still `password_hash`
+        (i.e. the one the password was just verified against).
+        Returns True if the user was deleted.
+        """
         raise NotImplementedError
 
     @abstractmethod
     async def check_if_username_already_exists(self, username: str) -> bool:
         raise NotImplementedError
+
+
+    @abstractmethod
+    async def claim_outbox_events(self, limit: int, lease_seconds: float) -> list[OutboxEvent]:
+        """
+        Claims up to `limit` due outbox events, ordered by id, and counts an attempt for each.
+        Only the oldest event of a username is claimable, so the events of a username are
+        delivered in order (e.g. a deletion before the sign-up that reuses the name).
+        Claimed events are hidden from other workers for `lease_seconds`: if the worker dies,
+        they are claimed again after that.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    async def complete_outbox_events(self, event_ids: list[int]) -> None:
+        """
+        Removes delivered events from the outbox.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    async def retry_outbox_events(self, event_ids: list[int], delay_seconds: float, error: str) -> None:
+        """
+        Makes failed events claimable again in `delay_seconds`.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    async def outbox_stats(self) -> dict:
+        """
+        Number of events waiting ("depth") and age of the oldest one in seconds ("lag_seconds").
+        """
+        raise NotImplementedError
+
+
+    @abstractmethod
+    async def add_refresh_token(self, username: str, token_hash: bytes, ttl_seconds: float) -> bool:
+        """
+        Stores the first refresh token of a new session (its family) of the user.
+        Returns False if the user doesn't exist.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    async def rotate_refresh_token(self, token_hash: bytes, new_token_hash: bytes, ttl_seconds: float,
+                                   username_hash: int) -> RefreshTokenRotation:
+        """
+        Atomically marks the token as rotated and stores its successor in the same family,
+        if the token is unexpired and was never rotated. A token that was already rotated is
+        being reused (e.g. it was stolen): every token of its family is deleted.
+
+        `username_hash` is the HashRing.position() of the owner's username, carried by the
+        token: ShardedUserRepository routes with it.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    async def delete_expired_refresh_tokens(self, limit: int) -> int:
+        """
+        Deletes up to `limit` expired refresh tokens. Returns how many were deleted.
+        """
+        raise NotImplementedError
+
+
+    # Moving users between databases (see reshard.py). Only the storage repositories
+    # implement them.
+
+    async def export_users(self, usernames: list[str]) -> list[UserExport]:
+        """
+        The users among `usernames` that exist, with their refresh tokens and pending
+        outbox events.
+        """
+        raise NotImplementedError
+
+    async def import_users(self, exports: list[UserExport]) -> None:
+        """
+        Stores exported users, without writing outbox events (they are moved, not created).
+        A user that is already stored (a copy from a previous attempt) gets the exported
+        hash and refresh tokens, and keeps its outbox events.
+        """
+        raise NotImplementedError
+
+    async def remove_users(self, exports: list[UserExport]) -> list[str]:
+        """
+        Deletes the exported users that are unchanged since their export (same hash and
+        same refresh tokens, none issued or rotated since), with their refresh tokens and
+        outbox events, without writing 'delete' events. Returns the usernames that were deleted.
+        """
+        raise NotImplementedError
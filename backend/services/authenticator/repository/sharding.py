@@ -0,0 +1,254 @@
+from repository.user import User
+from repository.outbox_event import OutboxEvent
+from repository.refresh_token import RefreshTokenRotation
+from repository.repository import UserRepository
+
+import asyncio
+import bisect
+import hashlib
+from collections import defaultdict
+from dataclasses import replace
+from math import ceil
+
+MAX_SHARDS = 1024   # Ids seen through ShardedUserRepository are local_id * MAX_SHARDS + shard index
+
+
+class HashRing:
+    """
+    Consistent hashing of usernames to shard names.
+
+    Each shard owns `points_per_shard` points of a 64-bit ring, and a key belongs to the
+    shard of the first point at or after its hash. Adding a shard to N shards moves about
+    1/(N+1) of the keys, all of them to the new shard.
+    """
+
+    def __init__(self, shards: list[str], points_per_shard: int = 160) -> None:
+        if not shards:
+            raise ValueError("A hash ring needs at least one shard")
+        points = sorted(
+            (self.position(f"{shard}#{point}"), shard) for shard in shards for point in range(points_per_shard)
+        )
+        self.__positions = [position for position, _ in points]
+        self.__shards = [shard for _, shard in points]
+        self.__names = list(shards)
+
+    @property
+    def shards(self) -> list[str]:
+        return list(self.__names)
+
+    def shard_for(self, key: str) -> str:
+        return self.shard_at(self.position(key))
+
+    def shard_at(self, position: int) -> str:
+        index = bisect.bisect_left(self.__positions, position)
+        return self.__shards[index % len(self.__shards)]
+
+    @staticmethod
+    def position(key: str) -> int:
+        """
+        Where the key falls on the ring, the same for every ring.
+        """
+        return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+
+class ShardedUserRepository(UserRepository):
+    """
+    Spreads the users over several databases (shards), by consistent hashing of the username.
+
+    Each shard is a complete repository (e.g. a PostgresqlUserRepository with its own
+    pool): a user, its refresh tokens and its outbox events live on the shard of its
+    username. Calls about one username go to that shard, as does the refresh token rotation
+    (the token carries the position of its username); enumerations and the outbox go to
+    every shard.
+
+    Ids are made unique across shards as local_id * MAX_SHARDS + shard index, which keeps
+    the keyset pagination of get_page() ordered and correct. The index of a shard is its
+    position in `shards`: new shards are appended, never inserted.
+
+    Resharding: when shards are added, `previous_shards` lists the shards of the ring the
+    rows are still placed by. Until reshard.py has moved every user to its new shard, a
+    username is looked up on its new shard, then on its previous one, and its writes go to
+    both (the previous one first, so they wait for the row locks of an ongoing move).
+    """
+
+    def __init__(self, shards: dict[str, UserRepository], previous_shards: list[str] | None = None,
+                 points_per_shard: int = 160) -> None:
+        if len(shards) > MAX_SHARDS:
+            raise ValueError(f"At most {MAX_SHARDS} shards")
+        unknown = set(previous_shards or []) - set(shards)
+        if unknown:
+            raise ValueError(f"Previous shards missing from the shards: {sorted(unknown)}")
+        self.__shards = shards
+        self.__names = list(shards)
+        self.__indexes = {name: index for index, name in enumerate(self.__names)}
+        self.__ring = HashRing(self.__names, points_per_shard)
+        self.__previous_ring = HashRing(previous_shards, points_per_shard) if previous_shards else None
+
+    @property
+    def ring(self) -> HashRing:
+        return self.__ring
+
+    @property
+    def shards(self) -> dict[str, UserRepository]:
+        return dict(self.__shards)
+
+    async def open(self) -> None:
+        await asyncio.gather(*(shard.open() for shard in self.__shards.values()))
+
+    async def close(self) -> None:
+        await asyncio.gather(*(shard.close() for shard in self.__shards.values()))
+
+    def stats(self) -> dict:
+        return {
+            "shards": {name: shard.stats() for name, shard in self.__shards.items()},
+            "resharding": self.__previous_ring is not None,
+        }
+
+    async def replication_lag(self) -> float:
+        return max(await asyncio.gather(*(shard.replication_lag() for shard in self.__shards.values())))
+
+
+    async def get(self, username: str) -> User | None:
+        for name in self.__owners(username):
+            user = await self.__shards[name].get(username)
+            if user is not None:
+                return self.__global_user(name, user)
+        return None
+
+    async def get_all(self) -> list[User]:
+        pages = await asyncio.gather(*(shard.get_all() for shard in self.__shards.values()))
+        users = [self.__global_user(name, user) for name, page in zip(self.__names, pages) for user in page]
+        return sorted(users, key=lambda user: user.id)
+
+    async def get_page(self, after_id: int | None, limit: int) -> list[User]:
+        """
+        The next `limit` users of every shard, merged: a global id after `after_id` is a
+        local id after (after_id - index) // MAX_SHARDS on the shard of that index.
+        """
+        after_id = after_id or 0
+        pages = await asyncio.gather(*(
+            self.__shards[name].get_page(max(0, (after_id - index) // MAX_SHARDS), limit)
+            for index, name in enumerate(self.__names)
+        ))
+        users = [self.__global_user(name, user) for name, page in zip(self.__names, pages) for user in page]
+        return sorted((user for user in users if user.id > after_id), key=lambda user: user.id)[:limit]
+
+    async def check_if_username_already_exists(self, username: str) -> bool:
+        for name in self.__owners(username):
+            if await self.__shards[name].check_if_username_already_exists(username):
+                return True
+        return False
+
+
+    async def add_user(self, username: str, password_hash: str) -> None:
+        await self.__shards[self.__ring.shard_for(username)].add_user(username, password_hash)
+
+    async def add_user_if_absent(self, username: str, password_hash: str) -> int | None:
+        owner, *previous = self.__owners(username)
+        for name in previous:
+            if await self.__shards[name].check_if_username_already_exists(username):
+                return None
+        user_id = await self.__shards[owner].add_user_if_absent(username, password_hash)
+        return self.__global_id(owner, user_id) if user_id is not None else None
+
+    async def update_hash(self, username: str, new_password_hash: str) -> None:
+        for name in reversed(self.__owners(username)):
+            await self.__shards[name].update_hash(username, new_password_hash)
+
+    async def delete(self, username: str) -> bool:
+        deleted = False
+        for name in reversed(self.__owners(username)):
+            deleted = await self.__shards[name].delete(username) or deleted
+        return deleted
+
+    async def delete_if_hash_matches(self, username: str, password_hash: str) -> bool:
+        deleted = False
+        for name in reversed(self.__owners(username)):
+            deleted = await self.__shards[name].delete_if_hash_matches(username, password_hash) or deleted
+        return deleted
+
+
+    async def claim_outbox_events(self, limit: int, lease_seconds: float) -> list[OutboxEvent]:
+        """
+        An equal share of `limit` from every shard, so no event is claimed beyond `limit`
+        (it would stay leased without being delivered).
+        """
+        share = ceil(limit / len(self.__shards))
+        claimed = await asyncio.gather(*(
+            shard.claim_outbox_events(share, lease_seconds) for shard in self.__shards.values()
+        ))
+        events = [
+            replace(event, id=self.__global_id(name, event.id))
+            for name, shard_events in zip(self.__names, claimed) for event in shard_events
+        ]
+        return sorted(events, key=lambda event: event.id)[:limit]
+
+    async def complete_outbox_events(self, event_ids: list[int]) -> None:
+        await asyncio.gather(*(
+            self.__shards[name].complete_outbox_events(ids) for name, ids in self.__local_ids(event_ids).items()
+        ))
+
+    async def retry_outbox_events(self, event_ids: list[int], delay_seconds: float, error: str) -> None:
+        await asyncio.gather(*(
+            self.__shards[name].retry_outbox_events(ids, delay_seconds, error)
+            for name, ids in self.__local_ids(event_ids).items()
+        ))
+
+    async def outbox_stats(self) -> dict:
+        stats = await asyncio.gather(*(shard.outbox_stats() for shard in self.__shards.values()))
+        return {
+            "depth": sum(shard_stats["depth"] for shard_stats in stats),
+            "lag_seconds": max(shard_stats["lag_seconds"] for shard_stats in stats),
+        }
+
+
+    async def add_refresh_token(self, username: str, token_hash: bytes, ttl_seconds: float) -> bool:
+        for name in self.__owners(username):
+            if await self.__shards[name].add_refresh_token(username, token_hash, ttl_seconds):
+                return True
+        return False
+
+    async def rotate_refresh_token(self, token_hash: bytes, new_token_hash: bytes, ttl_seconds: float,
+                                   username_hash: int) -> RefreshTokenRotation:
+        """
+        Tried on the shards of the username the token carries.
+        """
+        for name in self.__owners_at(username_hash):
+            rotation = await self.__shards[name].rotate_refresh_token(
+                token_hash, new_token_hash, ttl_seconds, username_hash
+            )
+            if rotation.username is not None or rotation.reused:
+                return rotation
+        return RefreshTokenRotation()
+
+    async def delete_expired_refresh_tokens(self, limit: int) -> int:
+        return sum(await asyncio.gather(*(
+            shard.delete_expired_refresh_tokens(limit) for shard in self.__shards.values()
+        )))
+
+
+    def __owners(self, username: str) -> list[str]:
+        """
+        The shard of the username, then its shard in the previous ring if it differs.
+        """
+        return self.__owners_at(HashRing.position(username))
+
+    def __owners_at(self, position: int) -> list[str]:
+        owner = self.__ring.shard_at(position)
+        if self.__previous_ring is None:
+            return [owner]
+        previous = self.__previous_ring.shard_at(position)
+        return [owner] if previous == owner else [owner, previous]
+
+    def __global_id(self, name: str, local_id: int) -> int:
+        return local_id * MAX_SHARDS + self.__indexes[name]
+
+    def __global_user(self, name: str, user: User) -> User:
+        return User(username=user.username, password_hash=user.password_hash, id=self.__global_id(name, user.id))
+
+    def __local_ids(self, global_ids: list[int]) -> dict[str, list[int]]:
+        by_shard: dict[str, list[int]] = defaultdict(list)
+        for global_id in global_ids:
+            local_id, index = divmod(global_id, MAX_SHARDS)
+            by_shard[self.__names[index]].append(local_id)
+        return by_shard
@@ -0,0 +1,320 @@
+from repository.user import User
+from repository.user_export import UserExport
+from repository.repository import UserRepository
+from repository.delegating_repository import DelegatingUserRepository
+
+import asyncio
+import hashlib
+import json
+import sys
+from collections import OrderedDict
+from dataclasses import replace
+from time import monotonic
+
+import psycopg
+
+USER_CHANGES_CHANNEL = "user_changes"    # Notified by the users_notify_change trigger (postgres/init.sql)
+MAX_USERNAME_LENGTH = 50    # Column sizes of the users table, for the memory bound
+MAX_HASH_LENGTH = 200
+
+
+def password_hash_digest(password_hash: str) -> str:
+    """
+    The digest of a password hash sent in the notifications (see postgres/init.sql).
+    """
+    return hashlib.sha256(password_hash.encode()).hexdigest()
+
+
+class CachedUserRepository(DelegatingUserRepository):
+    """
+    Keeps the users returned by get() in memory, so a repeated login or the lookup before
+    a /delete-account doesn't query the database.
+
+    Bounded LRU of at most `max_size` users, each kept at most `ttl` seconds. Unknown
+    usernames are not cached (see BloomFilteredUserRepository for those).
+
+    Writes made through this process update (update_hash) or drop (deletes) the entry.
+    Writes made anywhere else (other processes or pods, bulk_users.py, reshard.py) reach
+    it through a PostgresUserChangeListener: the users table notifies every change, and
+    the listener drops the entries whose hash changed. While the listener is disconnected
+    notifications can be lost, so the cache is cleared each time it connects; the TTL
+    bounds what a notification that never arrives can cost. With a listener, nothing is
+    cached until it found the trigger on every database: without it, a deleted account or
+    an old password would keep working from the cache of the other processes.
+
+    With read replicas, a lookup right after a change may still read the old row from a
+    replica: users changed less than `stale_reads` seconds ago (the replicas' max lag)
+    are looked up without being cached.
+    """
+
+    def __init__(self, repository: UserRepository, max_size: int = 10_000, ttl: float = 30.0,
+                 listener: "PostgresUserChangeListener | None" = None, stale_reads: float = 0.0, clock=monotonic):
+        super().__init__(repository)
+        self.__max_size = max_size
+        self.__ttl = ttl
+        self.__listener = listener
+        self.__stale_reads = stale_reads
+        self.__clock = clock
+        self.__enabled = listener is None
+        # Username -> (expires_at, user, estimated bytes), least recently used first.
+        self.__entries: OrderedDict[str, tuple[float, User, int]] = OrderedDict()
+        self.__memory_bytes = 0
+        self.__memory_bound = max_size * self.__entry_size(
+            User("u" * MAX_USERNAME_LENGTH, "h" * MAX_HASH_LENGTH, 2 ** 31 - 1)
+        )
+        # Bumped by every invalidation: a lookup that overlapped one doesn't store its result,
+        # which may predate it.
+        self.__version = 0
+        # Username -> time of its last invalidation, oldest first (only with stale_reads).
+        self.__recent_changes: OrderedDict[str, float] = OrderedDict()
+        self.__hits = 0
+        self.__misses = 0
+        self.__evictions = 0
+        self.__expirations = 0
+        self.__invalidations = 0
+
+    async def open(self) -> None:
+        await super().open()
+        if self.__listener is not None:
+            await self.__listener.open(self)
+
+    async def close(self) -> None:
+        if self.__listener is not None:
+            await self.__listener.close()
+        await super().close()
+
+
+    def invalidate(self, username: str, password_hash_sha256: str | None = None) -> None:
+        """
+        Drop the entry of `username`, unless its hash has this digest (the notification of
+        a change this process already applied).
+        """
+        self.__version += 1
+        if self.__stale_reads > 0:
+            self.__recent_changes[username] = self.__clock()
+            self.__recent_changes.move_to_end(username)
+        entry = self.__entries.get(username)
+        if entry is None:
+            return
+        if password_hash_sha256 is not None and password_hash_digest(entry[1].password_hash) == password_hash_sha256:
+            return
+        self.__remove(username)
+        self.__invalidations += 1
+
+    def clear(self) -> None:
+        self.__version += 1
+        self.__entries.clear()
+        self.__memory_bytes = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.__enabled
+
+    @enabled.setter
+    def enabled(self, enabled: bool) -> None:
+        """
+        While disabled, every lookup goes to the database (and nothing is kept).
+        """
+        self.__enabled = enabled
+        if not enabled:
+            self.clear()
+
+
+    async def get(self, username: str) -> User | None:
+        if not self.__enabled:
+            return await super().get(username)
+        entry = self.__entries.get(username)
+        if entry is not None:
+            expires_at, user, _ = entry
+            if expires_at > self.__clock():
+                self.__entries.move_to_end(username)
+                self.__hits += 1
+                return replace(user)
+            self.__remove(username)
+            self.__expirations += 1
+
+        self.__misses += 1
+        version = self.__version
+        user = await super().get(username)
+        if user is not None and version == self.__version and not self.__recently_changed(username):
+            self.__put(user)
+        return user
+
+    async def update_hash(self, username: str, new_password_hash: str) -> None:
+        entry = self.__entries.get(username)
+        self.invalidate(username)
+        await super().update_hash(username, new_password_hash)
+        if entry is not None:
+            # Write-through (the rehash on login follows a lookup): the next login is a hit.
+            self.__put(replace(entry[1], password_hash=new_password_hash))
+
+    async def delete(self, username: str) -> bool:
+        deleted = await super().delete(username)
+        self.invalidate(username)
+        return deleted
+
+    async def delete_if_hash_matches(self, username: str, password_hash: str) -> bool:
+        deleted = await super().delete_if_hash_matches(username, password_hash)
+        self.invalidate(username)
+        return deleted
+
+    async def import_users(self, exports: list[UserExport]) -> None:
+        await super().import_users(exports)
+        for export in exports:
+            self.invalidate(export.user.username)
+
+    async def remove_users(self, exports: list[UserExport]) -> list[str]:
+        removed = await super().remove_users(exports)
+        for username in removed:
+            self.invalidate(username)
+        return removed
+
+
+    def stats(self) -> dict:
+        lookups = self.__hits + self.__misses
+        return {
+            **super().stats(),
+            "user_cache": {
+                "enabled": self.__enabled,
+                "size": len(self.__entries),
+                "max_size": self.__max_size,
+                "hit_ratio": self.__hits / lookups if lookups else 0.0,
+                "hits": self.__hits,
+                "misses": self.__misses,
+                "evictions": self.__evictions,
+                "expirations": self.__expirations,
+                "invalidations": self.__invalidations,
+                "memory_bytes": self.__memory_bytes,
+                "memory_bound_bytes": self.__memory_bound,
+                **({"listener": self.__listener.stats()} if self.__listener is not None else {}),
+            },
+        }
+
+
+    def __put(self, user: User) -> None:
+        if user.username in self.__entries:
+            self.__remove(user.username)
+        user = replace(user)
+        size = self.__entry_size(user)
+        self.__entries[user.username] = (self.__clock() + self.__ttl, user, size)
+        self.__memory_bytes += size
+        while len(self.__entries) > self.__max_size:
+            self.__remove(next(iter(self.__entries)))
+            self.__evictions += 1
+
+    def __remove(self, username: str) -> None:
+        _, _, size = self.__entries.pop(username)
+        self.__memory_bytes -= size
+
+    def __recently_changed(self, username: str) -> bool:
+        if self.__stale_reads <= 0:
+            return False
+        changed_before = self.__clock() - self.__stale_reads
+        while self.__recent_changes and next(iter(self.__recent_changes.values())) < changed_before:
+            self.__recent_changes.popitem(last=False)
+        return username in self.__recent_changes
+
+    @staticmethod
+    def __entry_size(user: User) -> int:
+        """
+        Estimated bytes held by an entry: the User with its attribute dict and fields, the
+        entry tuple and its float, and the OrderedDict slot (about 100 bytes a key, with its
+        linked list node).
+        """
+        return (
+            sys.getsizeof(user) + sys.getsizeof(dict.fromkeys(("username", "password_hash", "id")))
+            + sys.getsizeof(user.username) + sys.getsizeof(user.password_hash) + sys.getsizeof(user.id)
+            + sys.getsizeof((0.0, user, 0)) + sys.getsizeof(0.0) + 100
+        )
+
+
+class PostgresUserChangeListener:
+    """
+    LISTENs to the user_changes notifications of each database (the primary, or every
+    shard) on a dedicated connection, and invalidates the entries of a CachedUserRepository.
+
+    Notifications are only delivered to the database that was written: with read replicas,
+    the listener connects to the primary. The cache is cleared each time LISTEN succeeds,
+    the first time included: changes made before (e.g. while the service was starting) were
+    not notified. A lost connection is retried every `retry_interval` seconds.
+
+    The cache is enabled once the users_notify_change trigger was found on every database,
+    and stays disabled if it is missing on one of them (it is only created by
+    postgres/init.sql on a new database).
+    """
+
+    def __init__(self, conn_details: list[dict], retry_interval: float = 1.0) -> None:
+        self.__conn_details = conn_details
+        self.__retry_interval = retry_interval
+        self.__tasks: list[asyncio.Task] = []
+        self.__cache: CachedUserRepository | None = None
+        self.__notifications = 0
+        self.__malformed = 0
+        self.__reconnections = 0
+        self.__databases_with_trigger = 0
+        self.__trigger_missing = False
+
+    async def open(self, cache: CachedUserRepository) -> None:
+        self.__cache = cache
+        self.__tasks = [asyncio.create_task(self.__listen(details)) for details in self.__conn_details]
+
+    async def close(self) -> None:
+        for task in self.__tasks:
+            task.cancel()
+        await asyncio.gather(*self.__tasks, return_exceptions=True)
+        self.__tasks = []
+
+    def stats(self) -> dict:
+        return {
+            "notifications": self.__notifications,
+            "malformed": self.__malformed,
+            "reconnections": self.__reconnections,
+        }
+
+
+    async def __listen(self, conn_details: dict) -> None:
+        connected_before = False
+        trigger_checked = False
+        while True:
+            try:
+                async with await psycopg.AsyncConnection.connect(**conn_details, autocommit=True) as conn:
+                    await conn.execute(f"LISTEN {USER_CHANGES_CHANNEL}")
+                    # Changes made before LISTEN (while disconnected, or since open()) weren't
+                    # notified to this process.
+                    self.__cache.clear()
+                    if connected_before:
+                        self.__reconnections += 1
+                    connected_before = True
+                    if not trigger_checked:
+                        await self.__check_trigger(conn)
+                        trigger_checked = True
+                    async for notification in conn.notifies():
+                        self.__notifications += 1
+                        try:
+                            change = json.loads(notification.payload)
+                            self.__cache.invalidate(change["username"], change.get("password_hash_sha256"))
+                        except Exception as e:
+                            # Not sent by the trigger of postgres/init.sql: the user it was about is unknown.
+                            self.__malformed += 1
+                            self.__cache.clear()
+                            print(f"WARNING: Malformed user change notification {notification.payload!r} ({e!r}), user cache cleared")
+            except psycopg.Error as e:
+                # Not connected: the entries may be missing changes from now on.
+                self.__cache.clear()
+                connected_before = True
+                print(f"WARNING: User cache invalidations interrupted ({e}), retrying in {self.__retry_interval:g} s")
+                await asyncio.sleep(self.__retry_interval)
+
+    async def __check_trigger(self, conn) -> None:
+        cursor = await conn.execute("SELECT 1 FROM pg_trigger WHERE tgname = 'users_notify_change'")
+        if await cursor.fetchone() is None:
+            self.__trigger_missing = True
+            print(
+                f"WARNING: No users_notify_change trigger on database {conn.info.dbname}: the user cache is "
+                "disabled, changes made by other processes wouldn't reach it (see postgres/init.sql)"
+            )
+        else:
+            self.__databases_with_trigger += 1
+        self.__cache.enabled = (
+            not self.__trigger_missing and self.__databases_with_trigger == len(self.__conn_details)
+        )
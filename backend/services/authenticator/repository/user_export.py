@@ -0,0 +1,30 @@
+import hashlib
+from dataclasses import dataclass, field
+
+from repository.user import User
+from repository.outbox_event import OutboxEvent
+from repository.refresh_token import StoredRefreshToken
+
+@dataclass
+class UserExport:
+    """
+    A user with its refresh tokens and pending outbox events: what reshard.py moves from
+    one database to another.
+    """
+    user: User
+    refresh_tokens: list[StoredRefreshToken] = field(default_factory=list)
+    outbox_events: list[OutboxEvent] = field(default_factory=list)
+
+    def refresh_tokens_digest(self) -> bytes:
+        return refresh_tokens_digest((token.token_hash, token.rotated_at is not None) for token in self.refresh_tokens)
+
+
+def refresh_tokens_digest(tokens) -> bytes:
+    """
+    SHA-256 of the (token_hash, rotated) pairs of a user, by token_hash: it changes when a
+    token is issued, rotated or deleted. Computed the same way in SQL by
+    PostgresqlUserRepository.remove_users.
+    """
+    return hashlib.sha256(b"".join(
+        token_hash + (b"\x01" if rotated else b"\x00") for token_hash, rotated in sorted(tokens)
+    )).digest()
@@ -0,0 +1,155 @@
+import hashlib
+import math
+
+from repository.user import User
+from repository.repository import UserRepository
+from repository.delegating_repository import DelegatingUserRepository
+
+class CountingBloomFilter:
+    """
+    Probabilistic set of strings: `item in filter` is False only if the item was
+    never added ("definitely not present"), and True for added items plus a small
+    fraction of others (false positives).
+
+    Each slot is an 8-bit counter instead of a bit, so items can also be removed.
+    A counter that reaches 255 stays there (it is never decremented again), which
+    can only add false positives, never false negatives.
+    """
+
+    def __init__(self, capacity: int, false_positive_rate: float = 0.01) -> None:
+        # Optimal sizes for `capacity` items: https://en.wikipedia.org/wiki/Bloom_filter#Optimal_number_of_hash_functions
+        self.__size = max(8, math.ceil(-capacity * math.log(false_positive_rate) / math.log(2) ** 2))
+        self.__hash_count = max(1, round(self.__size / capacity * math.log(2)))
+        self.__counters = bytearray(self.__size)
+        self.__items = 0
+
+    def add(self, item: str) -> None:
+        for position in self.__positions(item):
+            if self.__counters[position] < 255:
+                self.__counters[position] += 1
+        self.__items += 1
+
+    def remove(self, item: str) -> None:
+        """
+        Only remove items that were added, otherwise other items could become false negatives.
+        """
+        for position in self.__positions(item):
+            if 0 < self.__counters[position] < 255:
+                self.__counters[position] -= 1
+        self.__items -= 1
+
+    def __contains__(self, item: str) -> bool:
+        return all(self.__counters[position] for position in self.__positions(item))
+
+    def __len__(self) -> int:
+        return self.__items
+
+    @property
+    def memory_bytes(self) -> int:
+        return len(self.__counters)
+
+    def estimated_false_positive_rate(self) -> float:
+        return (1 - math.exp(-self.__hash_count * self.__items / self.__size)) ** self.__hash_count
+
+    def __positions(self, item: str):
+        # Double hashing: k positions from two 64-bit hashes.
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.__size for i in range(self.__hash_count)]
+
+
+class BloomFilteredUserRepository(DelegatingUserRepository):
+    """
+    Answers "this username doesn't exist" from memory, without querying the database.
+
+    Keeps a CountingBloomFilter of every username: hydrated from the wrapped repository
+    in open(), updated by add_user/delete. get() and check_if_username_already_exists()
+    only reach the database when the filter says the username might exist.
+
+    The filter only sees writes made through this process. With several processes
+    writing to the same database it would miss their new users, so it must only be
+    enabled when this process is the only writer.
+    """
+
+    def __init__(self, repository: UserRepository, capacity: int = 1_000_000, false_positive_rate: float = 0.01):
+        super().__init__(repository)
+        self.__capacity = capacity
+        self.__false_positive_rate = false_positive_rate
+        self.__filter = CountingBloomFilter(capacity, false_positive_rate)
+        self.__filtered_lookups = 0       # Answered from memory
+        self.__false_positives = 0        # Filter said "maybe", database said "no"
+
+    async def open(self) -> None:
+        await super().open()
+        await self.hydrate()
+
+    async def hydrate(self) -> None:
+        """
+        Rebuild the filter from the users stored in the wrapped repository.
+        """
+        new_filter = CountingBloomFilter(self.__capacity, self.__false_positive_rate)
+        async for user in self._repository.iter_users():
+            new_filter.add(user.username)
+        self.__filter = new_filter
+
+
+    async def get(self, username: str) -> User | None:
+        if username not in self.__filter:
+            self.__filtered_lookups += 1
+            return None
+        user = await super().get(username)
+        if user is None:
+            self.__false_positives += 1
+        return user
+
+    async def check_if_username_already_exists(self, username: str) -> bool:
+        if username not in self.__filter:
+            self.__filtered_lookups += 1
+            return False
+        exists = await super().check_if_username_already_exists(username)
+        if not exists:
+            self.__false_positives += 1
+        return exists
+
+    # Usernames are added before the insert, so a concurrent lookup never misses a committed
+    # user. If the insert fails the extra count is kept: it can only cause false positives.
+    async def add_user(self, username: str, password_hash: str) -> None:
+        self.__filter.add(username)
+        await super().add_user(username, password_hash)
+
+    async def add_user_if_absent(self, username: str, password_hash: str) -> int | None:
+        self.__filter.add(username)
+        user_id = await super().add_user_if_absent(username, password_hash)
+        if user_id is None:
+            # Taken: the username was already counted once.
+            self.__filter.remove(username)
+        return user_id
+
+    async def delete(self, username: str) -> bool:
+        deleted = await super().delete(username)
+        if deleted:
+            self.__filter.remove(username)
+        return deleted
+
+    async def delete_if_hash_matches(self, username: str, password_hash: str) -> bool:
+        deleted = await super().delete_if_hash_matches(username, password_hash)
+        if deleted:
+            self.__filter.remove(username)
+        return deleted
+
+
+    def stats(self) -> dict:
+        negatives = self.__filtered_lookups + self.__false_positives
+        return {
+            **super().stats(),
+            "username_filter": {
+                "items": len(self.__filter),
+                "capacity": self.__capacity,
+                "memory_bytes": self.__filter.memory_bytes,
+                "estimated_false_positive_rate": self.__filter.estimated_false_positive_rate(),
+                "observed_false_positive_rate": self.__false_positives / negatives if negatives else 0.0,
+                "filtered_lookups": self.__filtered_lookups,
+                "false_positives": self.__false_positives,
+            },
+        }
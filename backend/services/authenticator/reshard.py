@@ -0,0 +1,122 @@
+"""
+Move every user to the shard its username hashes to (see repository/sharding.py), while
+the service keeps running.
+
+Adding a shard:
+    1. Create the tables on the new database (postgres/init.sql).
+    2. Restart the service with the new shard appended to POSTGRES_SHARDS and the names of
+       the shards before the change in POSTGRES_SHARDS_PREVIOUS: lookups then try the new
+       placement first and the previous one second, and writes go to both.
+    3. Run this script (same environment variables as the service).
+    4. Restart the service without POSTGRES_SHARDS_PREVIOUS.
+
+Users are moved in batches: copied to their new shard with their refresh tokens and
+pending outbox events, then deleted from the old one if neither their hash nor their
+refresh tokens changed in the meantime (a token issued or rotated on the old shard would
+be lost, and a spent one valid again). A user updated during its move is copied again; a
+user deleted during its move has its copy deleted. The script can be stopped and run again
+at any time.
+
+It also places users written to the wrong shard by other means (e.g. rows restored by hand).
+
+Usage (from this folder):
+    python reshard.py [--batch-size 500] [--dry-run]
+"""
+import argparse
+import asyncio
+import sys
+from collections import Counter, defaultdict
+
+from dependencies import POSTGRES_SHARDS, sharded_repository
+from repository import ShardedUserRepository, UserRepository
+
+
+async def move_users(source: UserRepository, target: UserRepository, usernames: list[str], attempts: int = 5) -> int:
+    """
+    Move the users from `source` to `target`. Returns how many were moved.
+    """
+    moved = 0
+    for _ in range(attempts):
+        exports = await source.export_users(usernames)
+        if not exports:
+            return moved
+        await target.import_users(exports)
+        removed = set(await source.remove_users(exports))
+        moved += len(removed)
+
+        changed = [export for export in exports if export.user.username not in removed]
+        if not changed:
+            return moved
+        # Updated (hash or refresh tokens) or deleted since the export: copy the updated ones
+        # again, and delete the copies of the deleted ones (unless they signed up again meanwhile).
+        still_there = {
+            export.user.username for export in await source.export_users([export.user.username for export in changed])
+        }
+        await target.remove_users([export for export in changed if export.user.username not in still_there])
+        usernames = list(still_there)
+
+    if usernames:
+        print(f"WARNING: {len(usernames)} users kept changing during their move, run the script again")
+    return moved
+
+
+async def reshard(repository: ShardedUserRepository, batch_size: int = 500, dry_run: bool = False) -> Counter:
+    """
+    Move (or, with dry_run, count) the users that aren't on their shard.
+    Returns the number of users per (source, target).
+    """
+    moves: Counter = Counter()
+    shards = repository.shards
+    for name, shard in shards.items():
+        batch: list[str] = []
+        async for user in shard.iter_users(batch_size):
+            batch.append(user.username)
+            if len(batch) == batch_size:
+                moves += await move_batch(repository, name, batch, dry_run)
+                batch = []
+        if batch:
+            moves += await move_batch(repository, name, batch, dry_run)
+    return moves
+
+async def move_batch(repository: ShardedUserRepository, source: str, usernames: list[str], dry_run: bool) -> Counter:
+    by_target: dict[str, list[str]] = defaultdict(list)
+    for username in usernames:
+        target = repository.ring.shard_for(username)
+        if target != source:
+            by_target[target].append(username)
+
+    moves: Counter = Counter()
+    for target, misplaced in by_target.items():
+        if dry_run:
+            moves[source, target] += len(misplaced)
+        else:
+            moves[source, target] += await move_users(repository.shards[source], repository.shards[target], misplaced)
+    return moves
+
+
+async def main_async(args) -> None:
+    repository = sharded_repository()
+    await repository.open()
+    try:
+        moves = await reshard(repository, args.batch_size, args.dry_run)
+    finally:
+        await repository.close()
+
+    verb = "To move" if args.dry_run else "Moved"
+    for (source, target), count in sorted(moves.items()):
+        print(f"{verb}: {count} users from {source} to {target}")
+    print(f"{verb}: {sum(moves.values())} users in total")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch-size", type=int, default=500, help="Users read and moved at a time.")
+    parser.add_argument("--dry-run", action="store_true", help="Only count the users to move.")
+    args = parser.parse_args()
+    if not POSTGRES_SHARDS:
+        sys.exit("ERROR: POSTGRES_SHARDS is not set")
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+import asyncio
+import pytest
+from unittest.mock import patch
+from argon2 import PasswordHasher
+
+from auth_manager import AuthManager, DeletionResult
+from hashing_executor import PasswordHashingExecutor
+from repository import MockRepository
+
+
+@pytest.fixture(scope="module")
+def hashing_executor():
+    executor = PasswordHashingExecutor(max_workers=2)
+    yield executor
+    executor.shutdown()
+
+@pytest.fixture
+def repository():
+    return MockRepository()
+
+@pytest.fixture
+def auth_manager(repository, hashing_executor):
+    return AuthManager(repository, hashing_executor)
+
+
+def test_create_user_reports_taken_username(auth_manager):
+    async def scenario():
+        return await auth_manager.create_user("alice", "secret"), await auth_manager.create_user("alice", "other")
+
+    assert asyncio.run(scenario()) == (True, False)
+
+
+def test_create_user_with_a_taken_username_doesnt_hash(auth_manager, hashing_executor):
+    asyncio.run(auth_manager.create_user("alice", "secret"))
+
+    with patch.object(PasswordHashingExecutor, "hash") as hash_password:
+        assert asyncio.run(auth_manager.create_user("alice", "other")) is False
+    hash_password.assert_not_called()
+
+
+def test_delete_user_if_password_matches(auth_manager, repository):
+    async def scenario():
+        await auth_manager.create_user("alice", "secret")
+        results = [
+            await auth_manager.delete_user_if_password_matches("bob", "secret"),
+            await auth_manager.delete_user_if_password_matches("alice", "wrong"),
+            await auth_manager.delete_user_if_password_matches("alice", "secret"),
+        ]
+        return results, await repository.get("alice")
+
+    results, remaining_user = asyncio.run(scenario())
+
+    assert results == [DeletionResult.USER_NOT_FOUND, DeletionResult.WRONG_PASSWORD, DeletionResult.DELETED]
+    assert remaining_user is None
+
+
+def test_delete_is_retried_when_hash_changed_concurrently(auth_manager, repository, hashing_executor):
+    async def scenario():
+        await auth_manager.create_user("alice", "secret")
+        rehashed = await hashing_executor.hash("secret")
+        original_delete = repository.delete_if_hash_matches
+
+        async def delete_after_concurrent_rehash(username, password_hash):
+            # A concurrent login rehashed the password between the fetch and the delete.
+            if (await repository.get(username)).password_hash != rehashed:
+                await repository.update_hash(username, rehashed)
+            return await original_delete(username, password_hash)
+
+        with patch.object(repository, "delete_if_hash_matches", side_effect=delete_after_concurrent_rehash):
+            return await auth_manager.delete_user_if_password_matches("alice", "secret")
+
+    assert asyncio.run(scenario()) == DeletionResult.DELETED
+
+
+def test_login_migrates_the_hash_to_the_configured_parameters(repository):
+    old_executor = PasswordHashingExecutor(PasswordHasher(time_cost=2, memory_cost=19 * 1024, parallelism=1))
+    new_executor = PasswordHashingExecutor(PasswordHasher(time_cost=1, memory_cost=47 * 1024, parallelism=1))
+
+    async def scenario():
+        await AuthManager(repository, old_executor).create_user("alice", "secret")
+        assert await AuthManager(repository, new_executor).verify_password_and_update_its_hash_in_database_if_needed("alice", "secret")
+        return (await repository.get("alice")).password_hash
+
+    password_hash = asyncio.run(scenario())
+    old_executor.shutdown()
+    new_executor.shutdown()
+
+    assert password_hash.startswith("$argon2id$v=19$m=48128,t=1,p=1$")
+    assert not new_executor.check_needs_rehash(password_hash)
@@ -0,0 +1,14 @@
+from bulk_users import validate_row
+
+HASH = "$argon2id$v=19$m=65536,t=3,p=4$ctGo0BnvFbk7coHtF/jbhQ$kkzRo1VMH23Xr3FY4PJ4GnzjhYt7rElr/5Nt++945AU"
+
+
+def test_rows_with_a_password_or_an_argon2_hash_are_valid():
+    assert validate_row({"username": "alice", "password": "secret"}) == ("alice", "secret", None)
+    assert validate_row({"username": "alice", "password_hash": HASH}) == ("alice", None, HASH)
+
+
+def test_rows_with_a_hash_that_wouldnt_load_are_invalid():
+    assert validate_row({"username": "alice", "password_hash": "$2b$12$notargon2"}) is None
+    assert validate_row({"username": "alice", "password_hash": HASH + "A" * 200}) is None     # Over the column size
+    assert validate_row({"username": "", "password_hash": HASH}) is None
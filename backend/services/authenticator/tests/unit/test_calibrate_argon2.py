@@ -0,0 +1,46 @@
+import pytest
+
+from calibrate_argon2 import choose_parameters, write_env, MIN_MEMORY_COST
+
+
+def fake_measure(seconds_per_pass_per_gib: float):
+    """
+    Hash time grows with the passes and the memory, and shrinks with the lanes.
+    """
+    def measure(time_cost, memory_cost, parallelism):
+        return time_cost * memory_cost / (1024 * 1024) * seconds_per_pass_per_gib / parallelism
+    return measure
+
+
+def test_fills_the_target_latency_within_the_memory_budget():
+    # 64 MiB per hash (256 MiB shared by 4), 62.5 ms per pass.
+    profile = choose_parameters(fake_measure(1.0), target=0.25, concurrency=4, cores=4, memory_budget=256 * 1024)
+
+    assert (profile.time_cost, profile.memory_cost, profile.parallelism) == (4, 64 * 1024, 1)
+    assert profile.latency <= 0.25
+
+def test_spare_cores_become_lanes():
+    profile = choose_parameters(fake_measure(1.0), target=0.25, concurrency=2, cores=8, memory_budget=256 * 1024)
+
+    assert profile.parallelism == 4
+
+def test_memory_is_halved_on_a_slow_machine_but_not_below_the_minimum():
+    profile = choose_parameters(fake_measure(100.0), target=0.25, concurrency=1, cores=1, memory_budget=1024 * 1024)
+
+    assert profile.memory_cost == MIN_MEMORY_COST
+    assert profile.time_cost == 2       # Minimum number of passes at 19 MiB
+
+def test_rejects_a_budget_too_small_for_the_concurrency():
+    with pytest.raises(ValueError):
+        choose_parameters(fake_measure(1.0), target=0.25, concurrency=16, cores=16, memory_budget=128 * 1024)
+
+
+def test_write_env_replaces_the_profile_and_keeps_other_settings(tmp_path):
+    env_file = tmp_path / ".env"
+    env_file.write_text("POSTGRES_DB=mydb\nARGON2_TIME_COST=3\n")
+
+    write_env(str(env_file), {"ARGON2_TIME_COST": "4", "ARGON2_MEMORY_COST": "65536"})
+
+    lines = env_file.read_text().splitlines()
+    assert lines[:2] == ["POSTGRES_DB=mydb", "ARGON2_TIME_COST=4"]
+    assert "ARGON2_MEMORY_COST=65536" in lines
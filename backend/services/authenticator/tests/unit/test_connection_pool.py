@@ -0,0 +1,50 @@
+import asyncio
+import contextlib
+import psycopg
+import pytest
+from unittest.mock import patch
+
+from repository import PostgresConnectionPool, RepositoryUnavailableError
+
+
+class FakeAsyncConnectionPool:
+    """
+    Stands in for psycopg's pool: hands out a placeholder connection at once.
+    """
+
+    check_connection = None
+
+    def __init__(self, **kwargs):
+        pass
+
+    @contextlib.asynccontextmanager
+    async def connection(self):
+        yield object()
+
+
+@pytest.mark.parametrize("error", [
+    psycopg.OperationalError("server closed the connection unexpectedly"),
+    psycopg.InterfaceError("the connection is closed"),
+])
+def test_a_connection_lost_while_in_use_is_reported_as_unavailable(error):
+    with patch("repository.connection_pool.AsyncConnectionPool", FakeAsyncConnectionPool):
+        pool = PostgresConnectionPool({})
+
+    async def scenario():
+        async with pool.connection():
+            raise error
+
+    with pytest.raises(RepositoryUnavailableError):
+        asyncio.run(scenario())
+
+
+def test_other_database_errors_are_not_hidden():
+    with patch("repository.connection_pool.AsyncConnectionPool", FakeAsyncConnectionPool):
+        pool = PostgresConnectionPool({})
+
+    async def scenario():
+        async with pool.connection():
+            raise psycopg.errors.UniqueViolation("duplicate key")
+
+    with pytest.raises(psycopg.errors.UniqueViolation):
+        asyncio.run(scenario())
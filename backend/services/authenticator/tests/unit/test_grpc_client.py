@@ -0,0 +1,240 @@
+import asyncio
+import grpclib.const
+from grpclib.const import Status
+from grpclib.exceptions import GRPCError
+from grpclib.server import Server
+
+from grpc_client import GrpcChannelManager, MicroBatcher
+from proto.usermanagement.v1 import (
+    CreateUserRequest, CreateUserResponse, DeleteUserRequest, DeleteUserResponse,
+    CreateUsersRequest, CreateUsersResponse, DeleteUsersRequest, DeleteUsersResponse, UserResult
+)
+
+class FakeUserManagementService:
+    """
+    Minimal in-process stand-in for the workout-core gRPC server.
+    """
+
+    def __init__(self):
+        self.created: list[str] = []
+        self.deleted: list[str] = []
+        self.batches: list[list[str]] = []
+
+    async def create_user(self, stream):
+        request = await stream.recv_message()
+        self.created.append(request.id)
+        await stream.send_message(CreateUserResponse())
+
+    async def delete_user(self, stream):
+        request = await stream.recv_message()
+        self.deleted.append(request.id)
+        await stream.send_message(DeleteUserResponse())
+
+    async def create_users(self, stream):
+        request = await stream.recv_message()
+        self.batches.append(list(request.ids))
+        results = []
+        for user_id in request.ids:
+            if user_id in self.created:
+                results.append(UserResult(id=user_id, code=Status.ALREADY_EXISTS.value, message="exists"))
+            else:
+                self.created.append(user_id)
+                results.append(UserResult(id=user_id))
+        await stream.send_message(CreateUsersResponse(results=results))
+
+    async def delete_users(self, stream):
+        request = await stream.recv_message()
+        self.batches.append(list(request.ids))
+        self.deleted += request.ids
+        await stream.send_message(DeleteUsersResponse(results=[UserResult(id=user_id) for user_id in request.ids]))
+
+    def __mapping__(self):
+        return {
+            "/usermanagement.v1.UserManagementService/CreateUser": grpclib.const.Handler(
+                self.create_user, grpclib.const.Cardinality.UNARY_UNARY, CreateUserRequest, CreateUserResponse
+            ),
+            "/usermanagement.v1.UserManagementService/DeleteUser": grpclib.const.Handler(
+                self.delete_user, grpclib.const.Cardinality.UNARY_UNARY, DeleteUserRequest, DeleteUserResponse
+            ),
+            "/usermanagement.v1.UserManagementService/CreateUsers": grpclib.const.Handler(
+                self.create_users, grpclib.const.Cardinality.UNARY_UNARY, CreateUsersRequest, CreateUsersResponse
+            ),
+            "/usermanagement.v1.UserManagementService/DeleteUsers": grpclib.const.Handler(
+                self.delete_users, grpclib.const.Cardinality.UNARY_UNARY, DeleteUsersRequest, DeleteUsersResponse
+            ),
+        }
+
+
+async def start_server(service, port=0) -> Server:
+    server = Server([service])
+    await server.start("127.0.0.1", port)
+    return server
+
+def server_port(server: Server) -> int:
+    return server._server.sockets[0].getsockname()[1]
+
+
+def test_calls_reuse_the_same_connection():
+    async def scenario():
+        service = FakeUserManagementService()
+        server = await start_server(service)
+        manager = GrpcChannelManager("127.0.0.1", server_port(server))
+        await manager.open()
+
+        await asyncio.gather(*(manager.call("create_user", id=f"user{i}") for i in range(10)))
+        await manager.call("delete_user", id="user0")
+
+        stats = manager.stats()
+        manager.close()
+        server.close()
+        await server.wait_closed()
+        return service, stats
+
+    service, stats = asyncio.run(scenario())
+
+    assert sorted(service.created) == sorted(f"user{i}" for i in range(10))
+    assert service.deleted == ["user0"]
+    assert stats["channels"] == ["CONNECTED"]
+    assert stats["calls"]["create_user"]["calls"] == 10
+    assert stats["calls"]["create_user"]["failures"] == 0
+
+
+def test_channel_reconnects_after_server_restart():
+    async def scenario():
+        service = FakeUserManagementService()
+        server = await start_server(service)
+        port = server_port(server)
+        manager = GrpcChannelManager("127.0.0.1", port)
+        await manager.open()
+        await manager.call("create_user", id="before")
+
+        server.close()
+        await server.wait_closed()
+        server = await start_server(service, port)
+
+        await manager.call("create_user", id="after")
+
+        manager.close()
+        server.close()
+        await server.wait_closed()
+        return service
+
+    service = asyncio.run(scenario())
+
+    assert service.created == ["before", "after"]
+
+
+def test_concurrent_calls_are_sent_as_one_batch():
+    async def scenario():
+        service = FakeUserManagementService()
+        server = await start_server(service)
+        manager = GrpcChannelManager("127.0.0.1", server_port(server))
+        batcher = MicroBatcher(manager, "create_users", max_batch_size=100, max_delay=0.01)
+
+        await asyncio.gather(*(batcher.submit(f"user{i}") for i in range(20)))
+
+        stats = (manager.stats(), batcher.stats())
+        manager.close()
+        server.close()
+        await server.wait_closed()
+        return service, stats
+
+    service, (manager_stats, batcher_stats) = asyncio.run(scenario())
+
+    assert service.batches == [[f"user{i}" for i in range(20)]]
+    assert manager_stats["calls"]["create_users"]["calls"] == 1
+    assert batcher_stats["batches"] == 1
+    assert batcher_stats["batch_size_max"] == 20
+
+
+def test_full_batch_is_sent_without_waiting_for_the_delay():
+    async def scenario():
+        service = FakeUserManagementService()
+        server = await start_server(service)
+        manager = GrpcChannelManager("127.0.0.1", server_port(server))
+        batcher = MicroBatcher(manager, "delete_users", max_batch_size=4, max_delay=60)
+
+        await asyncio.wait_for(asyncio.gather(*(batcher.submit(f"user{i}") for i in range(8))), timeout=5)
+
+        manager.close()
+        server.close()
+        await server.wait_closed()
+        return service
+
+    service = asyncio.run(scenario())
+
+    assert [len(batch) for batch in service.batches] == [4, 4]
+    assert sorted(service.deleted) == sorted(f"user{i}" for i in range(8))
+
+
+def test_each_caller_gets_the_outcome_of_its_own_user():
+    async def scenario():
+        service = FakeUserManagementService()
+        service.created.append("taken")
+        server = await start_server(service)
+        manager = GrpcChannelManager("127.0.0.1", server_port(server))
+        batcher = MicroBatcher(manager, "create_users", max_delay=0.01)
+
+        results = await asyncio.gather(
+            batcher.submit("new1"), batcher.submit("taken"), batcher.submit("new2"), return_exceptions=True
+        )
+
+        manager.close()
+        server.close()
+        await server.wait_closed()
+        return results
+
+    new1, taken, new2 = asyncio.run(scenario())
+
+    assert new1 is None and new2 is None
+    assert isinstance(taken, GRPCError)
+    assert taken.status == Status.ALREADY_EXISTS
+
+
+class UnknownCodeService(FakeUserManagementService):
+    """
+    Answers with a result code that isn't a grpclib Status.
+    """
+
+    async def create_users(self, stream):
+        request = await stream.recv_message()
+        await stream.send_message(CreateUsersResponse(
+            results=[UserResult(id=user_id, code=999, message="from a newer server") for user_id in request.ids]
+        ))
+
+
+def test_an_unknown_result_code_fails_the_caller_as_unknown():
+    async def scenario():
+        server = await start_server(UnknownCodeService())
+        manager = GrpcChannelManager("127.0.0.1", server_port(server))
+        batcher = MicroBatcher(manager, "create_users", max_delay=0.01)
+
+        results = await asyncio.gather(batcher.submit("a"), batcher.submit("b"), return_exceptions=True)
+
+        manager.close()
+        server.close()
+        await server.wait_closed()
+        return results
+
+    results = asyncio.run(scenario())
+
+    assert all(isinstance(result, GRPCError) and result.status == Status.UNKNOWN for result in results)
+
+
+def test_a_failed_batch_fails_every_caller():
+    async def scenario():
+        # Nothing listens on this port.
+        server = await start_server(FakeUserManagementService())
+        port = server_port(server)
+        server.close()
+        await server.wait_closed()
+
+        manager = GrpcChannelManager("127.0.0.1", port)
+        batcher = MicroBatcher(manager, "create_users", max_delay=0.01)
+        results = await asyncio.gather(batcher.submit("a"), batcher.submit("b"), return_exceptions=True)
+        manager.close()
+        return results
+
+    results = asyncio.run(scenario())
+
+    assert all(isinstance(result, ConnectionError) for result in results)
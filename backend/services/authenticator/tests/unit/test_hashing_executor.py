@@ -0,0 +1,56 @@
+import asyncio
+import threading
+import pytest
+from argon2 import PasswordHasher
+from argon2.exceptions import VerifyMismatchError
+
+from hashing_executor import PasswordHashingExecutor, HashingQueueFullError
+
+
+class BlockingHasher(PasswordHasher):
+    """Hasher whose hash() waits until the test releases it."""
+
+    def __init__(self):
+        super().__init__()
+        self.release = threading.Event()
+
+    def hash(self, password, *, salt=None):
+        self.release.wait(timeout=5)
+        return super().hash(password)
+
+
+def test_hash_and_verify_run_on_the_executor():
+    executor = PasswordHashingExecutor(max_workers=2)
+
+    async def scenario():
+        password_hash = await executor.hash("secret")
+        assert await executor.verify(password_hash, "secret")
+        with pytest.raises(VerifyMismatchError):
+            await executor.verify(password_hash, "wrong")
+
+    asyncio.run(scenario())
+    executor.shutdown()
+    assert executor.stats()["pending"] == 0
+
+
+def test_rejects_work_when_queue_is_full():
+    hasher = BlockingHasher()
+    executor = PasswordHashingExecutor(hasher, max_workers=1, max_queue_size=1)
+
+    async def scenario():
+        running = asyncio.ensure_future(executor.hash("first"))
+        queued = asyncio.ensure_future(executor.hash("second"))
+        await asyncio.sleep(0)
+
+        with pytest.raises(HashingQueueFullError):
+            await executor.hash("third")
+
+        hasher.release.set()
+        await asyncio.gather(running, queued)
+
+        # Capacity is available again once the backlog drained.
+        await executor.hash("fourth")
+
+    asyncio.run(scenario())
+    executor.shutdown()
+    assert executor.stats()["rejected"] == 1
@@ -0,0 +1,118 @@
+import asyncio
+import os
+import pytest
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+from key_store import KeyStore, generate_key_pair
+from jwt_utils import JWTUtil
+
+
+def write_key_pair(private_key_path, public_key_path, mtime=None):
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    private_key_path.write_bytes(key.private_bytes(
+        encoding=serialization.Encoding.PEM,
+        format=serialization.PrivateFormat.PKCS8,
+        encryption_algorithm=serialization.NoEncryption()
+    ))
+    public_key_path.write_bytes(key.public_key().public_bytes(
+        encoding=serialization.Encoding.PEM,
+        format=serialization.PublicFormat.SubjectPublicKeyInfo
+    ))
+    if mtime is not None:
+        for path in (private_key_path, public_key_path):
+            os.utime(path, (mtime, mtime))
+
+
+@pytest.fixture
+def key_paths(tmp_path):
+    private_key_path = tmp_path / "jwtRS256.key"
+    public_key_path = tmp_path / "jwtRS256.key.pub"
+    write_key_pair(private_key_path, public_key_path, mtime=1_000_000)
+    return private_key_path, public_key_path
+
+
+def test_keys_are_parsed_once_and_reused(key_paths):
+    store = KeyStore(*map(str, key_paths))
+    store.load()
+
+    assert store.jwt_util() is store.jwt_util()
+    token = store.jwt_util().create_token("alice")
+    assert JWTUtil.verify_token(token, store.public_key())["username"] == "alice"
+    assert store.reload_if_changed() is False
+
+
+def test_rotated_keys_are_reloaded(key_paths):
+    store = KeyStore(*map(str, key_paths))
+    store.load()
+    old_token = store.jwt_util().create_token("alice")
+
+    write_key_pair(*key_paths, mtime=2_000_000)
+
+    assert store.reload_if_changed() is True
+    assert JWTUtil.verify_token(old_token, store.public_key()) is None
+    new_token = store.jwt_util().create_token("alice")
+    assert JWTUtil.verify_token(new_token, store.public_key())["username"] == "alice"
+
+
+def test_invalid_rotation_keeps_previous_keys(key_paths):
+    store = KeyStore(*map(str, key_paths))
+    store.load()
+    public_key = store.public_key()
+
+    key_paths[1].write_bytes(b"half written")
+
+    assert store.reload_if_changed() is False
+    assert store.public_key() is public_key
+
+
+@pytest.mark.parametrize("algorithm", ["RS256", "ES256", "EdDSA"])
+def test_supported_algorithms_sign_and_verify(tmp_path, algorithm):
+    private_pem, public_pem = generate_key_pair(algorithm)
+    (tmp_path / "private.pem").write_bytes(private_pem)
+    (tmp_path / "public.pem").write_bytes(public_pem)
+
+    store = KeyStore(str(tmp_path / "private.pem"), str(tmp_path / "public.pem"), algorithm)
+    token = store.jwt_util().create_token("alice")
+
+    assert JWTUtil.verify_token(token, store.public_key(), algorithm)["username"] == "alice"
+
+
+def test_rotation_with_a_mismatched_public_key_keeps_previous_keys(key_paths, tmp_path):
+    store = KeyStore(*map(str, key_paths))
+    store.load()
+    jwt_util = store.jwt_util()
+
+    write_key_pair(tmp_path / "other.key", tmp_path / "other.key.pub")
+    key_paths[1].write_bytes((tmp_path / "other.key.pub").read_bytes())    # Only the public key rotated
+
+    assert store.reload_if_changed() is False
+    assert store.jwt_util() is jwt_util
+
+
+def test_watch_survives_any_reload_error(key_paths):
+    store = KeyStore(*map(str, key_paths), check_interval=0.01)
+    store.load()
+    public_key = store.public_key()
+
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    key_paths[0].write_bytes(key.private_bytes(     # Loading it without a password raises TypeError
+        encoding=serialization.Encoding.PEM,
+        format=serialization.PrivateFormat.PKCS8,
+        encryption_algorithm=serialization.BestAvailableEncryption(b"secret")
+    ))
+
+    async def scenario():
+        watch = asyncio.create_task(store.watch())
+        await asyncio.sleep(0.05)
+        assert not watch.done()
+        watch.cancel()
+
+    asyncio.run(scenario())
+    assert store.public_key() is public_key
+
+
+def test_key_not_matching_algorithm_is_rejected(key_paths):
+    store = KeyStore(*map(str, key_paths), algorithm="EdDSA")
+    with pytest.raises(ValueError):
+        store.load()
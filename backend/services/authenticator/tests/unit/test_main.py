@@ -0,0 +1,72 @@
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import httpx
+
+from key_store import generate_key_pair
+
+SERVICE_DIR = Path(__file__).resolve().parents[2]
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def wait_until_serving(url: str, timeout: float = 20.0) -> None:
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            httpx.get(url, timeout=1)
+            return
+        except httpx.TransportError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.2)
+
+
+def test_supervisor_spreads_connections_over_its_workers(tmp_path):
+    private_pem, public_pem = generate_key_pair("ES256")
+    (tmp_path / "key").write_bytes(private_pem)
+    (tmp_path / "key.pub").write_bytes(public_pem)
+    port = free_port()
+    env = {
+        **os.environ,
+        "AUTH_HOST": "127.0.0.1", "AUTH_PORT": str(port), "AUTH_WORKERS": "2",
+        "PRIVATE_KEY_PATH": str(tmp_path / "key"), "PUBLIC_KEY_PATH": str(tmp_path / "key.pub"),
+        "JWT_ALGORITHM": "ES256", "PROMETHEUS_MULTIPROC_DIR": str(tmp_path),
+    }
+    supervisor = subprocess.Popen(
+        [sys.executable, "main.py"], cwd=SERVICE_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        wait_until_serving(f"http://127.0.0.1:{port}/stats")
+        pids = set()
+        for _ in range(50):     # A new connection each time
+            pids.add(httpx.get(f"http://127.0.0.1:{port}/stats").json()["pid"])
+            if len(pids) == 2:
+                break
+        metrics = httpx.get(f"http://127.0.0.1:{port}/metrics").text
+    finally:
+        supervisor.send_signal(signal.SIGTERM)
+        exit_code = supervisor.wait(timeout=20)
+
+    assert len(pids) == 2 and supervisor.pid not in pids
+    # /metrics counts the requests of both workers.
+    assert 'auth_responses_total{endpoint="/stats",method="GET",status="200"}' in metrics
+    assert exit_code == 0
+
+
+def test_supervisor_refuses_a_username_filter_per_worker():
+    env = {**os.environ, "AUTH_WORKERS": "2", "USERNAME_FILTER_ENABLED": "true"}
+    result = subprocess.run(
+        [sys.executable, "main.py"], cwd=SERVICE_DIR, env=env, capture_output=True, text=True, timeout=60
+    )
+
+    assert result.returncode != 0
+    assert "USERNAME_FILTER_ENABLED" in result.stderr
@@ -0,0 +1,89 @@
+import asyncio
+import pytest
+from unittest.mock import AsyncMock
+from grpclib.const import Status
+from grpclib.exceptions import GRPCError
+
+from provisioning_worker import ProvisioningWorker
+from repository import MockRepository
+
+
+@pytest.fixture
+def repository():
+    return MockRepository()
+
+def make_worker(repository, create_user=None, delete_user=None, **kwargs) -> ProvisioningWorker:
+    return ProvisioningWorker(repository, create_user or AsyncMock(), delete_user or AsyncMock(), **kwargs)
+
+
+def test_delivers_and_removes_the_events(repository):
+    create_user, delete_user = AsyncMock(), AsyncMock()
+    worker = make_worker(repository, create_user, delete_user)
+
+    async def scenario():
+        await repository.add_user_if_absent("alice", "hash")
+        await repository.add_user_if_absent("bob", "hash")
+        await repository.delete("bob")
+        first = await worker.run_once()
+        second = await worker.run_once()     # bob's deletion waits for bob's creation.
+        return first, second, await repository.outbox_stats()
+
+    first, second, outbox = asyncio.run(scenario())
+
+    assert (first, second) == (2, 1)
+    assert [c.args[0] for c in create_user.await_args_list] == ["alice", "bob"]
+    delete_user.assert_awaited_once_with("bob")
+    assert outbox["depth"] == 0
+    assert worker.stats()["delivered"] == 3
+
+
+def test_failed_events_are_retried_later(repository):
+    create_user = AsyncMock(side_effect=[ConnectionError("workout-core is down"), None])
+    worker = make_worker(repository, create_user)
+
+    async def scenario():
+        await repository.add_user_if_absent("alice", "hash")
+        await worker.run_once()
+        depth_after_failure = (await repository.outbox_stats())["depth"]
+        claimed_during_backoff = await worker.run_once()
+
+        await repository.retry_outbox_events([1], 0, "")     # Skip the rest of the backoff.
+        claimed_after_backoff = await worker.run_once()
+        return depth_after_failure, claimed_during_backoff, claimed_after_backoff, await repository.outbox_stats()
+
+    depth_after_failure, claimed_during_backoff, claimed_after_backoff, outbox = asyncio.run(scenario())
+
+    assert depth_after_failure == 1
+    assert claimed_during_backoff == 0
+    assert claimed_after_backoff == 1
+    assert outbox["depth"] == 0
+    assert worker.stats()["failed_attempts"] == 1
+
+
+def test_user_already_in_workout_core_counts_as_delivered(repository):
+    create_user = AsyncMock(side_effect=GRPCError(Status.ALREADY_EXISTS, "exists"))
+    worker = make_worker(repository, create_user)
+
+    async def scenario():
+        await repository.add_user_if_absent("alice", "hash")
+        await worker.run_once()
+        return await repository.outbox_stats()
+
+    assert asyncio.run(scenario())["depth"] == 0
+
+
+def test_notify_wakes_the_running_worker(repository):
+    create_user = AsyncMock()
+    worker = make_worker(repository, create_user, poll_interval=60)
+
+    async def scenario():
+        worker.start()
+        await asyncio.sleep(0.01)       # First (empty) poll, then waits up to poll_interval.
+        await repository.add_user_if_absent("alice", "hash")
+        worker.notify()
+        await asyncio.sleep(0.01)
+        await worker.stop()
+
+    asyncio.run(scenario())
+
+    create_user.assert_awaited_once_with("alice")
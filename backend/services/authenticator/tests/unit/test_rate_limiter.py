@@ -0,0 +1,79 @@
+import asyncio
+import ipaddress
+import pytest
+
+from rate_limiter import InMemoryRateLimiter, RateLimit, RateLimitExceededError, bucket_key, client_ip
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+def limiter(clock, max_keys=1000, shards=4):
+    return InMemoryRateLimiter(
+        {"username": RateLimit(burst=2, per_minute=60), "ip": RateLimit(burst=4, per_minute=60)},
+        max_keys=max_keys, shards=shards, clock=clock
+    )
+
+
+def test_burst_then_rejection_with_retry_after(clock):
+    rate_limiter = limiter(clock)
+    rate_limiter.check(username="alice")
+    rate_limiter.check(username="alice")
+
+    with pytest.raises(RateLimitExceededError) as e:
+        rate_limiter.check(username="alice")
+    assert e.value.retry_after == pytest.approx(1.0)
+    rate_limiter.check(username="bob")      # Other buckets are not affected
+
+def test_tokens_come_back_over_time(clock):
+    rate_limiter = limiter(clock)
+    for _ in range(2):
+        rate_limiter.check(username="alice")
+
+    clock.now = 1.0
+    rate_limiter.check(username="alice")
+    with pytest.raises(RateLimitExceededError):
+        rate_limiter.check(username="alice")
+
+def test_every_key_of_a_request_is_limited(clock):
+    rate_limiter = limiter(clock)
+    for i in range(4):
+        asyncio.run(rate_limiter.acquire(username=f"user{i}", ip="10.0.0.1"))
+
+    with pytest.raises(RateLimitExceededError):
+        asyncio.run(rate_limiter.acquire(username="user5", ip="10.0.0.1"))
+    asyncio.run(rate_limiter.acquire(username="user5", ip=None))
+    assert rate_limiter.stats()["rejected"] == 1
+
+def test_number_of_buckets_is_bounded(clock):
+    rate_limiter = limiter(clock, max_keys=40, shards=4)
+    for i in range(1000):
+        rate_limiter.check(username=f"user{i}")
+
+    stats = rate_limiter.stats()
+    assert stats["keys"] <= 40
+    assert stats["evictions"] == 1000 - stats["keys"]
+
+def test_keys_have_the_same_size_however_long_the_username():
+    # login_rate_limits.key is a VARCHAR(100), and the in-memory buckets are bounded in number only.
+    keys = [bucket_key("username", "a" * length) for length in (1, 100, 100_000)]
+    assert len(set(map(len, keys))) == 1 and len(keys[0]) <= 100
+    assert bucket_key("username", "alice") != bucket_key("ip", "alice")
+
+
+def test_client_ip_header_is_only_trusted_from_the_proxies():
+    proxies = [ipaddress.ip_network("172.16.0.0/12")]
+
+    assert client_ip("172.18.0.5", "203.0.113.7", proxies) == "203.0.113.7"
+    assert client_ip("198.51.100.9", "203.0.113.7", proxies) == "198.51.100.9"     # Spoofed
+    assert client_ip("172.18.0.5", None, proxies) == "172.18.0.5"
+    assert client_ip("testclient", "203.0.113.7", proxies) == "testclient"
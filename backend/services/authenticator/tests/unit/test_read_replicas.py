@@ -0,0 +1,127 @@
+import asyncio
+import pytest
+
+from repository import MockRepository, ReplicaRoutingUserRepository, RepositoryUnavailableError
+
+
+class Replica(MockRepository):
+    """
+    A replica whose lag and availability the tests set. Being a separate MockRepository, it
+    only has the rows the test copies to it: like a replica that hasn't replayed the rest.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.lag = 0.0
+        self.available = True
+        self.gets = 0
+
+    async def replication_lag(self) -> float:
+        if not self.available:
+            raise RepositoryUnavailableError("Replica down")
+        return self.lag
+
+    async def get(self, username):
+        self.gets += 1
+        if not self.available:
+            raise RepositoryUnavailableError("Replica down")
+        return await super().get(username)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+@pytest.fixture
+def primary():
+    return MockRepository()
+
+@pytest.fixture
+def replicas():
+    return [Replica(), Replica()]
+
+@pytest.fixture
+def repository(primary, replicas, clock):
+    return ReplicaRoutingUserRepository(primary, replicas, max_lag=1.0, read_your_writes=5.0, clock=clock)
+
+async def replicate(user, *repositories):
+    for repository in repositories:
+        await repository.add_user(user.username, user.password_hash)
+
+
+def test_lookups_are_spread_over_the_replicas_and_writes_go_to_the_primary(repository, primary, replicas):
+    async def scenario():
+        await primary.add_user("alice", "hash")
+        await replicate(await primary.get("alice"), *replicas)
+
+        for _ in range(4):
+            assert (await repository.get("alice")).password_hash == "hash"
+        await repository.update_hash("alice", "new_hash")
+
+    asyncio.run(scenario())
+
+    assert [replica.gets for replica in replicas] == [2, 2]
+    assert asyncio.run(primary.get("alice")).password_hash == "new_hash"
+    assert asyncio.run(replicas[0].get("alice")).password_hash == "hash"
+
+
+def test_a_user_written_by_this_process_is_read_from_the_primary_for_a_while(repository, primary, replicas, clock):
+    async def scenario():
+        await primary.add_user("alice", "old_hash")
+        await replicate(await primary.get("alice"), *replicas)
+
+        await repository.update_hash("alice", "new_hash")
+        assert (await repository.get("alice")).password_hash == "new_hash"
+
+        clock.now += 6
+        assert (await repository.get("alice")).password_hash == "old_hash"   # The replica's copy again
+
+    asyncio.run(scenario())
+
+
+def test_a_user_missing_from_the_replica_is_looked_up_on_the_primary(repository, primary):
+    # E.g. signed up through another pod a moment ago.
+    asyncio.run(primary.add_user("alice", "hash"))
+
+    assert asyncio.run(repository.get("alice")).username == "alice"
+    assert repository.stats()["confirmed_misses"] == 1
+
+
+def test_lagging_or_failing_replicas_get_no_reads(repository, primary, replicas):
+    async def scenario():
+        await primary.add_user("alice", "hash")
+        await replicate(await primary.get("alice"), *replicas)
+
+        replicas[0].lag = 30.0
+        await repository.check_replicas()
+        for _ in range(2):
+            await repository.get("alice")
+        assert [replica.gets for replica in replicas] == [0, 2]
+
+        # A failing query takes the replica out right away, and is answered by the primary.
+        replicas[1].available = False
+        assert (await repository.get("alice")).username == "alice"
+        await repository.get("alice")
+        assert replicas[1].gets == 3
+
+        # Back once a check finds them caught up.
+        replicas[0].lag = 0.0
+        replicas[1].available = True
+        await repository.check_replicas()
+        await repository.get("alice")
+        await repository.get("alice")
+
+    asyncio.run(scenario())
+
+    stats = repository.stats()
+    assert [replica.gets for replica in replicas] == [1, 4]
+    assert stats["replica_fallbacks"] == 1
+    assert stats["primary_reads"] == 1
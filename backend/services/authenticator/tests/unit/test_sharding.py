@@ -0,0 +1,239 @@
+import asyncio
+import pytest
+
+from refresh_tokens import RefreshTokenManager, new_refresh_token, refresh_token_digest
+from repository import HashRing, MockRepository, ShardedUserRepository
+from reshard import move_users, reshard
+
+# Several in-memory databases stand in for the Postgres shards.
+
+USERNAMES = [f"user{i}" for i in range(200)]
+
+
+def sharded(shard_names: list[str], previous: list[str] | None = None, shards: dict | None = None) -> ShardedUserRepository:
+    shards = shards or {}
+    return ShardedUserRepository({name: shards.get(name) or MockRepository() for name in shard_names}, previous)
+
+async def sign_up_everyone(repository: ShardedUserRepository) -> None:
+    for username in USERNAMES:
+        await repository.add_user_if_absent(username, f"hash of {username}")
+
+
+def test_adding_a_shard_only_moves_keys_to_it():
+    before = HashRing(["a", "b", "c"])
+    after = HashRing(["a", "b", "c", "d"])
+    keys = [f"user{i}" for i in range(10_000)]
+
+    moved = [key for key in keys if before.shard_for(key) != after.shard_for(key)]
+
+    assert all(after.shard_for(key) == "d" for key in moved)
+    assert len(moved) / len(keys) == pytest.approx(1 / 4, abs=0.05)
+
+
+def test_users_are_spread_over_the_shards_and_found_again():
+    repository = sharded(["a", "b", "c"])
+
+    async def scenario():
+        await sign_up_everyone(repository)
+        assert await repository.add_user_if_absent("user1", "other hash") is None
+        await repository.update_hash("user2", "new hash")
+        assert await repository.delete("user3")
+        return [await repository.get(username) for username in USERNAMES]
+
+    users = asyncio.run(scenario())
+
+    assert users[1].password_hash == "hash of user1"
+    assert users[2].password_hash == "new hash"
+    assert users[3] is None
+    for name, shard in repository.shards.items():
+        stored = asyncio.run(shard.get_all())
+        assert stored and all(repository.ring.shard_for(user.username) == name for user in stored)
+
+
+def test_ids_are_unique_and_pages_cover_every_shard_in_order():
+    repository = sharded(["a", "b", "c"])
+    asyncio.run(sign_up_everyone(repository))
+
+    async def all_pages():
+        return [user async for user in repository.iter_users(batch_size=7)]
+
+    users = asyncio.run(all_pages())
+
+    assert sorted(user.username for user in users) == sorted(USERNAMES)
+    assert [user.id for user in users] == sorted({user.id for user in users})
+    assert (asyncio.run(repository.get("user5"))).id in {user.id for user in users}
+
+
+def test_outbox_events_and_refresh_tokens_work_across_shards():
+    repository = sharded(["a", "b", "c"])
+    tokens = RefreshTokenManager(repository, ttl_seconds=60)
+
+    async def scenario():
+        await sign_up_everyone(repository)
+        events = await repository.claim_outbox_events(limit=1000, lease_seconds=30)
+        await repository.complete_outbox_events([event.id for event in events])
+
+        first = await tokens.issue("user7")
+        username, second = await tokens.rotate(first)
+        reused = await tokens.rotate(first)
+        return events, username, second, reused, await repository.outbox_stats()
+
+    events, username, second, reused, outbox = asyncio.run(scenario())
+
+    assert sorted(event.username for event in events) == sorted(USERNAMES)
+    assert outbox["depth"] == 0
+    assert username == "user7"
+    assert reused is None
+    assert asyncio.run(tokens.rotate(second)) is None     # Its family was revoked
+
+
+class UnavailableShard(MockRepository):
+    """
+    A shard whose database is down, counting the rotations tried on it.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.down = False
+        self.rotations = 0
+
+    async def rotate_refresh_token(self, token_hash, new_token_hash, ttl_seconds, username_hash):
+        self.rotations += 1
+        if self.down:
+            raise ConnectionError("shard down")
+        return await super().rotate_refresh_token(token_hash, new_token_hash, ttl_seconds, username_hash)
+
+
+def test_refresh_tokens_are_rotated_on_the_shard_of_their_user_only():
+    shards = {name: UnavailableShard() for name in ("a", "b", "c")}
+    repository = sharded(["a", "b", "c"], shards=shards)
+    tokens = RefreshTokenManager(repository, ttl_seconds=60)
+    username = "user7"
+    owner = repository.ring.shard_for(username)
+
+    async def scenario():
+        await sign_up_everyone(repository)
+        token = await tokens.issue(username)
+        for name, shard in shards.items():
+            shard.down = name != owner
+        return await tokens.rotate(token)
+
+    assert asyncio.run(scenario())[0] == username
+    assert [shard.rotations for shard in shards.values()] == [int(name == owner) for name in shards]
+
+
+def test_refresh_tokens_without_their_username_are_rejected_without_a_query():
+    shards = {name: UnavailableShard() for name in ("a", "b", "c")}
+    repository = sharded(["a", "b", "c"], shards=shards)
+    tokens = RefreshTokenManager(repository, ttl_seconds=60)
+
+    async def scenario():
+        await sign_up_everyone(repository)
+        token = await tokens.issue("user7")
+        return [await tokens.rotate(token.partition(".")[2]), await tokens.rotate("not-hex-at-all.x")]
+
+    assert asyncio.run(scenario()) == [None, None]
+    assert all(shard.rotations == 0 for shard in shards.values())
+
+
+def test_reshard_moves_users_to_a_new_shard_without_losing_them():
+    old_shards = {"a": MockRepository(), "b": MockRepository()}
+    old = sharded(["a", "b"], shards=old_shards)
+    tokens = RefreshTokenManager(old, ttl_seconds=60)
+
+    async def before():
+        await sign_up_everyone(old)
+        return {username: await tokens.issue(username) for username in USERNAMES[:20]}
+
+    refresh_tokens = asyncio.run(before())
+
+    # Restarted with a new shard: users not moved yet are still found on their previous shard.
+    migrating = sharded(["a", "b", "c"], previous=["a", "b"], shards=old_shards)
+    moving_username = next(username for username in USERNAMES if migrating.ring.shard_for(username) == "c")
+    assert asyncio.run(migrating.get(moving_username)) is not None
+    assert asyncio.run(migrating.add_user_if_absent(moving_username, "other hash")) is None
+
+    moves = asyncio.run(reshard(migrating, batch_size=16))
+
+    assert set(moves) <= {("a", "c"), ("b", "c")}
+    assert sum(moves.values()) == len(asyncio.run(migrating.shards["c"].get_all())) > 0
+    assert asyncio.run(reshard(migrating, dry_run=True)) == {}
+
+    done = sharded(["a", "b", "c"], shards=migrating.shards)
+    tokens = RefreshTokenManager(done, ttl_seconds=60)
+    for username in USERNAMES:
+        assert asyncio.run(done.get(username)).password_hash == f"hash of {username}"
+    for username, token in refresh_tokens.items():
+        assert asyncio.run(tokens.rotate(token))[0] == username
+    # The sign-up events that weren't delivered yet moved with their users.
+    events = asyncio.run(done.claim_outbox_events(limit=1000, lease_seconds=30))
+    assert sorted(event.username for event in events) == sorted(USERNAMES)
+
+
+class ChangingSource(MockRepository):
+    """
+    A shard on which the service changes the hash of a user while it is being moved.
+    """
+
+    def __init__(self, username: str):
+        super().__init__()
+        self.username = username
+        self.exports = 0
+
+    async def export_users(self, usernames):
+        exports = await super().export_users(usernames)
+        self.exports += 1
+        if self.exports == 1:
+            await self.update_hash(self.username, "updated hash")
+        return exports
+
+
+def test_a_user_updated_during_its_move_is_copied_again():
+    source, target = ChangingSource("alice"), MockRepository()
+    asyncio.run(source.add_user("alice", "old hash"))
+
+    moved = asyncio.run(move_users(source, target, ["alice"]))
+
+    assert moved == 1
+    assert asyncio.run(source.get("alice")) is None
+    assert asyncio.run(target.get("alice")).password_hash == "updated hash"
+
+
+class RotatingSource(MockRepository):
+    """
+    A shard on which a refresh token of the user is rotated while the user is being moved.
+    """
+
+    def __init__(self, token: str):
+        super().__init__()
+        self.token = token
+        self.new_token = new_refresh_token(HashRing.position("alice"))
+        self.exports = 0
+
+    async def export_users(self, usernames):
+        exports = await super().export_users(usernames)
+        self.exports += 1
+        if self.exports == 1:
+            await self.rotate_refresh_token(
+                refresh_token_digest(self.token), refresh_token_digest(self.new_token), 60, HashRing.position("alice")
+            )
+        return exports
+
+
+def test_a_refresh_token_rotated_during_its_move_is_copied_again():
+    source, target = RotatingSource(new_refresh_token(HashRing.position("alice"))), MockRepository()
+
+    async def scenario():
+        await source.add_user("alice", "hash")
+        await source.add_refresh_token("alice", refresh_token_digest(source.token), 60)
+        moved = await move_users(source, target, ["alice"])
+        spent = await target.rotate_refresh_token(
+            refresh_token_digest(source.token), b"next", 60, HashRing.position("alice")
+        )
+        return moved, spent
+
+    moved, spent = asyncio.run(scenario())
+
+    assert moved == 1
+    assert asyncio.run(source.get("alice")) is None
+    assert spent.reused      # Still spent on the new shard: its family was revoked
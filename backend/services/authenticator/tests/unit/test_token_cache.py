@@ -0,0 +1,62 @@
+import pytest
+from unittest.mock import patch
+from datetime import datetime, timedelta, timezone
+import jwt
+
+from jwt_utils import JWTUtil, VerifiedTokenCache
+
+SECRET = "mock-secret-key"
+OTHER_SECRET = "another-secret-key"
+
+@pytest.fixture
+def jwt_util():
+    return JWTUtil(SECRET, "HS256")
+
+@pytest.fixture
+def cache():
+    return VerifiedTokenCache(max_size=2, ttl=60)
+
+
+def test_second_verification_is_a_cache_hit(jwt_util, cache):
+    token = jwt_util.create_token("alice")
+
+    assert JWTUtil.verify_token(token, SECRET, "HS256", cache=cache)["username"] == "alice"
+    with patch("jwt_utils.jwt.decode") as decode:
+        assert JWTUtil.verify_token(token, SECRET, "HS256", cache=cache)["username"] == "alice"
+        decode.assert_not_called()
+
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_invalid_tokens_are_not_cached(cache):
+    assert JWTUtil.verify_token("not.a.jwt", SECRET, "HS256", cache=cache) is None
+    assert cache.stats()["size"] == 0
+
+
+def test_entry_does_not_outlive_token_expiration(cache):
+    payload = {"username": "alice", "exp": datetime.now(timezone.utc) + timedelta(seconds=30)}
+    token = jwt.encode(payload, SECRET, algorithm="HS256")
+    JWTUtil.verify_token(token, SECRET, "HS256", cache=cache)
+
+    with patch("jwt_utils.time.time", return_value=payload["exp"].timestamp() + 1):
+        assert cache.get(token, SECRET) is None
+    assert cache.stats()["expirations"] == 1
+
+
+def test_key_change_clears_the_cache(jwt_util, cache):
+    token = jwt_util.create_token("alice")
+    JWTUtil.verify_token(token, SECRET, "HS256", cache=cache)
+
+    assert JWTUtil.verify_token(token, OTHER_SECRET, "HS256", cache=cache) is None
+    assert cache.stats()["size"] == 0
+
+
+def test_least_recently_used_entry_is_evicted(jwt_util, cache):
+    tokens = [jwt_util.create_token(username) for username in ("alice", "bob", "carol")]
+    for token in tokens:
+        JWTUtil.verify_token(token, SECRET, "HS256", cache=cache)
+
+    assert cache.stats()["evictions"] == 1
+    assert cache.get(tokens[0], SECRET) is None
+    assert cache.get(tokens[2], SECRET) is not None
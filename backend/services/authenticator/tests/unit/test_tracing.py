@@ -0,0 +1,133 @@
+import asyncio
+import pytest
+from fastapi.testclient import TestClient
+from opentelemetry import trace
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+
+from auth_api import app
+from dependencies import get_user_repository
+from grpc_client import GrpcChannelManager, MicroBatcher
+from provisioning_worker import ProvisioningWorker
+from repository import MockRepository
+from tracing import tracer
+from tests.unit.test_auth_api import override_key_pair  # noqa: F401 (autouse fixture)
+from tests.unit.test_grpc_client import FakeUserManagementService, start_server, server_port
+
+# The global tracer provider can only be set once per process.
+exporter = InMemorySpanExporter()
+provider = TracerProvider()
+provider.add_span_processor(SimpleSpanProcessor(exporter))
+trace.set_tracer_provider(provider)
+
+
+class RecordingUserManagementService(FakeUserManagementService):
+    """
+    Also keeps the metadata of each call.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.metadata = []
+
+    async def create_user(self, stream):
+        self.metadata.append(dict(stream.metadata))
+        await super().create_user(stream)
+
+    async def create_users(self, stream):
+        self.metadata.append(dict(stream.metadata))
+        await super().create_users(stream)
+
+
+@pytest.fixture(autouse=True)
+def clear_spans():
+    exporter.clear()
+    yield
+    app.dependency_overrides.clear()
+
+def spans_by_name() -> dict:
+    return {span.name: span for span in exporter.get_finished_spans()}
+
+
+def test_login_trace_contains_the_argon2_span():
+    repository = MockRepository()
+    app.dependency_overrides[get_user_repository] = lambda: repository
+    client = TestClient(app)
+    client.post("/signup", json={"username": "alice", "password": "secret"})
+    exporter.clear()
+
+    response = client.post("/login", json={"username": "alice", "password": "secret"}, headers={
+        "traceparent": "00-0af7651916cd43dd8448eb211c80319c-b7ad6b7169203331-01"
+    })
+
+    assert response.status_code == 200
+    spans = spans_by_name()
+    server_span = spans["POST /login"]
+    assert server_span.kind == trace.SpanKind.SERVER
+    assert server_span.attributes["http.response.status_code"] == 200
+    # Continues the trace of the caller.
+    assert format(server_span.context.trace_id, "032x") == "0af7651916cd43dd8448eb211c80319c"
+    assert spans["argon2.verify"].context.trace_id == server_span.context.trace_id
+    assert spans["argon2.verify"].attributes["auth.password_matches"] is True
+
+
+def test_grpc_calls_send_the_trace_context():
+    async def scenario():
+        service = RecordingUserManagementService()
+        server = await start_server(service)
+        manager = GrpcChannelManager("127.0.0.1", server_port(server))
+        await manager.open()
+
+        with tracer.start_as_current_span("parent"):
+            await manager.call("create_user", id="alice")
+
+        manager.close()
+        server.close()
+        await server.wait_closed()
+        return service
+
+    service = asyncio.run(scenario())
+
+    spans = spans_by_name()
+    grpc_span = spans["grpc UserManagementService/create_user"]
+    assert grpc_span.parent.span_id == spans["parent"].context.span_id
+    trace_id = format(grpc_span.context.trace_id, "032x")
+    span_id = format(grpc_span.context.span_id, "016x")
+    assert service.metadata[0]["traceparent"].startswith(f"00-{trace_id}-{span_id}-")
+
+
+def test_provisioning_continues_the_trace_of_the_signup_and_links_the_batch():
+    async def scenario():
+        service = RecordingUserManagementService()
+        server = await start_server(service)
+        manager = GrpcChannelManager("127.0.0.1", server_port(server))
+        await manager.open()
+        batcher = MicroBatcher(manager, "create_users", max_delay=0.01)
+        repository = MockRepository()
+        worker = ProvisioningWorker(repository, batcher.submit, None)
+
+        for username in ("alice", "bob"):
+            with tracer.start_as_current_span(f"signup {username}"):
+                await repository.add_user(username, "hash")
+        await worker.run_once()
+
+        manager.close()
+        server.close()
+        await server.wait_closed()
+
+    asyncio.run(scenario())
+
+    spans = spans_by_name()
+    for username in ("alice", "bob"):
+        signup = spans[f"signup {username}"]
+        provisioning = [
+            span for span in exporter.get_finished_spans()
+            if span.name == "provision create" and span.context.trace_id == signup.context.trace_id
+        ]
+        assert len(provisioning) == 1
+        assert provisioning[0].parent.span_id == signup.context.span_id
+
+    batch_span = spans["grpc UserManagementService/create_users"]
+    linked = {link.context.span_id for link in batch_span.links}
+    assert linked == {span.context.span_id for span in exporter.get_finished_spans() if span.name == "provision create"}
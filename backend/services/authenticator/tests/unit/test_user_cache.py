@@ -0,0 +1,226 @@
+import asyncio
+import psycopg
+import pytest
+from types import SimpleNamespace
+
+from repository import CachedUserRepository, MockRepository, PostgresUserChangeListener, password_hash_digest
+
+
+class CountingRepository(MockRepository):
+    """
+    Counts the lookups that reach the database. A test can hold them with `pause`.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.gets = 0
+        self.pause: asyncio.Event | None = None
+
+    async def get(self, username):
+        self.gets += 1
+        user = await super().get(username)
+        if self.pause is not None:
+            await self.pause.wait()
+        return user
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+@pytest.fixture
+def database():
+    repository = CountingRepository()
+    asyncio.run(repository.add_user("alice", "hash"))
+    return repository
+
+@pytest.fixture
+def cache(database, clock):
+    return CachedUserRepository(database, max_size=2, ttl=30.0, clock=clock)
+
+
+def test_repeated_lookups_are_served_from_memory(cache, database):
+    async def scenario():
+        for _ in range(3):
+            assert (await cache.get("alice")).password_hash == "hash"
+        assert await cache.get("nobody") is None
+        assert await cache.get("nobody") is None
+
+    asyncio.run(scenario())
+
+    stats = cache.stats()["user_cache"]
+    assert database.gets == 3       # alice once, the unknown username every time
+    assert stats["hits"] == 2
+    assert stats["hit_ratio"] == pytest.approx(2 / 5)
+
+
+def test_writes_update_or_drop_the_entry(cache, database):
+    async def scenario():
+        (await cache.get("alice")).password_hash = "changed by the caller"    # Callers get copies
+        assert (await cache.get("alice")).password_hash == "hash"
+
+        await cache.update_hash("alice", "rehashed")
+        assert (await cache.get("alice")).password_hash == "rehashed"
+        assert database.gets == 1
+
+        assert await cache.delete_if_hash_matches("alice", "rehashed")
+        assert await cache.get("alice") is None
+
+    asyncio.run(scenario())
+
+    assert cache.stats()["user_cache"]["size"] == 0
+
+
+def test_notifications_drop_the_entries_changed_elsewhere(cache, database):
+    async def scenario():
+        await cache.add_user("bob", "hash")
+        await cache.get("alice")
+        await cache.get("bob")
+
+        cache.invalidate("alice", password_hash_digest("hash"))       # The change it already has
+        cache.invalidate("bob", password_hash_digest("new hash"))     # Changed by another process
+        await cache.get("alice")
+        await cache.get("bob")
+
+        cache.invalidate("alice")                                     # Deleted by another process
+        await cache.get("alice")
+
+    asyncio.run(scenario())
+
+    assert database.gets == 4
+    assert cache.stats()["user_cache"]["invalidations"] == 2
+
+
+def test_a_lookup_overlapping_an_invalidation_is_not_cached(cache, database):
+    async def scenario():
+        database.pause = asyncio.Event()
+        lookup = asyncio.create_task(cache.get("alice"))
+        await asyncio.sleep(0)
+        cache.invalidate("alice")           # The row read by the lookup may be the old one
+        database.pause.set()
+        await lookup
+        await cache.get("alice")
+
+    asyncio.run(scenario())
+
+    assert database.gets == 2
+
+
+def test_size_ttl_and_memory_are_bounded(cache, database, clock):
+    async def scenario():
+        for username in ("bob", "carol"):
+            await database.add_user(username, "$argon2id$v=19$m=65536,t=3,p=4$" + "x" * 66)
+        for username in ("alice", "bob", "carol"):
+            await cache.get(username)
+        stats = cache.stats()["user_cache"]
+        assert stats["size"] == 2 and stats["evictions"] == 1
+        assert 0 < stats["memory_bytes"] <= stats["memory_bound_bytes"]
+
+        clock.now += 31
+        await cache.get("carol")
+
+    asyncio.run(scenario())
+
+    stats = cache.stats()["user_cache"]
+    assert stats["expirations"] == 1
+    assert database.gets == 4
+
+
+def test_users_changed_recently_are_not_cached_while_replicas_may_lag(database, clock):
+    cache = CachedUserRepository(database, ttl=30.0, stale_reads=1.0, clock=clock)
+
+    async def scenario():
+        cache.invalidate("alice")
+        await cache.get("alice")
+        await cache.get("alice")
+        clock.now += 2
+        await cache.get("alice")
+        await cache.get("alice")
+
+    asyncio.run(scenario())
+
+    assert database.gets == 3
+
+
+class FakeListenConnection:
+    """
+    Stands in for the listener's psycopg connection: delivers `payloads`, then waits.
+    """
+
+    def __init__(self, payloads: list[str], trigger: bool = True):
+        self.payloads = payloads
+        self.trigger = trigger
+        self.reachable = asyncio.Event()
+        self.info = SimpleNamespace(dbname="postgres")
+
+    async def connect(self, **conn_details):
+        await self.reachable.wait()
+        return self
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    async def execute(self, query):
+        return self
+
+    async def fetchone(self):
+        return (1,) if self.trigger else None
+
+    async def notifies(self):
+        for payload in self.payloads:
+            yield SimpleNamespace(payload=payload)
+        await asyncio.Event().wait()
+
+
+def test_listener_clears_on_listen_and_survives_malformed_notifications(database, monkeypatch):
+    conn = FakeListenConnection(["not json", '{"no_username": 1}', '{"username": "bob"}'])
+    monkeypatch.setattr(psycopg.AsyncConnection, "connect", conn.connect)
+    cache = CachedUserRepository(database, ttl=30.0, listener=PostgresUserChangeListener([{}]))
+
+    async def scenario():
+        await cache.open()
+        await cache.get("alice")        # Cached before LISTEN was set up: may miss a change
+        conn.reachable.set()
+        for _ in range(10):
+            await asyncio.sleep(0)
+        stats = cache.stats()["user_cache"]
+        await cache.close()
+        return stats
+
+    stats = asyncio.run(scenario())
+
+    assert stats["size"] == 0
+    assert stats["listener"] == {"notifications": 3, "malformed": 2, "reconnections": 0}
+
+
+def test_cache_stays_disabled_without_the_notify_trigger(database, monkeypatch):
+    conn = FakeListenConnection([], trigger=False)
+    conn.reachable.set()
+    monkeypatch.setattr(psycopg.AsyncConnection, "connect", conn.connect)
+    cache = CachedUserRepository(database, ttl=30.0, listener=PostgresUserChangeListener([{}]))
+
+    async def scenario():
+        await cache.open()
+        for _ in range(10):
+            await asyncio.sleep(0)
+        for _ in range(3):
+            assert (await cache.get("alice")).password_hash == "hash"
+        stats = cache.stats()["user_cache"]
+        await cache.close()
+        return stats
+
+    stats = asyncio.run(scenario())
+
+    assert database.gets == 3
+    assert not stats["enabled"] and stats["size"] == 0
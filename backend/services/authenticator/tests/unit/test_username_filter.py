@@ -0,0 +1,68 @@
+import asyncio
+import pytest
+from unittest.mock import patch
+
+from repository import CountingBloomFilter, BloomFilteredUserRepository, MockRepository
+
+
+def test_added_items_are_always_found():
+    bloom_filter = CountingBloomFilter(capacity=1000)
+    usernames = [f"user{i}" for i in range(1000)]
+    for username in usernames:
+        bloom_filter.add(username)
+
+    assert all(username in bloom_filter for username in usernames)
+
+
+def test_false_positive_rate_is_close_to_target():
+    bloom_filter = CountingBloomFilter(capacity=10_000, false_positive_rate=0.01)
+    for i in range(10_000):
+        bloom_filter.add(f"user{i}")
+
+    false_positives = sum(f"unknown{i}" in bloom_filter for i in range(10_000))
+
+    assert false_positives / 10_000 < 0.02
+    assert bloom_filter.estimated_false_positive_rate() == pytest.approx(0.01, rel=0.2)
+
+
+def test_removed_item_is_no_longer_found():
+    bloom_filter = CountingBloomFilter(capacity=100)
+    bloom_filter.add("alice")
+    bloom_filter.add("bob")
+    bloom_filter.remove("alice")
+
+    assert "alice" not in bloom_filter
+    assert "bob" in bloom_filter
+
+
+@pytest.fixture
+def inner_repository():
+    return MockRepository()
+
+@pytest.fixture
+def repository(inner_repository):
+    async def hydrated():
+        await inner_repository.add_user("alice", "hash")
+        repository = BloomFilteredUserRepository(inner_repository, capacity=100)
+        await repository.open()
+        return repository
+    return asyncio.run(hydrated())
+
+
+def test_unknown_username_does_not_reach_the_database(repository):
+    with patch.object(MockRepository, "get") as get:
+        assert asyncio.run(repository.get("bob")) is None
+        get.assert_not_called()
+    assert asyncio.run(repository.get("alice")) is not None
+    assert repository.stats()["username_filter"]["filtered_lookups"] == 1
+
+
+def test_filter_follows_writes(repository):
+    async def scenario():
+        await repository.add_user_if_absent("bob", "hash")
+        found_after_signup = await repository.check_if_username_already_exists("bob")
+        await repository.delete_if_hash_matches("bob", "hash")
+        found_after_delete = await repository.check_if_username_already_exists("bob")
+        return found_after_signup, found_after_delete
+
+    assert asyncio.run(scenario()) == (True, False)
@@ -0,0 +1,85 @@
+"""
+Distributed tracing (OpenTelemetry).
+
+Spans: one per PostgresqlUserRepository query, one per Argon2 step of AuthManager and one per
+gRPC call to workout-core, under the HTTP request spans that FastAPI (0.143 and later, see
+requirements.txt) creates itself once a tracer provider is installed. The trace context of a
+gRPC call is sent in its metadata (W3C traceparent), so workout-core can continue the trace. Outbox events keep the traceparent of
+the request that wrote them, so their delivery by the provisioning worker joins that trace.
+
+Tracing is off unless TRACING_EXPORTER is set (see dependencies.py):
+    file     one JSON span per line in TRACING_FILE
+    otlp     OTLP over HTTP to OTEL_EXPORTER_OTLP_ENDPOINT (e.g. the "tracing" profile of the
+             docker-compose.yml: a local Jaeger)
+    console  printed on stdout
+When off, the tracer is OpenTelemetry's no-op tracer and the SDK is not imported.
+"""
+import importlib.util
+
+from opentelemetry import propagate, trace
+
+tracer = trace.get_tracer("authenticator")
+
+_provider = None
+
+
+def setup_tracing(exporter: str | None, service_name: str = "authenticator", file_path: str = "traces.jsonl") -> None:
+    """
+    Install the span exporter. Called once on startup; does nothing if `exporter` is empty.
+    """
+    global _provider
+    if not exporter or _provider is not None:
+        return
+
+    from opentelemetry.sdk.resources import Resource
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
+
+    if exporter == "otlp":
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        span_exporter = OTLPSpanExporter()    # Endpoint from OTEL_EXPORTER_OTLP_ENDPOINT
+    elif exporter == "file":
+        span_exporter = ConsoleSpanExporter(
+            out=open(file_path, "a", encoding="utf-8"),
+            formatter=lambda span: span.to_json(indent=None) + "\n"
+        )
+    elif exporter == "console":
+        span_exporter = ConsoleSpanExporter()
+    else:
+        raise ValueError(f"Unknown TRACING_EXPORTER: {exporter}. Use file, otlp or console")
+
+    if importlib.util.find_spec("fastapi.telemetry") is None:
+        print("WARNING: This FastAPI has no built-in telemetry (fastapi>=0.143): the HTTP request spans are missing")
+
+    _provider = TracerProvider(resource=Resource.create({"service.name": service_name}))
+    # Spans are exported from a background thread, in batches: no I/O on the request path.
+    _provider.add_span_processor(BatchSpanProcessor(span_exporter))
+    trace.set_tracer_provider(_provider)
+
+def shutdown_tracing() -> None:
+    """
+    Export the spans still buffered.
+    """
+    if _provider is not None:
+        _provider.shutdown()
+
+
+def current_traceparent() -> str | None:
+    """
+    The W3C traceparent of the current span, to continue the trace later (e.g. in the
+    provisioning worker). None when tracing is off.
+    """
+    carrier = {}
+    propagate.inject(carrier)
+    return carrier.get("traceparent")
+
+def context_from_traceparent(traceparent: str | None):
+    return propagate.extract({"traceparent": traceparent}) if traceparent else None
+
+
+async def inject_into_grpc_metadata(event) -> None:
+    """
+    grpclib SendRequest listener: adds the current trace context to the call's metadata.
+    """
+    propagate.inject(event.metadata)
+
@@ -8,11 +8,18 @@ import {
     CreateUserRequest,
     CreateUserResponse,
     DeleteUserRequest,
-    DeleteUserResponse
+    DeleteUserResponse,
+    CreateUsersRequest,
+    CreateUsersResponse,
+    DeleteUsersRequest,
+    DeleteUsersResponse,
+    UserResult
 } from '../proto/usermanagement/v1/user_management.js';
 
 import { createUser as createUserInDatabase ,
-         deleteUser as deleteUserFromDatabase} from '../logic/workout-logic.js';
+         deleteUser as deleteUserFromDatabase,
+         createUsers as createUsersInDatabase,
+         deleteUsers as deleteUsersFromDatabase} from '../logic/workout-logic.js';
 import { HttpError } from '../utils/http-error.js';
 
 export const createUser = async (
@@ -65,4 +72,64 @@ export const deleteUser = async (
             null
         )
     }
+};
+
+
+// Batch variants: the per-user outcome is in the results, the call itself only fails
+// if nothing could be done (e.g. the database is down).
+export const createUsers = async (
+    call: ServerUnaryCall<CreateUsersRequest, CreateUsersResponse>,
+    callback: sendUnaryData<CreateUsersResponse>
+) => {
+    try {
+        const userIds: string[] = call.request.ids
+        const errors = await createUsersInDatabase(userIds)
+
+        const results: UserResult[] = userIds.map((id, i) => {
+            const error = errors[i]
+            if (!error) {
+                return { id, code: status.OK, message: "" }
+            }
+            if (error instanceof HttpError && error.statusCode === 409) {
+                return { id, code: status.ALREADY_EXISTS, message: error.message }
+            }
+            return { id, code: status.INTERNAL, message: "Could not create user" }
+        })
+
+        return callback(null, { results });
+    } catch (e: any) {
+        console.error("❌ CRITICAL gRPC ERROR:", e);
+        return callback(
+            {
+                code: status.INTERNAL,
+                details: "Could not create users",
+                message: e.message
+            },
+            null
+        )
+    }
+};
+
+
+export const deleteUsers = async (
+    call: ServerUnaryCall<DeleteUsersRequest, DeleteUsersResponse>,
+    callback: sendUnaryData<DeleteUsersResponse>
+) => {
+    try {
+        const userIds: string[] = call.request.ids
+        await deleteUsersFromDatabase(userIds)
+
+        const results: UserResult[] = userIds.map(id => ({ id, code: status.OK, message: "" }))
+
+        return callback(null, { results });
+    } catch (e: any) {
+        return callback(
+            {
+                code: status.INTERNAL,
+                details: "Could not delete users",
+                message: e.message
+            },
+            null
+        )
+    }
 };
\ No newline at end of file
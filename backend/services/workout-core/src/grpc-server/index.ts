@@ -2,7 +2,7 @@ import {Server, ServerCredentials} from '@grpc/grpc-js';
 
 import { UserManagementServiceService } from '../proto/usermanagement/v1/user_management.js';
 
-import { createUser, deleteUser } from './handler.js';
+import { createUser, deleteUser, createUsers, deleteUsers } from './handler.js';
 import { serve } from 'swagger-ui-express';
 
 // ToDo: -Secure Connection
@@ -12,7 +12,7 @@ let server: Server
 export const startGrpc = () => {
    
     server = new Server();
-    server.addService(UserManagementServiceService, {createUser, deleteUser});
+    server.addService(UserManagementServiceService, {createUser, deleteUser, createUsers, deleteUsers});
     
     server.bindAsync('0.0.0.0:4000', ServerCredentials.createInsecure(), () => {
         console.log('gRPC server is running on 0.0.0.0:4000');
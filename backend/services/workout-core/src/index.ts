@@ -35,7 +35,9 @@ const start = async () => {
     }
  
     const keyString: string = await readFile(PUBLIC_KEY_PATH, 'utf-8');
-    const publicKey = await importSPKI(keyString, 'RS256');
+    // Must match the authenticator's JWT_ALGORITHM (RS256, ES256 or EdDSA).
+    const jwtAlgorithm = env.JWT_ALGORITHM ?? 'RS256';
+    const publicKey = await importSPKI(keyString, jwtAlgorithm);
 
     app.use('/user/docs', swaggerUi.serve, swaggerUi.setup(swaggerDocument));
     app.use(express.json()); // Middleware to parse JSON bodies
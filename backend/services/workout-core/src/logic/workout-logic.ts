@@ -120,4 +120,34 @@ export const deleteUser = async (user_id: string) : Promise<boolean> => {
     const result = await UserWorkoutsModel.deleteOne({ user_id })
 
     return result.deletedCount === 1
-}
\ No newline at end of file
+}
+
+// Used by gRPC (batch). One insert for all users; ordered: false keeps inserting after a
+// duplicate. Returns one entry per id, in order: null if created, otherwise the error.
+export const createUsers = async (user_ids: string[]) : Promise<(Error | null)[]> => {
+    const results: (Error | null)[] = user_ids.map(() => null)
+    try {
+        await UserWorkoutsModel.insertMany(
+            user_ids.map(user_id => ({ user_id, workouts: [] })),
+            { ordered: false }
+        )
+    } catch (error: any) {
+        if (!error.writeErrors) {
+            throw error
+        }
+        for (const writeError of [].concat(error.writeErrors)) {
+            const { index, code, errmsg } = writeError as any
+            results[index] = code === 11000
+                ? new HttpError(`User ${user_ids[index]} already exists`, 409)
+                : new Error(errmsg)
+        }
+    }
+    return results
+}
+
+// Used by gRPC (batch). Deleting a user that doesn't exist is not an error.
+export const deleteUsers = async (user_ids: string[]) : Promise<number> => {
+    const result = await UserWorkoutsModel.deleteMany({ user_id: { $in: user_ids } })
+
+    return result.deletedCount
+}
@@ -35,6 +35,31 @@ export interface DeleteUserRequest {
 export interface DeleteUserResponse {
 }
 
+/** Outcome for one user of a batch. code is a gRPC status code (0 = OK). */
+export interface UserResult {
+  id: string;
+  code: number;
+  message: string;
+}
+
+export interface CreateUsersRequest {
+  ids: string[];
+}
+
+export interface CreateUsersResponse {
+  /** Same order as the request ids. */
+  results: UserResult[];
+}
+
+export interface DeleteUsersRequest {
+  ids: string[];
+}
+
+export interface DeleteUsersResponse {
+  /** Same order as the request ids. */
+  results: UserResult[];
+}
+
 function createBaseCreateUserRequest(): CreateUserRequest {
   return { id: "" };
 }
@@ -237,6 +262,334 @@ export const DeleteUserResponse: MessageFns<DeleteUserResponse> = {
   },
 };
 
+function createBaseUserResult(): UserResult {
+  return { id: "", code: 0, message: "" };
+}
+
+export const UserResult: MessageFns<UserResult> = {
+  encode(message: UserResult, writer: BinaryWriter = new BinaryWriter()): BinaryWriter {
+    if (message.id !== "") {
+      writer.uint32(10).string(message.id);
+    }
+    if (message.code !== 0) {
+      writer.uint32(16).int32(message.code);
+    }
+    if (message.message !== "") {
+      writer.uint32(26).string(message.message);
+    }
+    return writer;
+  },
+
+  decode(input: BinaryReader | Uint8Array, length?: number): UserResult {
+    const reader = input instanceof BinaryReader ? input : new BinaryReader(input);
+    const end = length === undefined ? reader.len : reader.pos + length;
+    const message = createBaseUserResult();
+    while (reader.pos < end) {
+      const tag = reader.uint32();
+      switch (tag >>> 3) {
+        case 1: {
+          if (tag !== 10) {
+            break;
+          }
+
+          message.id = reader.string();
+          continue;
+        }
+        case 2: {
+          if (tag !== 16) {
+            break;
+          }
+
+          message.code = reader.int32();
+          continue;
+        }
+        case 3: {
+          if (tag !== 26) {
+            break;
+          }
+
+          message.message = reader.string();
+          continue;
+        }
+      }
+      if ((tag & 7) === 4 || tag === 0) {
+        break;
+      }
+      reader.skip(tag & 7);
+    }
+    return message;
+  },
+
+  fromJSON(object: any): UserResult {
+    return {
+      id: isSet(object.id) ? globalThis.String(object.id) : "",
+      code: isSet(object.code) ? globalThis.Number(object.code) : 0,
+      message: isSet(object.message) ? globalThis.String(object.message) : "",
+    };
+  },
+
+  toJSON(message: UserResult): unknown {
+    const obj: any = {};
+    if (message.id !== "") {
+      obj.id = message.id;
+    }
+    if (message.code !== 0) {
+      obj.code = Math.round(message.code);
+    }
+    if (message.message !== "") {
+      obj.message = message.message;
+    }
+    return obj;
+  },
+
+  create<I extends Exact<DeepPartial<UserResult>, I>>(base?: I): UserResult {
+    return UserResult.fromPartial(base ?? ({} as any));
+  },
+  fromPartial<I extends Exact<DeepPartial<UserResult>, I>>(object: I): UserResult {
+    const message = createBaseUserResult();
+    message.id = object.id ?? "";
+    message.code = object.code ?? 0;
+    message.message = object.message ?? "";
+    return message;
+  },
+};
+
+function createBaseCreateUsersRequest(): CreateUsersRequest {
+  return { ids: [] };
+}
+
+export const CreateUsersRequest: MessageFns<CreateUsersRequest> = {
+  encode(message: CreateUsersRequest, writer: BinaryWriter = new BinaryWriter()): BinaryWriter {
+    for (const v of message.ids) {
+      writer.uint32(10).string(v!);
+    }
+    return writer;
+  },
+
+  decode(input: BinaryReader | Uint8Array, length?: number): CreateUsersRequest {
+    const reader = input instanceof BinaryReader ? input : new BinaryReader(input);
+    const end = length === undefined ? reader.len : reader.pos + length;
+    const message = createBaseCreateUsersRequest();
+    while (reader.pos < end) {
+      const tag = reader.uint32();
+      switch (tag >>> 3) {
+        case 1: {
+          if (tag !== 10) {
+            break;
+          }
+
+          message.ids.push(reader.string());
+          continue;
+        }
+      }
+      if ((tag & 7) === 4 || tag === 0) {
+        break;
+      }
+      reader.skip(tag & 7);
+    }
+    return message;
+  },
+
+  fromJSON(object: any): CreateUsersRequest {
+    return { ids: globalThis.Array.isArray(object?.ids) ? object.ids.map((e: any) => globalThis.String(e)) : [] };
+  },
+
+  toJSON(message: CreateUsersRequest): unknown {
+    const obj: any = {};
+    if (message.ids?.length) {
+      obj.ids = message.ids;
+    }
+    return obj;
+  },
+
+  create<I extends Exact<DeepPartial<CreateUsersRequest>, I>>(base?: I): CreateUsersRequest {
+    return CreateUsersRequest.fromPartial(base ?? ({} as any));
+  },
+  fromPartial<I extends Exact<DeepPartial<CreateUsersRequest>, I>>(object: I): CreateUsersRequest {
+    const message = createBaseCreateUsersRequest();
+    message.ids = object.ids?.map((e) => e) || [];
+    return message;
+  },
+};
+
+function createBaseCreateUsersResponse(): CreateUsersResponse {
+  return { results: [] };
+}
+
+export const CreateUsersResponse: MessageFns<CreateUsersResponse> = {
+  encode(message: CreateUsersResponse, writer: BinaryWriter = new BinaryWriter()): BinaryWriter {
+    for (const v of message.results) {
+      UserResult.encode(v!, writer.uint32(10).fork()).join();
+    }
+    return writer;
+  },
+
+  decode(input: BinaryReader | Uint8Array, length?: number): CreateUsersResponse {
+    const reader = input instanceof BinaryReader ? input : new BinaryReader(input);
+    const end = length === undefined ? reader.len : reader.pos + length;
+    const message = createBaseCreateUsersResponse();
+    while (reader.pos < end) {
+      const tag = reader.uint32();
+      switch (tag >>> 3) {
+        case 1: {
+          if (tag !== 10) {
+            break;
+          }
+
+          message.results.push(UserResult.decode(reader, reader.uint32()));
+          continue;
+        }
+      }
+      if ((tag & 7) === 4 || tag === 0) {
+        break;
+      }
+      reader.skip(tag & 7);
+    }
+    return message;
+  },
+
+  fromJSON(object: any): CreateUsersResponse {
+    return {
+      results: globalThis.Array.isArray(object?.results) ? object.results.map((e: any) => UserResult.fromJSON(e)) : [],
+    };
+  },
+
+  toJSON(message: CreateUsersResponse): unknown {
+    const obj: any = {};
+    if (message.results?.length) {
+      obj.results = message.results.map((e) => UserResult.toJSON(e));
+    }
+    return obj;
+  },
+
+  create<I extends Exact<DeepPartial<CreateUsersResponse>, I>>(base?: I): CreateUsersResponse {
+    return CreateUsersResponse.fromPartial(base ?? ({} as any));
+  },
+  fromPartial<I extends Exact<DeepPartial<CreateUsersResponse>, I>>(object: I): CreateUsersResponse {
+    const message = createBaseCreateUsersResponse();
+    message.results = object.results?.map((e) => UserResult.fromPartial(e)) || [];
+    return message;
+  },
+};
+
+function createBaseDeleteUsersRequest(): DeleteUsersRequest {
+  return { ids: [] };
+}
+
+export const DeleteUsersRequest: MessageFns<DeleteUsersRequest> = {
+  encode(message: DeleteUsersRequest, writer: BinaryWriter = new BinaryWriter()): BinaryWriter {
+    for (const v of message.ids) {
+      writer.uint32(10).string(v!);
+    }
+    return writer;
+  },
+
+  decode(input: BinaryReader | Uint8Array, length?: number): DeleteUsersRequest {
+    const reader = input instanceof BinaryReader ? input : new BinaryReader(input);
+    const end = length === undefined ? reader.len : reader.pos + length;
+    const message = createBaseDeleteUsersRequest();
+    while (reader.pos < end) {
+      const tag = reader.uint32();
+      switch (tag >>> 3) {
+        case 1: {
+          if (tag !== 10) {
+            break;
+          }
+
+          message.ids.push(reader.string());
+          continue;
+        }
+      }
+      if ((tag & 7) === 4 || tag === 0) {
+        break;
+      }
+      reader.skip(tag & 7);
+    }
+    return message;
+  },
+
+  fromJSON(object: any): DeleteUsersRequest {
+    return { ids: globalThis.Array.isArray(object?.ids) ? object.ids.map((e: any) => globalThis.String(e)) : [] };
+  },
+
+  toJSON(message: DeleteUsersRequest): unknown {
+    const obj: any = {};
+    if (message.ids?.length) {
+      obj.ids = message.ids;
+    }
+    return obj;
+  },
+
+  create<I extends Exact<DeepPartial<DeleteUsersRequest>, I>>(base?: I): DeleteUsersRequest {
+    return DeleteUsersRequest.fromPartial(base ?? ({} as any));
+  },
+  fromPartial<I extends Exact<DeepPartial<DeleteUsersRequest>, I>>(object: I): DeleteUsersRequest {
+    const message = createBaseDeleteUsersRequest();
+    message.ids = object.ids?.map((e) => e) || [];
+    return message;
+  },
+};
+
+function createBaseDeleteUsersResponse(): DeleteUsersResponse {
+  return { results: [] };
+}
+
+export const DeleteUsersResponse: MessageFns<DeleteUsersResponse> = {
+  encode(message: DeleteUsersResponse, writer: BinaryWriter = new BinaryWriter()): BinaryWriter {
+    for (const v of message.results) {
+      UserResult.encode(v!, writer.uint32(10).fork()).join();
+    }
+    return writer;
+  },
+
+  decode(input: BinaryReader | Uint8Array, length?: number): DeleteUsersResponse {
+    const reader = input instanceof BinaryReader ? input : new BinaryReader(input);
+    const end = length === undefined ? reader.len : reader.pos + length;
+    const message = createBaseDeleteUsersResponse();
+    while (reader.pos < end) {
+      const tag = reader.uint32();
+      switch (tag >>> 3) {
+        case 1: {
+          if (tag !== 10) {
+            break;
+          }
+
+          message.results.push(UserResult.decode(reader, reader.uint32()));
+          continue;
+        }
+      }
+      if ((tag & 7) === 4 || tag === 0) {
+        break;
+      }
+      reader.skip(tag & 7);
+    }
+    return message;
+  },
+
+  fromJSON(object: any): DeleteUsersResponse {
+    return {
+      results: globalThis.Array.isArray(object?.results) ? object.results.map((e: any) => UserResult.fromJSON(e)) : [],
+    };
+  },
+
+  toJSON(message: DeleteUsersResponse): unknown {
+    const obj: any = {};
+    if (message.results?.length) {
+      obj.results = message.results.map((e) => UserResult.toJSON(e));
+    }
+    return obj;
+  },
+
+  create<I extends Exact<DeepPartial<DeleteUsersResponse>, I>>(base?: I): DeleteUsersResponse {
+    return DeleteUsersResponse.fromPartial(base ?? ({} as any));
+  },
+  fromPartial<I extends Exact<DeepPartial<DeleteUsersResponse>, I>>(object: I): DeleteUsersResponse {
+    const message = createBaseDeleteUsersResponse();
+    message.results = object.results?.map((e) => UserResult.fromPartial(e)) || [];
+    return message;
+  },
+};
+
 export type UserManagementServiceService = typeof UserManagementServiceService;
 export const UserManagementServiceService = {
   createUser: {
@@ -257,11 +610,33 @@ export const UserManagementServiceService = {
     responseSerialize: (value: DeleteUserResponse): Buffer => Buffer.from(DeleteUserResponse.encode(value).finish()),
     responseDeserialize: (value: Buffer): DeleteUserResponse => DeleteUserResponse.decode(value),
   },
+  /** Batch variants: one round trip for many users. */
+  createUsers: {
+    path: "/usermanagement.v1.UserManagementService/CreateUsers",
+    requestStream: false,
+    responseStream: false,
+    requestSerialize: (value: CreateUsersRequest): Buffer => Buffer.from(CreateUsersRequest.encode(value).finish()),
+    requestDeserialize: (value: Buffer): CreateUsersRequest => CreateUsersRequest.decode(value),
+    responseSerialize: (value: CreateUsersResponse): Buffer => Buffer.from(CreateUsersResponse.encode(value).finish()),
+    responseDeserialize: (value: Buffer): CreateUsersResponse => CreateUsersResponse.decode(value),
+  },
+  deleteUsers: {
+    path: "/usermanagement.v1.UserManagementService/DeleteUsers",
+    requestStream: false,
+    responseStream: false,
+    requestSerialize: (value: DeleteUsersRequest): Buffer => Buffer.from(DeleteUsersRequest.encode(value).finish()),
+    requestDeserialize: (value: Buffer): DeleteUsersRequest => DeleteUsersRequest.decode(value),
+    responseSerialize: (value: DeleteUsersResponse): Buffer => Buffer.from(DeleteUsersResponse.encode(value).finish()),
+    responseDeserialize: (value: Buffer): DeleteUsersResponse => DeleteUsersResponse.decode(value),
+  },
 } as const;
 
 export interface UserManagementServiceServer extends UntypedServiceImplementation {
   createUser: handleUnaryCall<CreateUserRequest, CreateUserResponse>;
   deleteUser: handleUnaryCall<DeleteUserRequest, DeleteUserResponse>;
+  /** Batch variants: one round trip for many users. */
+  createUsers: handleUnaryCall<CreateUsersRequest, CreateUsersResponse>;
+  deleteUsers: handleUnaryCall<DeleteUsersRequest, DeleteUsersResponse>;
 }
 
 export interface UserManagementServiceClient extends Client {
@@ -295,6 +670,37 @@ export interface UserManagementServiceClient extends Client {
     options: Partial<CallOptions>,
     callback: (error: ServiceError | null, response: DeleteUserResponse) => void,
   ): ClientUnaryCall;
+  /** Batch variants: one round trip for many users. */
+  createUsers(
+    request: CreateUsersRequest,
+    callback: (error: ServiceError | null, response: CreateUsersResponse) => void,
+  ): ClientUnaryCall;
+  createUsers(
+    request: CreateUsersRequest,
+    metadata: Metadata,
+    callback: (error: ServiceError | null, response: CreateUsersResponse) => void,
+  ): ClientUnaryCall;
+  createUsers(
+    request: CreateUsersRequest,
+    metadata: Metadata,
+    options: Partial<CallOptions>,
+    callback: (error: ServiceError | null, response: CreateUsersResponse) => void,
+  ): ClientUnaryCall;
+  deleteUsers(
+    request: DeleteUsersRequest,
+    callback: (error: ServiceError | null, response: DeleteUsersResponse) => void,
+  ): ClientUnaryCall;
+  deleteUsers(
+    request: DeleteUsersRequest,
+    metadata: Metadata,
+    callback: (error: ServiceError | null, response: DeleteUsersResponse) => void,
+  ): ClientUnaryCall;
+  deleteUsers(
+    request: DeleteUsersRequest,
+    metadata: Metadata,
+    options: Partial<CallOptions>,
+    callback: (error: ServiceError | null, response: DeleteUsersResponse) => void,
+  ): ClientUnaryCall;
 }
 
 export const UserManagementServiceClient = makeGenericClientConstructor(
@@ -1,6 +1,6 @@
 import mongoose, { Types } from 'mongoose';
 import { MongoMemoryServer } from 'mongodb-memory-server';
-import { addWorkout, createUser, deleteUser,
+import { addWorkout, createUser, deleteUser, createUsers, deleteUsers,
         deleteWorkout, updateWorkout, getUserData } from '../src/logic/workout-logic.js';
 import { UserWorkoutsModel } from '../src/data/models/user-workouts-model.js';
 import { Workout } from '../src/data/schemas/workout-schema.js';
@@ -132,6 +132,39 @@ describe('deleteUser', () => {
 });
 
 
+describe('createUsers', () => {
+  test('creates every user in one call', async() => {
+    const results = await createUsers(['user-1', 'user-2', 'user-3'])
+    expect(results).toEqual([null, null, null])
+
+    const count = await UserWorkoutsModel.countDocuments({ user_id: { $in: ['user-1', 'user-2', 'user-3'] } })
+    expect(count).toBe(3)
+  });
+
+  test('reports the users that already exist and still creates the others', async() => {
+    await createUserWithoutWorkoutsInDatabase()
+    const results = await createUsers(['user-1', MOCK_USER_ID, 'user-2'])
+
+    expect(results[0]).toBeNull()
+    expect(results[1]?.message).toEqual(`User ${MOCK_USER_ID} already exists`)
+    expect(results[2]).toBeNull()
+    expect(await UserWorkoutsModel.countDocuments({})).toBe(3)
+  });
+});
+
+
+describe('deleteUsers', () => {
+  test('removes the existing users and ignores the missing ones', async() => {
+    await createUserWithoutWorkoutsInDatabase()
+    const deleted = await deleteUsers([MOCK_USER_ID, 'not-a-user'])
+    expect(deleted).toBe(1)
+
+    const result = await UserWorkoutsModel.findOne({user_id : MOCK_USER_ID})
+    expect(result).toBeNull()
+  });
+});
+
+
 describe('addWorkout', () => {
   test('appends a new workout to an existing user', async () => {
     await createUserWithoutWorkoutsInDatabase();